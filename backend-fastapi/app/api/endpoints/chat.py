@@ -1,117 +1,105 @@
-from fastapi import APIRouter, Depends, HTTPException, status, WebSocket, WebSocketDisconnect
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, HTTPException, status, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+from typing import List, Optional
 from datetime import datetime
 import logging
+import time
 
-from app.db.database import get_db
+from app.db.database import SessionLocal
 from app.schemas import ChatMessage, ChatMessageCreate, ChatMessageResponse
-from app.models import ChatMessage as ChatMessageModel, Room as RoomModel, User as UserModel
-from app.api.endpoints.rooms import manager as room_manager
+from app.models import Room as RoomModel, User as UserModel
+from app.api.endpoints.rooms import chat_service
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+# Cache des vérifications d'existence, pour ne pas interroger la base à chaque message
+# {room_id: (room_code, expiration)} et {user_id: (username, expiration)}
+LOOKUP_TTL = 300
+_room_codes = {}
+_usernames = {}
+
+def _read_room_code(room_id: int):
+    db = SessionLocal()
+    try:
+        room = db.query(RoomModel.room_code).filter(RoomModel.id == room_id).first()
+        return room.room_code if room else None
+    finally:
+        db.close()
+
+async def _room_code(room_id: int):
+    now = time.monotonic()
+    room = _room_codes.get(room_id)
+    if room and room[1] > now:
+        return room[0]
+    room_code = await run_in_threadpool(_read_room_code, room_id)
+    if room_code:
+        _room_codes[room_id] = (room_code, now + LOOKUP_TTL)
+    return room_code
+
+def _read_chat_context(room_id: int, user_id: int):
+    """Retourne (code de la salle, nom de l'utilisateur), None pour ceux qui n'existent pas."""
+    db = SessionLocal()
+    try:
+        room = db.query(RoomModel.room_code).filter(RoomModel.id == room_id).first()
+        user = db.query(UserModel.username).filter(UserModel.id == user_id).first()
+        return (room.room_code if room else None), (user.username if user else None)
+    finally:
+        db.close()
+
+async def _chat_context(room_id: int, user_id: int):
+    now = time.monotonic()
+    room = _room_codes.get(room_id)
+    user = _usernames.get(user_id)
+    if room and room[1] > now and user and user[1] > now:
+        return room[0], user[0]
+    
+    room_code, username = await run_in_threadpool(_read_chat_context, room_id, user_id)
+    if room_code:
+        _room_codes[room_id] = (room_code, now + LOOKUP_TTL)
+    if username:
+        _usernames[user_id] = (username, now + LOOKUP_TTL)
+    return room_code, username
+
 @router.post("/", response_model=ChatMessage, status_code=status.HTTP_201_CREATED)
-def create_message(message: ChatMessageCreate, db: Session = Depends(get_db)):
+async def create_message(message: ChatMessageCreate):
     """
     Créer un nouveau message dans le chat d'une salle.
+    Le message est diffusé immédiatement aux membres de la salle et écrit en base
+    par lots (voir ChatService) ; le même envoi est possible directement par le
+    WebSocket de la salle avec {"type": "chat_message", "message": "..."}.
     """
-    logger.info(f"Tentative de création de message: {message.dict()}")
+    # Vérifier que la salle et l'utilisateur existent
+    room_code, username = await _chat_context(message.room_id, message.user_id)
+    if not room_code:
+        logger.error(f"Salle non trouvée: {message.room_id}")
+        raise HTTPException(status_code=404, detail="Salle non trouvée")
+    if not username:
+        logger.error(f"Utilisateur non trouvé: {message.user_id}")
+        raise HTTPException(status_code=404, detail="Utilisateur non trouvé")
     
     try:
-        # Vérifier que la salle existe
-        room = db.query(RoomModel).filter(RoomModel.id == message.room_id).first()
-        if not room:
-            logger.error(f"Salle non trouvée: {message.room_id}")
-            raise HTTPException(status_code=404, detail="Salle non trouvée")
-        
-        # Vérifier que le message n'est pas trop long
-        if len(message.message) > 200:
-            logger.error(f"Message trop long: {len(message.message)} caractères")
-            raise HTTPException(status_code=400, detail="Le message ne peut pas dépasser 200 caractères")
-        
-        # Vérifier que l'utilisateur existe
-        user_id = message.user_id
-        logger.info(f"Recherche de l'utilisateur avec ID: {user_id}")
-        user = db.query(UserModel).filter(UserModel.id == user_id).first()
-        if not user:
-            logger.error(f"Utilisateur non trouvé: {user_id}")
-            raise HTTPException(status_code=404, detail="Utilisateur non trouvé")
-        
-        logger.info(f"Création du message pour l'utilisateur: {user.username} dans la salle: {room.room_code}")
-        
-        # Créer le message
-        db_message = ChatMessageModel(
-            room_id=message.room_id,
-            user_id=user_id,
-            message=message.message
-        )
-        
-        db.add(db_message)
-        db.commit()
-        db.refresh(db_message)
-        
-        logger.info(f"Message créé avec succès, ID: {db_message.id}")
-        
-        # Notifier les clients via WebSocket
-        room_code = room.room_code
-        websocket_payload = {
-            "type": "chat_message",
-            "message": {
-                "id": db_message.id,
-                "user_id": user_id,
-                "username": user.username,
-                "message": db_message.message,
-                "sent_at": db_message.sent_at.isoformat()
-            }
-        }
-        logger.info(f"Diffusion du message via WebSocket: {websocket_payload}")
-        try:
-            room_manager.broadcast(room_code, websocket_payload)
-            logger.info(f"Message WebSocket envoyé avec succès pour le message ID: {db_message.id}")
-        except Exception as e:
-            logger.error(f"Erreur lors de la diffusion du message WebSocket: {str(e)}")
-        
-        return db_message
-    except Exception as e:
-        logger.exception(f"Erreur lors de la création du message: {str(e)}")
-        raise
+        return await chat_service.post(message.room_id, room_code, message.user_id, username, message.message)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/room/{room_id}", response_model=List[ChatMessageResponse])
-def get_room_messages(room_id: int, limit: int = 50, db: Session = Depends(get_db)):
+async def get_room_messages(
+    room_id: int, limit: int = 50, before_id: Optional[int] = None, before_ts: Optional[datetime] = None
+):
     """
-    Récupérer les messages d'une salle.
+    Récupérer les messages d'une salle, dans l'ordre chronologique.
+    Sans curseur, les derniers messages sont servis depuis la mémoire.
+    Pour remonter l'historique, passer `before_id` et `before_ts` (id et sent_at
+    du plus ancien message déjà reçu) : la page précédente est lue par l'index
+    (room_id, sent_at, id).
     """
+    limit = max(1, min(limit, 200))
+    
     # Vérifier que la salle existe
-    room = db.query(RoomModel).filter(RoomModel.id == room_id).first()
-    if not room:
+    if not await _room_code(room_id):
         raise HTTPException(status_code=404, detail="Salle non trouvée")
     
-    # Récupérer les messages triés par date d'envoi (les plus récents en premier)
-    messages = db.query(
-        ChatMessageModel, UserModel.username
-    ).join(
-        UserModel, ChatMessageModel.user_id == UserModel.id
-    ).filter(
-        ChatMessageModel.room_id == room_id
-    ).order_by(
-        ChatMessageModel.sent_at.desc()
-    ).limit(limit).all()
-    
-    # Convertir en format de réponse
-    result = []
-    for message, username in messages:
-        result.append({
-            "id": message.id,
-            "room_id": message.room_id,
-            "user_id": message.user_id,
-            "username": username,
-            "message": message.message,
-            "sent_at": message.sent_at
-        })
-    
-    # Inverser pour avoir les messages dans l'ordre chronologique
-    result.reverse()
-    
-    return result 
\ No newline at end of file
+    if before_id is None and before_ts is None:
+        return await chat_service.recent(room_id, limit)
+    return await chat_service.history(room_id, limit, before_id, before_ts)
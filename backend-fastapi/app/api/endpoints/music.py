@@ -1,19 +1,39 @@
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks, Query, File, UploadFile, Form
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks, Query, File, UploadFile, Form, Header, Request, Response
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 import os
 import asyncio
 import subprocess
 import json
+import shutil
+import time
+import uuid
 from pathlib import Path
 from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
 import yt_dlp
-import mutagen
 
-from app.db.database import get_db
-from app.schemas import Music, MusicCreate, MusicUpdate, MusicUpload
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+
+from app.db.database import get_db, SessionLocal
+from app.schemas import Music, MusicCreate, MusicUpdate, MusicUpload, UploadSessionCreate, LibraryImportCreate
 from app.models import Music as MusicModel, User as UserModel
+from app.api.endpoints.rooms import manager
+from app.services.audio_metadata import AUDIO_EXTENSIONS, copy_and_hash, read_audio_tags
+from app.services.covers import fetch_cover, update_music_cover
+from app.services.downloads import DownloadJobs, ProgressCallback
+from app.services.source_urls import canonical_source_key
+from app.services.uploads import ResumableUploads, UploadError
+from app.services.hot_tracks import HotTrackCache
+from app.services.serialization import encode_json
+from app.services.library_import import LibraryImports, resolve_import_path
+from app.services.library_search import create_library_index
+from app.services.loudness import measure_music_loudness, playback_gain
+from app.services.streaming import STREAM_CACHE_MAX_AGE, file_etag, is_not_modified
+from app.services.track_analysis import TrackAnalyzer
+from app.services.waveform import WAVEFORM_LEVELS, generate_music_peaks, peaks_path, to_int8
+from app.services.youtube_search import create_search_service
 
 router = APIRouter()
 
@@ -25,6 +45,32 @@ TEMP_STORAGE_PATH = Path("/app/storage/temp")
 AUDIO_STORAGE_PATH.mkdir(parents=True, exist_ok=True)
 TEMP_STORAGE_PATH.mkdir(parents=True, exist_ok=True)
 
+# Recherches YouTube : exécutées hors de la boucle d'événements, avec cache
+search_service = create_search_service()
+
+# Pistes populaires servies depuis la mémoire
+hot_tracks = HotTrackCache()
+
+# Envois de fichiers reprenables
+resumable_uploads = ResumableUploads()
+
+# Imports en masse de collections audio
+library_imports = LibraryImports()
+
+# Index de recherche de la bibliothèque (None : recherche SQL)
+library_index = create_library_index()
+
+# Analyses des musiques ajoutées : sonie, puis forme d'onde
+track_analyzer = TrackAnalyzer((measure_music_loudness, generate_music_peaks))
+
+# Délai (en secondes) pendant lequel la recherche fédérée attend les résultats YouTube
+FEDERATED_SEARCH_DEADLINE = float(os.getenv("FEDERATED_SEARCH_DEADLINE", "3"))
+
+# Cache des chemins de fichiers {music_id: (file_path, gain de lecture, expiration)}
+LOOKUP_TTL = 300
+FILE_PATH_CACHE_SIZE = 10000
+_file_paths = {}
+
 # Fonction pour rechercher des musiques sur YouTube
 async def search_youtube(query: str, max_results: int = 5):
     """
@@ -33,45 +79,10 @@ async def search_youtube(query: str, max_results: int = 5):
     """
     print(f"Recherche YouTube pour la requête: '{query}', max_results: {max_results}")
     
-    ydl_opts = {
-        'quiet': True,
-        'extract_flat': True,
-        'force_generic_extractor': False,
-        'max_downloads': max_results
-    }
-    
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            # Recherche sur YouTube avec le format de recherche ytsearch
-            search_query = f"ytsearch{max_results}:{query}"
-            print(f"Requête yt-dlp: {search_query}")
-            
-            search_results = ydl.extract_info(search_query, download=False)
-            
-            if not search_results:
-                print("Aucun résultat retourné par yt-dlp")
-                return []
-                
-            if 'entries' not in search_results:
-                print("Pas d'entrées dans les résultats de recherche:", search_results.keys())
-                return []
-            
-            # Formater les résultats pour l'API
-            formatted_results = []
-            for entry in search_results['entries']:
-                if entry:
-                    formatted_results.append({
-                        'id': entry.get('id', ''),
-                        'title': entry.get('title', 'Unknown Title'),
-                        'url': f"https://www.youtube.com/watch?v={entry.get('id', '')}",
-                        'duration': entry.get('duration', 0),
-                        'thumbnail': entry.get('thumbnail', ''),
-                        'channel': entry.get('channel', 'Unknown Channel'),
-                        'view_count': entry.get('view_count', 0)
-                    })
-            
-            print(f"Résultats trouvés: {len(formatted_results)}")
-            return formatted_results
+        formatted_results = await search_service.search(query, max_results)
+        print(f"Résultats trouvés: {len(formatted_results)}")
+        return formatted_results
     except Exception as e:
         print(f"Erreur lors de la recherche YouTube: {str(e)}")
         import traceback
@@ -79,10 +90,10 @@ async def search_youtube(query: str, max_results: int = 5):
         return []
 
 # Fonction pour télécharger une musique depuis une URL
-async def download_music_from_url(source_url: str, user_id: int, db: Session):
+def download_music_from_url(source_url: str, user_id: int, db: Session, progress: Optional[ProgressCallback] = None):
     """
     Télécharge une musique depuis une URL (YouTube, etc.) en utilisant yt-dlp.
-    Cette fonction est exécutée en arrière-plan.
+    Cette fonction est bloquante : elle est exécutée en arrière-plan par download_jobs.
     """
     # Vérifier que l'utilisateur existe
     user = db.query(UserModel).filter(UserModel.id == user_id).first()
@@ -104,6 +115,8 @@ async def download_music_from_url(source_url: str, user_id: int, db: Session):
             db.refresh(admin_user)
             user_id = admin_user.id
     
+    source_key = canonical_source_key(source_url)
+    
     # Créer un nom de fichier temporaire unique
     temp_dir = TEMP_STORAGE_PATH
     output_template = str(temp_dir / '%(title)s.%(ext)s')
@@ -120,6 +133,10 @@ async def download_music_from_url(source_url: str, user_id: int, db: Session):
         'quiet': False,
         'no_warnings': False
     }
+    if progress is not None:
+        # Progression du téléchargement puis de la conversion par ffmpeg
+        ydl_opts['progress_hooks'] = [progress]
+        ydl_opts['postprocessor_hooks'] = [progress]
     
     try:
         # Télécharger la vidéo et l'extraire en audio MP3
@@ -142,7 +159,6 @@ async def download_music_from_url(source_url: str, user_id: int, db: Session):
             
             # Déplacer le fichier vers le répertoire de stockage final
             if temp_file_path.exists():
-                import shutil
                 shutil.move(str(temp_file_path), str(final_file_path))
             else:
                 # Chercher le fichier avec un nom similaire (yt-dlp peut modifier légèrement le nom)
@@ -151,59 +167,15 @@ async def download_music_from_url(source_url: str, user_id: int, db: Session):
                         shutil.move(str(file), str(final_file_path))
                         break
             
-            # Extraire la miniature comme couverture si disponible
-            cover_path = None
-            if info.get('thumbnail'):
-                try:
-                    from PIL import Image
-                    import requests
-                    from io import BytesIO
-                    import re
-                    
-                    # Créer l'entrée dans la base de données d'abord pour avoir l'ID
-                    db_music = MusicModel(
-                        title=title,
-                        artist=artist,
-                        album=album,
-                        duration=duration,
-                        file_path=str(final_file_path.relative_to(Path("/app"))),
-                        cover_path=None,  # On le mettra à jour après
-                        source_url=source_url,
-                        added_by=user_id
-                    )
-                    
-                    db.add(db_music)
-                    db.commit()
-                    db.refresh(db_music)
-                    
-                    # Utiliser l'ID comme nom de fichier pour éviter les problèmes de caractères spéciaux
-                    cover_filename = f"cover_{db_music.id}.jpg"
-                    cover_file = AUDIO_STORAGE_PATH / cover_filename
-                    
-                    response = requests.get(info['thumbnail'])
-                    img = Image.open(BytesIO(response.content))
-                    img.save(str(cover_file))
-                    
-                    # Mettre à jour le chemin de la cover dans la base de données
-                    cover_path = f"/storage/audio/{cover_filename}"
-                    db_music.cover_path = cover_path
-                    db.commit()
-                    db.refresh(db_music)
-                    
-                    return db_music
-                    
-                except Exception as e:
-                    print(f"Erreur lors de l'extraction de la couverture: {str(e)}")
-            
-            # Si pas de miniature ou erreur, créer l'entrée sans cover
             db_music = MusicModel(
                 title=title,
                 artist=artist,
                 album=album,
                 duration=duration,
                 file_path=str(final_file_path.relative_to(Path("/app"))),
-                cover_path=cover_path,
+                cover_path=None,
                 source_url=source_url,
+                source_key=source_key,
                 added_by=user_id
             )
             
@@ -211,6 +183,15 @@ async def download_music_from_url(source_url: str, user_id: int, db: Session):
             db.commit()
             db.refresh(db_music)
             
+            # Miniatures et palette de la cover, si la source en propose une
+            if info.get('thumbnail'):
+                try:
+                    update_music_cover(db, db_music, fetch_cover(info['thumbnail']))
+                    db.refresh(db_music)
+                except Exception as e:
+                    print(f"Erreur lors de l'extraction de la couverture: {str(e)}")
+            
+            track_analyzer.schedule(db_music.id)
             return db_music
     except Exception as e:
         print(f"Erreur lors du téléchargement: {str(e)}")
@@ -237,13 +218,126 @@ async def search_music(query: str = Query(..., description="Terme de recherche p
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Erreur lors de la recherche: {str(e)}")
 
-@router.post("/upload", response_model=dict, status_code=status.HTTP_200_OK)
-async def upload_music(
-    music_upload: MusicUpload,
-    db: Session = Depends(get_db)
+def _library_hits(query: str, limit: int) -> List[dict]:
+    db = SessionLocal()
+    try:
+        return [
+            Music.model_validate(music, from_attributes=True).model_dump(mode="json")
+            for music in _search_library(db, query, 0, limit)
+        ]
+    finally:
+        db.close()
+
+def _downloaded_sources(urls: List[str]) -> Dict[str, int]:
+    """{url: music_id} des URLs dont le média est déjà dans la bibliothèque (même clé canonique)."""
+    keys = {url: canonical_source_key(url) for url in urls if url}
+    if not keys:
+        return {}
+    db = SessionLocal()
+    try:
+        rows = db.query(MusicModel.source_key, MusicModel.id).filter(MusicModel.source_key.in_(set(keys.values()))).all()
+    finally:
+        db.close()
+    music_ids = dict(rows)
+    return {url: music_ids[key] for url, key in keys.items() if key in music_ids}
+
+def _retrieve_result(future: asyncio.Future):
+    # Recherche YouTube terminée après la réponse : éviter l'avertissement « never retrieved »
+    if not future.cancelled():
+        future.exception()
+
+@router.get("/search/all")
+async def federated_search(
+    query: str = Query(..., description="Terme de recherche"),
+    limit: int = Query(20, description="Nombre maximal de résultats de la bibliothèque"),
+    max_results: int = Query(5, description="Nombre maximal de résultats YouTube"),
 ):
+    """
+    Recherche à la fois dans la bibliothèque et sur YouTube. La réponse est en NDJSON
+    (un objet JSON par ligne) : {"source": "local", "results": [...]} dès que la
+    bibliothèque a répondu, puis {"source": "youtube", "results": [...]} quand YouTube
+    répond, ou avec "timed_out": true après FEDERATED_SEARCH_DEADLINE secondes.
+    Un résultat YouTube déjà téléchargé porte le music_id de la copie locale ; ceux
+    déjà présents dans les résultats locaux sont omis.
+    """
+    if not query or len(query.strip()) < 2:
+        raise HTTPException(status_code=400, detail="Le terme de recherche doit contenir au moins 2 caractères")
+
+    async def lines():
+        deadline = time.monotonic() + FEDERATED_SEARCH_DEADLINE
+        remote = asyncio.ensure_future(search_service.search(query, max_results))
+        try:
+            local = await run_in_threadpool(_library_hits, query, limit)
+            yield encode_json({"source": "local", "results": local}) + "\n"
+
+            try:
+                results = await asyncio.wait_for(asyncio.shield(remote), max(deadline - time.monotonic(), 0))
+            except asyncio.TimeoutError:
+                yield encode_json({"source": "youtube", "results": [], "timed_out": True}) + "\n"
+                return
+            except Exception as e:
+                yield encode_json({"source": "youtube", "results": [], "error": str(e)}) + "\n"
+                return
+
+            downloaded = await run_in_threadpool(_downloaded_sources, [result.get("url") for result in results])
+            local_ids = {music["id"] for music in local}
+            remote_results = []
+            for result in results:
+                music_id = downloaded.get(result.get("url"))
+                if music_id is None or music_id not in local_ids:
+                    remote_results.append(dict(result, music_id=music_id))
+            yield encode_json({"source": "youtube", "results": remote_results}) + "\n"
+        finally:
+            # Une recherche non attendue se termine quand même et alimente le cache de recherche
+            if not remote.done():
+                remote.add_done_callback(_retrieve_result)
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson", headers={"Cache-Control": "no-cache"})
+
+@router.get("/search/metrics", response_model=dict)
+def search_metrics():
+    """
+    Statistiques du cache de recherche YouTube (taux de succès, durée des extractions).
+    """
+    return search_service.metrics()
+
+def _run_download(source_url: str, user_id: int, progress: ProgressCallback) -> int:
+    """Téléchargement exécuté par download_jobs, avec sa propre session."""
+    # Un autre processus a pu télécharger le même média entre-temps
+    _, existing_music_id = _find_music_by_source(source_url)
+    if existing_music_id is not None:
+        return existing_music_id
+    db = SessionLocal()
+    try:
+        return download_music_from_url(source_url, user_id, db, progress).id
+    finally:
+        db.close()
+
+# Téléchargements en arrière-plan, progression diffusée dans la salle du demandeur
+download_jobs = DownloadJobs(_run_download, manager.broadcast)
+
+def _find_music_by_source(source_url: str) -> Tuple[Optional[str], Optional[int]]:
+    """Clé canonique de l'URL et id de la musique déjà téléchargée depuis le même média."""
+    source_key = canonical_source_key(source_url)
+    db = SessionLocal()
+    try:
+        query = db.query(MusicModel.id)
+        if source_key:
+            query = query.filter(MusicModel.source_key == source_key)
+        else:
+            query = query.filter(MusicModel.source_url == source_url)
+        existing = query.first()
+        return source_key, (existing.id if existing else None)
+    finally:
+        db.close()
+
+@router.post("/upload", response_model=dict, status_code=status.HTTP_200_OK)
+async def upload_music(music_upload: MusicUpload, response: Response):
     """
     Télécharge une musique depuis une URL (YouTube, etc.).
+    Le téléchargement s'exécute en arrière-plan : la réponse (202) contient l'identifiant
+    de la tâche, à suivre via GET /music/jobs/{job_id} ou par les messages
+    "download_progress" de la salle indiquée par room_code.
     """
     # Vérifier si l'URL est valide
     if not music_upload.source_url or not (
@@ -252,87 +346,181 @@ async def upload_music(
     ):
         raise HTTPException(status_code=400, detail="URL invalide")
     
-    # Vérifier si la musique existe déjà avec cette URL source
-    existing_music = db.query(MusicModel).filter(MusicModel.source_url == music_upload.source_url).first()
-    if existing_music:
-        print(f"Musique déjà existante avec l'ID {existing_music.id}")
-        return {"message": "Cette musique existe déjà", "music_id": existing_music.id}
+    # Vérifier si la musique existe déjà (même média, quelle que soit la forme de l'URL)
+    source_key, existing_music_id = await run_in_threadpool(_find_music_by_source, music_upload.source_url)
+    if existing_music_id is not None:
+        print(f"Musique déjà existante avec l'ID {existing_music_id}")
+        return {"message": "Cette musique existe déjà", "music_id": existing_music_id}
     
     # Simuler un ID utilisateur (à remplacer par l'authentification réelle)
     user_id = 1
     
+    # Les demandes simultanées du même média rejoignent le même téléchargement
+    job = download_jobs.submit(music_upload.source_url, user_id, music_upload.room_code, source_key)
+    if job["music_id"] is not None:
+        return {"message": "Cette musique existe déjà", "music_id": job["music_id"]}
+    response.status_code = status.HTTP_202_ACCEPTED
+    return {"message": "Téléchargement en cours", "job_id": job["id"], "status": job["status"]}
+
+@router.get("/jobs/{job_id}", response_model=dict)
+def read_download_job(job_id: str):
+    """
+    État d'un téléchargement : queued, downloading, processing, done (music_id renseigné) ou error.
+    """
+    job = download_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Tâche de téléchargement non trouvée")
+    return job
+
+def _register_audio_file(temp_path: Path, filename: str, content_hash: str, user_id: int) -> Tuple[int, bool]:
+    """
+    Enregistre un fichier audio reçu : s'il est déjà connu (même empreinte), le fichier
+    reçu est supprimé. Retourne (id de la musique, True si elle vient d'être créée).
+    """
+    db = SessionLocal()
     try:
-        # Exécuter le téléchargement de manière synchrone
-        db_music = await download_music_from_url(music_upload.source_url, user_id, db)
-        return {"message": "Téléchargement réussi", "music_id": db_music.id}
-    except Exception as e:
-        print(f"Erreur lors du téléchargement: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Erreur lors du téléchargement: {str(e)}")
+        existing = db.query(MusicModel.id).filter(MusicModel.content_hash == content_hash).first()
+        if existing:
+            temp_path.unlink(missing_ok=True)
+            return existing.id, False
+
+        # Générer un nom de fichier unique
+        dest_path = AUDIO_STORAGE_PATH / f"{uuid.uuid4()}{os.path.splitext(filename)[1].lower()}"
+        shutil.move(str(temp_path), str(dest_path))
+
+        # Extraire les métadonnées
+        tags = read_audio_tags(dest_path, os.path.splitext(filename)[0])
+        db_music = MusicModel(
+            **tags,
+            file_path=str(dest_path.relative_to(Path("/app"))),
+            cover_path=None,
+            source_url=None,
+            content_hash=content_hash,
+            added_by=user_id
+        )
+        db.add(db_music)
+        try:
+            db.commit()
+        except IntegrityError:
+            # Le même fichier vient d'être enregistré par une autre requête
+            db.rollback()
+            dest_path.unlink(missing_ok=True)
+            existing = db.query(MusicModel.id).filter(MusicModel.content_hash == content_hash).first()
+            if existing is None:
+                raise
+            return existing.id, False
+        track_analyzer.schedule(db_music.id)
+        return db_music.id, True
+    finally:
+        db.close()
+
+def _check_audio_filename(filename: Optional[str]):
+    ext = os.path.splitext(filename or "")[1].lower()
+    if ext not in AUDIO_EXTENSIONS:
+        raise HTTPException(status_code=400, detail="Format de fichier non supporté")
 
 @router.post("/upload-file", response_model=dict, status_code=status.HTTP_200_OK)
-async def upload_music_file(
-    file: UploadFile = File(...),
-    db: Session = Depends(get_db)
-):
+async def upload_music_file(file: UploadFile = File(...)):
     """
     Upload d'un fichier audio local (mp3, wav, etc.).
+    Le fichier est copié sur le disque par blocs (UPLOAD_MAX_MB au plus) et un fichier
+    déjà présent (même empreinte SHA-256) n'est pas enregistré une seconde fois.
+    Pour les gros fichiers, l'envoi reprenable (/music/uploads) résiste aux coupures.
     """
     # Vérifier l'extension
     filename = file.filename
-    ext = os.path.splitext(filename)[1].lower()
-    if ext not in [".mp3", ".wav", ".ogg", ".flac", ".aac", ".m4a"]:
-        raise HTTPException(status_code=400, detail="Format de fichier non supporté")
+    _check_audio_filename(filename)
 
-    # Générer un nom de fichier unique
-    import uuid
-    unique_id = str(uuid.uuid4())
-    new_filename = f"{unique_id}{ext}"
-    dest_path = AUDIO_STORAGE_PATH / new_filename
-
-    # Sauvegarder le fichier
-    with open(dest_path, "wb") as buffer:
-        buffer.write(await file.read())
-
-    # Extraire les métadonnées
-    title = os.path.splitext(filename)[0]
-    artist = "Inconnu"
-    album = None
-    duration = 0.0
+    # Copier le fichier en calculant son empreinte, hors de la boucle d'événements
+    temp_path = TEMP_STORAGE_PATH / f"{uuid.uuid4()}.upload"
     try:
-        audio = mutagen.File(dest_path)
-        if audio:
-            duration = float(audio.info.length) if hasattr(audio.info, 'length') else 0.0
-            if audio.tags:
-                title = audio.tags.get('TIT2', title)
-                artist = audio.tags.get('TPE1', artist)
-                album = audio.tags.get('TALB', album)
-                # Certains formats utilisent d'autres clés
-                if isinstance(title, list):
-                    title = title[0]
-                if isinstance(artist, list):
-                    artist = artist[0]
-                if isinstance(album, list):
-                    album = album[0]
-    except Exception as e:
-        print(f"Erreur extraction métadonnées: {e}")
+        content_hash, _ = await run_in_threadpool(copy_and_hash, file.file, temp_path, resumable_uploads.max_size)
+    except ValueError as e:
+        temp_path.unlink(missing_ok=True)
+        raise HTTPException(status_code=413, detail=str(e))
+
+    user_id = 1  # TODO: remplacer par l'utilisateur authentifié
+    music_id, created = await run_in_threadpool(_register_audio_file, temp_path, filename, content_hash, user_id)
+    if not created:
+        return {"message": "Ce fichier existe déjà", "music_id": music_id}
+    return {"message": "Upload réussi", "music_id": music_id}
+
+@router.post("/uploads", response_model=dict, status_code=status.HTTP_201_CREATED)
+async def create_upload(upload: UploadSessionCreate):
+    """
+    Commence un envoi reprenable : le fichier est ensuite envoyé par blocs avec
+    PATCH /music/uploads/{upload_id} (en-tête Upload-Offset, corps brut).
+    """
+    _check_audio_filename(upload.filename)
+    try:
+        return await resumable_uploads.create(upload.filename, upload.size)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+@router.get("/uploads/{upload_id}", response_model=dict)
+async def read_upload(upload_id: str):
+    """
+    État d'un envoi reprenable : offset est le nombre d'octets déjà reçus, à partir duquel reprendre.
+    """
+    info = await resumable_uploads.get(upload_id)
+    if info is None:
+        raise HTTPException(status_code=404, detail="Envoi non trouvé")
+    return info
+
+@router.patch("/uploads/{upload_id}", response_model=dict)
+async def append_upload(upload_id: str, request: Request, upload_offset: int = Header(...)):
+    """
+    Ajoute un bloc à un envoi reprenable, à partir de la position Upload-Offset.
+    Une fois tous les octets reçus, la musique est enregistrée et music_id est retourné.
+    """
+    try:
+        info = await resumable_uploads.append(upload_id, upload_offset, request.stream())
+    except UploadError as e:
+        headers = {"Upload-Offset": str(e.offset)} if e.offset is not None else None
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers=headers)
+
+    if info["offset"] < info["size"]:
+        return info
 
-    # Créer l'entrée en base
+    content_hash = await resumable_uploads.content_hash(upload_id)
     user_id = 1  # TODO: remplacer par l'utilisateur authentifié
-    db_music = MusicModel(
-        title=str(title),
-        artist=str(artist),
-        album=str(album) if album else None,
-        duration=duration,
-        file_path=str(dest_path.relative_to(Path("/app"))),
-        cover_path=None,
-        source_url=None,
-        added_by=user_id
+    music_id, created = await run_in_threadpool(
+        _register_audio_file, resumable_uploads.part_path(upload_id), info["filename"], content_hash, user_id
     )
-    db.add(db_music)
-    db.commit()
-    db.refresh(db_music)
+    await resumable_uploads.discard(upload_id, keep_part=True)
+    message = "Upload réussi" if created else "Ce fichier existe déjà"
+    return dict(info, message=message, music_id=music_id)
+
+@router.delete("/uploads/{upload_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_upload(upload_id: str):
+    """
+    Abandonne un envoi reprenable.
+    """
+    await resumable_uploads.discard(upload_id)
+
+@router.post("/import", response_model=dict, status_code=status.HTTP_202_ACCEPTED)
+async def import_library(library_import: LibraryImportCreate):
+    """
+    Importe en arrière-plan les fichiers audio d'un dossier du serveur (sous IMPORT_ROOT).
+    Relancer l'import d'un dossier ne traite que les fichiers nouveaux ou modifiés.
+    """
+    root = resolve_import_path(library_import.path)
+    if root is None:
+        raise HTTPException(status_code=404, detail="Dossier à importer non trouvé")
+    try:
+        return library_imports.submit(root, library_import.copy_files)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
 
-    return {"message": "Upload réussi", "music_id": db_music.id}
+@router.get("/import/{job_id}", response_model=dict)
+def read_library_import(job_id: str):
+    """
+    État d'un import : running, done ou error, avec le nombre de fichiers traités.
+    """
+    job = library_imports.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Import non trouvé")
+    return job
 
 @router.get("/", response_model=List[Music])
 def read_music(
@@ -344,23 +532,31 @@ def read_music(
     """
     Récupérer la liste des musiques avec possibilité de recherche.
     """
-    query = db.query(MusicModel)
-    
     # Appliquer le filtre de recherche si fourni
     if search:
-        search_term = f"%{search}%"
-        query = query.filter(
-            or_(
-                MusicModel.title.ilike(search_term),
-                MusicModel.artist.ilike(search_term),
-                MusicModel.album.ilike(search_term)
-            )
-        )
+        return _search_library(db, search, skip, limit)
     
     # Appliquer pagination
-    music = query.offset(skip).limit(limit).all()
+    music = db.query(MusicModel).offset(skip).limit(limit).all()
     return music
 
+def _search_library(db: Session, search: str, skip: int = 0, limit: int = 100) -> List[MusicModel]:
+    if library_index is not None and library_index.ready:
+        # Recherche par préfixe, sans accents ni casse, classée par pertinence
+        ids = library_index.search(search, limit=skip + limit)[skip:]
+        musics = {music.id: music for music in db.query(MusicModel).filter(MusicModel.id.in_(ids))} if ids else {}
+        return [musics[music_id] for music_id in ids if music_id in musics]
+
+    search_term = f"%{search}%"
+    query = db.query(MusicModel).filter(
+        or_(
+            MusicModel.title.ilike(search_term),
+            MusicModel.artist.ilike(search_term),
+            MusicModel.album.ilike(search_term)
+        )
+    )
+    return query.offset(skip).limit(limit).all()
+
 @router.get("/{music_id}", response_model=Music)
 def read_music_item(music_id: int, db: Session = Depends(get_db)):
     """
@@ -380,34 +576,101 @@ def update_music(music_id: int, music: MusicUpdate, db: Session = Depends(get_db
     if db_music is None:
         raise HTTPException(status_code=404, detail="Musique non trouvée")
     
-    for key, value in music.dict(exclude_unset=True).items():
+    updates = music.dict(exclude_unset=True)
+    for key, value in updates.items():
         setattr(db_music, key, value)
+    if "cover_path" in updates:
+        # La palette était celle de l'ancienne cover
+        db_music.cover_palette = None
     
     db.commit()
     db.refresh(db_music)
     return db_music
 
-@router.get("/{music_id}/stream")
-def stream_music(music_id: int, db: Session = Depends(get_db)):
+def _read_music_file_path(music_id: int) -> Tuple[Optional[str], Optional[float]]:
+    db = SessionLocal()
+    try:
+        row = (
+            db.query(MusicModel.file_path, MusicModel.loudness_integrated, MusicModel.loudness_true_peak)
+            .filter(MusicModel.id == music_id)
+            .first()
+        )
+        return (row.file_path, playback_gain(row.loudness_integrated, row.loudness_true_peak)) if row else (None, None)
+    finally:
+        db.close()
+
+async def _music_file_path(music_id: int) -> Tuple[Optional[str], Optional[float]]:
+    # Au changement de piste, tous les auditeurs d'une salle demandent la même musique
+    now = time.monotonic()
+    cached = _file_paths.get(music_id)
+    if cached and cached[2] > now:
+        return cached[0], cached[1]
+    file_path, gain = await run_in_threadpool(_read_music_file_path, music_id)
+    if file_path:
+        if len(_file_paths) >= FILE_PATH_CACHE_SIZE:
+            _file_paths.clear()
+        _file_paths[music_id] = (file_path, gain, now + LOOKUP_TTL)
+    return file_path, gain
+
+@router.get("/stream/metrics", response_model=dict)
+def stream_metrics():
+    """
+    Statistiques du cache des pistes en mémoire (octets servis depuis la mémoire et depuis le disque).
+    """
+    return hot_tracks.metrics()
+
+@router.api_route("/{music_id}/stream", methods=["GET", "HEAD"])
+async def stream_music(music_id: int, request: Request):
     """
     Streamer une musique.
+    Gère les requêtes Range (reprise, déplacement dans la piste) et les requêtes
+    conditionnelles (ETag / If-None-Match), pour ne pas renvoyer tout le fichier.
+    Les pistes demandées sont gardées en mémoire (voir HotTrackCache).
+    Le fichier n'est pas normalisé : l'en-tête X-Playback-Gain donne le gain (en dB)
+    à appliquer à la lecture, une fois la sonie de la piste mesurée.
     """
-    db_music = db.query(MusicModel).filter(MusicModel.id == music_id).first()
-    if db_music is None:
+    file_path, gain = await _music_file_path(music_id)
+    if file_path is None:
         raise HTTPException(status_code=404, detail="Musique non trouvée")
     
-    file_path = Path("/app") / db_music.file_path
-    
-    if not file_path.exists():
+    try:
+        response = await hot_tracks.response(Path("/app") / file_path, request.headers)
+    except FileNotFoundError:
         raise HTTPException(status_code=404, detail="Fichier audio non trouvé")
-    
-    def file_iterator():
-        with open(file_path, "rb") as f:
-            while chunk := f.read(8192):
-                yield chunk
-    
-    return StreamingResponse(
-        file_iterator(),
-        media_type="audio/mpeg",
-        headers={"Content-Disposition": f'attachment; filename="{file_path.name}"'}
-    ) 
\ No newline at end of file
+    if gain is not None:
+        response.headers["X-Playback-Gain"] = f"{gain:.2f}"
+    return response
+
+@router.get("/{music_id}/peaks")
+async def read_music_peaks(
+    music_id: int,
+    request: Request,
+    count: int = Query(1024, description="Nombre de paires min/max (niveau de détail)"),
+    bits: int = Query(16, description="Taille des valeurs : 8 ou 16 bits"),
+):
+    """
+    Forme d'onde d'une musique : `count` paires min/max entrelacées, entiers signés
+    petit-boutistes de `bits` bits (quelques Kio), générées une fois à l'ajout de la musique.
+    404 tant qu'elle n'a pas été générée.
+    """
+    if count not in WAVEFORM_LEVELS:
+        raise HTTPException(status_code=400, detail=f"count doit valoir {', '.join(map(str, WAVEFORM_LEVELS))}")
+    if bits not in (8, 16):
+        raise HTTPException(status_code=400, detail="bits doit valoir 8 ou 16")
+
+    path = peaks_path(music_id, count)
+    try:
+        stat_result = await run_in_threadpool(path.stat)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Forme d'onde non disponible")
+    etag = file_etag(stat_result)
+    if bits == 8:
+        etag = etag[:-1] + '-8"'
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={STREAM_CACHE_MAX_AGE}"}
+    if is_not_modified(request.headers, etag, stat_result):
+        return Response(status_code=304, headers=headers)
+
+    data = await run_in_threadpool(path.read_bytes)
+    if bits == 8:
+        data = to_int8(data)
+    return Response(content=data, media_type="application/octet-stream", headers=headers)
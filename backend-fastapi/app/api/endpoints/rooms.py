@@ -1,6 +1,9 @@
 from fastapi import APIRouter, Depends, HTTPException, status, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+from fastapi.websockets import WebSocketState
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional, Tuple
+import asyncio
 import random
 import string
 import logging
@@ -8,13 +11,25 @@ import time
 import json
 from datetime import datetime
 
-from app.db.database import get_db
+from app.db.database import get_db, SessionLocal
 from app.schemas import Room, RoomCreate, RoomUpdate, RoomDetail, UserCreate
 from app.models import Room as RoomModel, User as UserModel, QueueItem as QueueItemModel, Music as MusicModel
+from app.services import clock
+from app.services.backplane import Backplane, InMemoryBackplane, create_backplane
+from app.services.chat import ChatService
+from app.services.binary_protocol import BINARY_SUBPROTOCOL, decode_binary, encode_binary_batch, negotiate_subprotocol
+from app.services.fanout import ConnectionSender
+from app.services.room_queue import RoomQueue, QueueOpError
+from app.services.scheduler import RoomScheduler
+from app.services.serialization import OutboundMessage, decode_json, encode_json, encode_json_with_raw
+from app.services.snapshots import SnapshotStore, ROOM_SNAPSHOT_INTERVAL, create_snapshot_store
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+# Types de messages qui modifient l'état de lecture d'une salle
+PLAYBACK_CONTROL_TYPES = ["play", "pause", "sync", "track_change", "seek"]
+
 # Génération de code unique pour les salles
 def generate_room_code(length=6):
     """Génère un code aléatoire pour une salle"""
@@ -78,7 +93,8 @@ def read_room(room_code: str, db: Session = Depends(get_db)):
                     "id": track.id,
                     "title": track.title,
                     "artist": track.artist,
-                    "cover_path": track.cover_path
+                    "cover_path": track.cover_path,
+                    "cover_colors": track.cover_colors
                 }
     
     # Créer l'objet de détail de la salle
@@ -106,24 +122,75 @@ def update_room(room_id: int, room: RoomUpdate, db: Session = Depends(get_db)):
 
 # Gestionnaire de connexions WebSocket
 class ConnectionManager:
-    def __init__(self):
-        # Dictionnaire {room_code: {user_id: WebSocket}}
+    def __init__(self, backplane: Backplane = None, snapshots: SnapshotStore = None):
+        # Backplane relayant les diffusions et l'état des salles entre processus
+        self.backplane = backplane or InMemoryBackplane()
+        self._backplane_started = False
+        # Instantanés durables des salles, relus après un redémarrage (None pour désactiver)
+        self.snapshots = snapshots
+        # Salles modifiées depuis leur dernier instantané
+        self._dirty_snapshots = set()
+        self._snapshot_task = None
+        # Dictionnaire {room_code: {user_id: ConnectionSender}} (connexions de ce processus)
         self.active_connections = {}
+        # Nombre d'utilisateurs connectés à chaque salle, tous processus confondus
+        self.room_user_counts = {}
         # Dernier état de lecture pour chaque salle {room_code: {trackId, position, isPlaying, timestamp}}
         self.room_states = {}
-        # File d'attente pour chaque salle {room_code: [queue_items]}
+        # File d'attente versionnée pour chaque salle {room_code: RoomQueue}
         self.room_queues = {}
+        # Encodage JSON mis en cache de chaque file d'attente {room_code: (queue, version, json)}
+        self._encoded_queues = {}
+        # Estimation de l'horloge de chaque client {(room_code, user_id): ClockEstimator}
+        self.client_clocks = {}
+        # Ordonnanceur des diffusions de chaque salle {room_code: RoomScheduler}
+        self.room_schedulers = {}
+        # Fonctions appelées pour chaque message venu d'un autre processus : (room_code, message)
+        self.observers = []
+        # Demandes d'état de lecture transmises à un client désigné
+        # {(room_code, demandeur): (user_id du client désigné, tâche d'expiration)}
+        self.pending_state_requests = {}
     
-    async def connect(self, websocket: WebSocket, room_code: str, user_id: int, db: Session = None):
-        await websocket.accept()
+    async def connect(
+        self, websocket: WebSocket, room_code: str, user_id: int,
+        batch: bool = False, queue_deltas: bool = False
+    ):
+        # Sous-protocole binaire si le client le propose, JSON sinon
+        subprotocol = negotiate_subprotocol(websocket.scope.get("subprotocols", []))
+        await websocket.accept(subprotocol=subprotocol)
+        await self._ensure_backplane()
         if room_code not in self.active_connections:
             self.active_connections[room_code] = {}
-        self.active_connections[room_code][user_id] = websocket
+            # Premier utilisateur de la salle sur ce processus : s'abonner à ses diffusions
+            await self.backplane.join_room(room_code)
+        # Remplacer une éventuelle ancienne connexion du même utilisateur
+        previous = self.active_connections[room_code].get(user_id)
+        if previous:
+            previous.stop()
+        sender = ConnectionSender(websocket, room_code, user_id, on_evict=self._evict)
+        # Le client sait décoder les frames {"type": "batch", "messages": [...]}
+        sender.supports_batch = batch
+        # Le client applique les opérations de file d'attente (queue_delta) au lieu des instantanés
+        sender.supports_queue_deltas = queue_deltas
+        sender.binary = subprotocol == BINARY_SUBPROTOCOL
+        sender.start()
+        self.active_connections[room_code][user_id] = sender
+        self.room_user_counts[room_code] = await self.backplane.add_member(room_code, user_id)
         logger.info(f"Utilisateur {user_id} connecté à la salle {room_code}. Total: {self.get_users_count(room_code)}")
         
-        # Charger l'état actuel de la salle au premier utilisateur qui se connecte
-        if db and room_code not in self.room_states:
-            self._load_room_state(room_code, db)
+        # Charger l'état actuel de la salle au premier utilisateur qui se connecte :
+        # d'abord depuis le backplane (salle active sur un autre processus), puis depuis
+        # le dernier instantané (redémarrage), et en dernier recours depuis la base
+        if room_code not in self.room_states:
+            state, queue = await self.backplane.load_room(room_code)
+            if state is not None:
+                self.room_states[room_code] = clock.rebase(state)
+                if queue is not None:
+                    self.room_queues[room_code] = RoomQueue.from_dict(queue)
+            else:
+                if not await self._load_snapshot(room_code):
+                    await self._load_room_state(room_code)
+                await self._save_room(room_code)
         
         # Envoyer l'état actuel de la salle au nouvel utilisateur s'il existe
         if room_code in self.room_states:
@@ -133,17 +200,7 @@ class ConnectionManager:
                 client_id = f"server_{int(time.time())}"
                 
                 logger.info(f"Envoi de l'état actuel à l'utilisateur {user_id}: {state}")
-                await websocket.send_json({
-                    "type": "playback_state_response",
-                    "trackId": state.get("trackId"),
-                    "position": state.get("position"),
-                    "isPlaying": state.get("isPlaying"),
-                    "timestamp": time.time(),
-                    "client_id": client_id,
-                    # Ajouter des informations sur qui contrôle actuellement la lecture
-                    "last_controller_id": state.get("last_controller_id"),
-                    "last_client_id": state.get("last_client_id")
-                })
+                sender.push(OutboundMessage(self.playback_state_message(room_code, client_id=client_id)))
             except Exception as e:
                 logger.error(f"Erreur lors de l'envoi de l'état actuel: {str(e)}")
         
@@ -153,18 +210,13 @@ class ConnectionManager:
                 # Générer un ID client côté serveur pour ce message
                 client_id = f"server_queue_{int(time.time())}"
                 
-                await websocket.send_json({
-                    "type": "queue_sync",
-                    "queue": self.room_queues[room_code],
-                    "timestamp": time.time(),
-                    "client_id": client_id
-                })
+                sender.push(self._queue_sync_message(room_code, client_id))
             except Exception as e:
                 logger.error(f"Erreur lors de l'envoi de la file d'attente: {str(e)}")
                 
         # Informer le nouvel utilisateur qu'il peut contrôler la lecture
         try:
-            await websocket.send_json({
+            sender.push({
                 "type": "control_permission",
                 "can_control": True,
                 "timestamp": time.time(),
@@ -174,46 +226,480 @@ class ConnectionManager:
         except Exception as e:
             logger.error(f"Erreur lors de l'envoi des permissions de contrôle: {str(e)}")
     
-    def disconnect(self, room_code: str, user_id: int):
+    async def disconnect(self, room_code: str, user_id: int, websocket: WebSocket = None, restarting: bool = False):
         if room_code in self.active_connections and user_id in self.active_connections[room_code]:
-            del self.active_connections[room_code][user_id]
+            # Ignorer la déconnexion d'une ancienne socket si l'utilisateur s'est reconnecté
+            if websocket is not None and self.active_connections[room_code][user_id].websocket is not websocket:
+                return
+            self.active_connections[room_code].pop(user_id).stop()
+            self.client_clocks.pop((room_code, user_id), None)
+            self._release_state_requests(room_code, user_id)
+            remaining = await self.backplane.remove_member(room_code, user_id)
+            self.room_user_counts[room_code] = remaining
             if not self.active_connections[room_code]:
                 del self.active_connections[room_code]
-                # Effacer l'état de la salle si elle est vide
+                await self.backplane.leave_room(room_code)
+                # Conserver la salle sur disque/Redis avant d'oublier son état local ;
+                # une salle abandonnée est mise en pause, sauf si le serveur redémarre
+                if room_code in self._dirty_snapshots or remaining == 0:
+                    self._dirty_snapshots.discard(room_code)
+                    await self._write_snapshot(room_code, pause=remaining == 0 and not restarting)
+                # Effacer l'état local de la salle si elle est vide sur ce processus
                 if room_code in self.room_states:
                     del self.room_states[room_code]
                 # Effacer la file d'attente si la salle est vide
                 if room_code in self.room_queues:
                     del self.room_queues[room_code]
-            logger.info(f"Utilisateur {user_id} déconnecté de la salle {room_code}. Total restant: {self.get_users_count(room_code)}")
+                self._encoded_queues.pop(room_code, None)
+                self.room_user_counts.pop(room_code, None)
+                # Effacer l'état partagé seulement si plus personne n'est connecté nulle part
+                if remaining == 0:
+                    await self.backplane.delete_room(room_code)
+            logger.info(f"Utilisateur {user_id} déconnecté de la salle {room_code}. Total restant: {remaining}")
     
     async def broadcast(self, room_code: str, message: dict):
+        await self._ensure_backplane()
+        
+        # Ajouter un timestamp au message
+        if "timestamp" not in message:
+            message["timestamp"] = time.time()
+        
         if room_code in self.active_connections:
-            # Ajouter un timestamp au message
-            if "timestamp" not in message:
-                message["timestamp"] = time.time()
-            
-            # Mettre à jour l'état de la salle si c'est un message de contrôle de lecture
-            self._update_room_state(room_code, message)
-            
-            # Mettre à jour la file d'attente si nécessaire
-            if message.get("type") == "queue_change":
-                self._update_room_queue(room_code, message)
-            
-            disconnected_users = []
-            for user_id, connection in list(self.active_connections[room_code].items()):
-                try:
-                    # Envoyer le message à tous les utilisateurs
-                    # Les filtres seront gérés côté client
-                    await connection.send_json(message)
-                except Exception as e:
-                    logger.error(f"Erreur lors de l'envoi du message à l'utilisateur {user_id} dans la salle {room_code}: {str(e)}")
-                    # Marquer cet utilisateur comme déconnecté
-                    disconnected_users.append(user_id)
+            # Mettre à jour l'état de la salle tout de suite, même si la livraison est regroupée
+            self._apply_message(room_code, message)
+        
+        # Les messages de lecture rapprochés sont fusionnés et les autres regroupés par fenêtre
+        await self._scheduler(room_code).submit(message)
+    
+    def _scheduler(self, room_code: str) -> RoomScheduler:
+        scheduler = self.room_schedulers.get(room_code)
+        if scheduler is None:
+            scheduler = RoomScheduler(room_code, self._deliver)
+            self.room_schedulers[room_code] = scheduler
+        return scheduler
+    
+    async def _deliver(self, room_code: str, messages: list):
+        """Livre un lot de messages : connexions locales, état partagé et autres processus."""
+        if room_code in self.active_connections:
+            self._fan_out(room_code, messages)
+            await self._save_room(room_code, messages)
+        
+        # Relayer le lot aux autres processus qui ont des membres dans la salle, en un seul message
+        if len(messages) == 1:
+            await self.backplane.publish(room_code, messages[0])
+        else:
+            await self.backplane.publish(room_code, {"type": "batch", "messages": messages})
+        
+        # Oublier l'ordonnanceur d'une salle qui n'a plus de connexion locale
+        scheduler = self.room_schedulers.get(room_code)
+        if room_code not in self.active_connections and scheduler and scheduler.idle:
+            del self.room_schedulers[room_code]
+    
+    async def _on_backplane_message(self, room_code: str, message: dict):
+        """Traite un message (ou un lot) diffusé par un autre processus."""
+        if room_code not in self.active_connections:
+            return
+        messages = message["messages"] if message.get("type") == "batch" else [message]
+        for item in messages:
+            # Garder le cache local cohérent ; l'état partagé a déjà été écrit par l'émetteur
+            if item.get("type") == "queue_delta" and not self._apply_queue_delta(room_code, item):
+                await self._reload_queue(room_code)
+            self._apply_message(room_code, item)
+            for observer in self.observers:
+                observer(room_code, item)
+            if "users_count" in item:
+                self.room_user_counts[room_code] = item["users_count"]
+        self._fan_out(room_code, messages)
+    
+    def _apply_message(self, room_code: str, message: dict):
+        # Mettre à jour l'état de la salle si c'est un message de contrôle de lecture
+        self._update_room_state(room_code, message)
+        
+        # Mettre à jour la file d'attente si nécessaire
+        # (les queue_delta sont appliqués avant diffusion, voir apply_queue_ops)
+        if message.get("type") == "queue_change":
+            self._update_room_queue(room_code, message)
+    
+    def _fan_out(self, room_code: str, messages: list):
+        # Encoder chaque message une seule fois par format pour tous les destinataires
+        outbound = [OutboundMessage(message) for message in messages]
+        # Messages par variante de protocole {supports_queue_deltas: ...}
+        # et lots par variante et format {(supports_queue_deltas, binary): ...}
+        variants = {}
+        batches = {}
+        
+        # Chaque connexion dispose de sa propre file et de sa propre tâche d'envoi :
+        # la diffusion ne fait que déposer les messages, sans attendre les clients lents
+        for sender in list(self.active_connections.get(room_code, {}).values()):
+            key = sender.supports_queue_deltas
+            if key not in variants:
+                variants[key] = outbound if key else self._legacy_messages(room_code, outbound)
+            items = variants[key]
             
-            # Nettoyer les connexions mortes
-            for user_id in disconnected_users:
-                self.disconnect(room_code, user_id)
+            if sender.supports_batch and len(items) > 1:
+                # Un seul frame pour tout le lot, construit à partir des encodages existants
+                batch_key = (key, sender.binary)
+                if batch_key not in batches:
+                    batches[batch_key] = self._batch_message(items, sender.binary)
+                sender.push(batches[batch_key])
+            else:
+                for item in items:
+                    sender.push(item)
+    
+    @staticmethod
+    def _batch_message(items: list, binary: bool) -> OutboundMessage:
+        payload = {"type": "batch", "messages": [item.payload for item in items]}
+        if binary:
+            return OutboundMessage(payload, binary=encode_binary_batch([item.binary for item in items]))
+        return OutboundMessage(payload, text=encode_json_with_raw(
+            {"type": "batch"}, "messages", "[" + ",".join(item.text for item in items) + "]"
+        ))
+    
+    def _legacy_messages(self, room_code: str, outbound: list) -> list:
+        """Remplace les deltas de file d'attente par un instantané complet pour les anciens clients."""
+        if not any(item.type == "queue_delta" for item in outbound):
+            return outbound
+        snapshot = self._queue_sync_message(room_code) if room_code in self.room_queues else None
+        result = []
+        for item in outbound:
+            if item.type != "queue_delta":
+                result.append(item)
+            elif snapshot is not None and snapshot not in result:
+                result.append(snapshot)
+        return result
+    
+    def apply_queue_ops(self, room_code: str, ops: list) -> list:
+        """
+        Applique des opérations à la file d'attente de la salle et retourne celles appliquées.
+        En cas d'opération invalide, QueueOpError est levée avec les opérations
+        déjà appliquées dans son attribut `applied`.
+        """
+        queue = self.room_queues.setdefault(room_code, RoomQueue())
+        current_music_id = self.room_states.get(room_code, {}).get("trackId")
+        applied = []
+        for op in ops:
+            try:
+                applied.append(queue.apply(op, current_music_id))
+            except QueueOpError as e:
+                e.applied = applied
+                raise
+        logger.debug(f"File d'attente de la salle {room_code}: {len(applied)} opération(s), version {queue.version}")
+        return applied
+    
+    def _apply_queue_delta(self, room_code: str, message: dict) -> bool:
+        """Rejoue un queue_delta venu d'un autre processus ; retourne False si des versions manquent."""
+        queue = self.room_queues.get(room_code)
+        ops = message.get("ops", [])
+        if queue is None or not ops or ops[0].get("version") != queue.version + 1:
+            return False
+        current_music_id = self.room_states.get(room_code, {}).get("trackId")
+        try:
+            for op in ops:
+                queue.apply(op, current_music_id)
+        except QueueOpError:
+            return False
+        return True
+    
+    async def _reload_queue(self, room_code: str):
+        """Recharge la file d'attente de référence depuis le backplane."""
+        _, queue = await self.backplane.load_room(room_code)
+        if queue is not None:
+            self.room_queues[room_code] = RoomQueue.from_dict(queue)
+    
+    async def _save_room(self, room_code: str, messages: list = None):
+        """Écrit dans le backplane l'état de la salle modifié par les messages (ou tout l'état)."""
+        types = {m.get("type") for m in messages} if messages else None
+        save_state = types is None or bool(types.intersection(PLAYBACK_CONTROL_TYPES))
+        save_queue = messages is None or any(
+            (m.get("type") == "queue_change" and "queue" in m) or m.get("type") == "queue_delta" for m in messages
+        )
+        if self.snapshots and (save_state or save_queue):
+            self._dirty_snapshots.add(room_code)
+        try:
+            if room_code in self.room_states and save_state:
+                await self.backplane.save_room_state(room_code, self.room_states[room_code])
+            if room_code in self.room_queues and save_queue:
+                await self.backplane.save_room_queue(room_code, self.room_queues[room_code].to_dict())
+        except Exception as e:
+            logger.error(f"Erreur lors de l'enregistrement de l'état de la salle {room_code}: {str(e)}")
+    
+    async def _ensure_backplane(self):
+        """Démarre le backplane à la première utilisation (il a besoin de la boucle asyncio)."""
+        if not self._backplane_started:
+            self._backplane_started = True
+            await self.backplane.start(self._on_backplane_message)
+        if self.snapshots and self._snapshot_task is None:
+            self._snapshot_task = asyncio.create_task(self._snapshot_loop())
+    
+    async def _snapshot_loop(self):
+        """Écrit périodiquement l'instantané des salles modifiées."""
+        while True:
+            await asyncio.sleep(ROOM_SNAPSHOT_INTERVAL)
+            await self.flush_snapshots()
+    
+    async def flush_snapshots(self):
+        """Écrit immédiatement l'instantané de toutes les salles modifiées."""
+        dirty, self._dirty_snapshots = self._dirty_snapshots, set()
+        for room_code in dirty:
+            await self._write_snapshot(room_code)
+    
+    async def _write_snapshot(self, room_code: str, pause: bool = False):
+        """
+        Enregistre l'état de lecture et la file d'attente d'une salle.
+        Avec `pause`, la lecture est figée à sa position actuelle (salle vide).
+        """
+        state = self.room_states.get(room_code)
+        if not self.snapshots or state is None:
+            return
+        state = dict(state)
+        if pause:
+            clock.anchor(state, clock.current_position(state), False)
+        queue = self.room_queues.get(room_code)
+        snapshot = {
+            "state": state,
+            "queue": queue.to_dict() if queue is not None else None,
+            "saved_at": time.time()
+        }
+        try:
+            await self.snapshots.save(room_code, snapshot)
+        except Exception as e:
+            logger.error(f"Erreur lors de l'écriture de l'instantané de la salle {room_code}: {str(e)}")
+    
+    async def _load_snapshot(self, room_code: str) -> bool:
+        """Restaure une salle depuis son dernier instantané ; retourne False s'il n'y en a pas."""
+        if not self.snapshots:
+            return False
+        try:
+            snapshot = await self.snapshots.load(room_code)
+        except Exception as e:
+            logger.error(f"Erreur lors de la lecture de l'instantané de la salle {room_code}: {str(e)}")
+            return False
+        if not snapshot or not snapshot.get("state") or room_code in self.room_states:
+            return False
+        
+        # L'ancrage monotone de l'instantané vient d'un autre processus : le recalculer
+        self.room_states[room_code] = clock.rebase(snapshot["state"])
+        if snapshot.get("queue") is not None:
+            self.room_queues[room_code] = RoomQueue.from_dict(snapshot["queue"])
+        else:
+            self.room_queues.setdefault(room_code, RoomQueue())
+        logger.info(
+            f"Salle {room_code} restaurée depuis son instantané, "
+            f"position: {clock.current_position(self.room_states[room_code]):.1f}s"
+        )
+        return True
+    
+    async def shutdown(self):
+        """Arrêt du processus : écrire les derniers instantanés et fermer le backplane."""
+        if self._snapshot_task is not None:
+            self._snapshot_task.cancel()
+            self._snapshot_task = None
+        if self.snapshots:
+            # Toutes les salles actives, pour reprendre à la bonne position au redémarrage
+            self._dirty_snapshots.update(self.room_states.keys())
+            await self.flush_snapshots()
+            await self.snapshots.close()
+        await self.backplane.stop()
+    
+    async def count_users(self, room_code: str) -> int:
+        """Compte les utilisateurs de la salle sur l'ensemble des processus."""
+        count = await self.backplane.count_members(room_code)
+        if room_code in self.active_connections:
+            self.room_user_counts[room_code] = count
+        return count
+    
+    def _queue_sync_message(self, room_code: str, client_id: str = None) -> OutboundMessage:
+        """
+        Construit un message queue_sync (instantané complet et sa version) en réutilisant
+        l'encodage de la file d'attente, qui n'est recalculé que lorsque la version change.
+        """
+        queue = self.room_queues[room_code]
+        cached = self._encoded_queues.get(room_code)
+        if cached is None or cached[0] is not queue or cached[1] != queue.version:
+            cached = (queue, queue.version, encode_json(queue.items))
+            self._encoded_queues[room_code] = cached
+        
+        envelope = {"type": "queue_sync", "version": queue.version, "timestamp": time.time()}
+        if client_id:
+            envelope["client_id"] = client_id
+        return OutboundMessage(
+            dict(envelope, queue=queue.items),
+            text=encode_json_with_raw(envelope, "queue", cached[2])
+        )
+    
+    async def send_personal_message(self, room_code: str, user_id: int, message):
+        """Envoie un message à un seul utilisateur via sa file d'envoi."""
+        sender = self.active_connections.get(room_code, {}).get(user_id)
+        if sender:
+            sender.push(message)
+    
+    def _evict(self, sender: ConnectionSender):
+        """Retire de la salle une connexion évincée pour lenteur."""
+        connections = self.active_connections.get(sender.room_code, {})
+        # Ne pas retirer une connexion plus récente du même utilisateur
+        if connections.get(sender.user_id) is sender:
+            asyncio.create_task(self.disconnect(sender.room_code, sender.user_id, sender.websocket))
+    
+    def playback_state_message(self, room_code: str, msg_type: str = "playback_state_response", client_id: str = None) -> dict:
+        """
+        Construit un message d'état de lecture à partir de l'horloge de la salle :
+        la position est calculée au moment de l'envoi, sans interroger les clients.
+        """
+        state = self.room_states[room_code]
+        return {
+            "type": msg_type,
+            "trackId": state.get("trackId"),
+            "position": clock.current_position(state),
+            "isPlaying": state.get("isPlaying"),
+            "timestamp": time.time(),
+            "client_id": client_id or f"server_{int(time.time())}",
+            # Ajouter des informations sur qui contrôle actuellement la lecture
+            "last_controller_id": state.get("last_controller_id"),
+            "last_client_id": state.get("last_client_id")
+        }
+    
+    async def resolve_playback_state(self, room_code: str, user_id: int):
+        """
+        Répond à une demande d'état de lecture sans solliciter toute la salle :
+        depuis l'horloge du serveur si la piste est connue, sinon en interrogeant
+        un seul client désigné (le dernier à avoir contrôlé la lecture).
+        """
+        if self.has_playback_clock(room_code):
+            await self.send_personal_message(room_code, user_id, self.playback_state_message(room_code))
+            return
+        
+        key = (room_code, user_id)
+        if key in self.pending_state_requests:
+            # Une demande est déjà en cours pour ce client
+            return
+        
+        peer_id = self._designated_peer(room_code, user_id)
+        if peer_id is None:
+            # Personne d'autre ne peut répondre : état connu du serveur (aucune piste)
+            self._answer_from_server(room_code, user_id)
+            return
+        
+        logger.info(f"Demande d'état de lecture de la salle {room_code} transmise à l'utilisateur {peer_id}")
+        timeout = asyncio.create_task(self._expire_state_request(room_code, user_id))
+        self.pending_state_requests[key] = (peer_id, timeout)
+        await self.send_personal_message(room_code, peer_id, {
+            "type": "request_playback_state",
+            "source_user_id": user_id,
+            "for_user_id": user_id,
+            "timestamp": time.time()
+        })
+    
+    async def handle_playback_state_response(self, room_code: str, user_id: int, message: dict):
+        """Transmet la réponse du client désigné au demandeur et en fait l'état de référence."""
+        requester = message.get("for_user_id")
+        pending = self.pending_state_requests.get((room_code, requester))
+        if pending is None or pending[0] != user_id:
+            # Réponse non sollicitée ou arrivée après l'expiration
+            return
+        self.pending_state_requests.pop((room_code, requester))[1].cancel()
+        
+        if "trackId" in message and not self.has_playback_clock(room_code):
+            # Le serveur adopte cet état pour répondre lui-même aux prochaines demandes
+            self._update_room_state(room_code, dict(message, type="sync"))
+            await self._save_room(room_code)
+        
+        if self.has_playback_clock(room_code):
+            await self.send_personal_message(room_code, requester, self.playback_state_message(room_code))
+        else:
+            await self.send_personal_message(room_code, requester, message)
+    
+    def _designated_peer(self, room_code: str, user_id: int):
+        """Choisit le client à interroger : le dernier contrôleur s'il est là, sinon le plus ancien connecté."""
+        connections = self.active_connections.get(room_code, {})
+        controller = self.room_states.get(room_code, {}).get("last_controller_id")
+        if controller != user_id and controller in connections:
+            return controller
+        return next((peer for peer in connections if peer != user_id), None)
+    
+    def _answer_from_server(self, room_code: str, user_id: int):
+        if room_code in self.room_states:
+            message = self.playback_state_message(room_code)
+        else:
+            message = {"type": "playback_state_response", "trackId": None, "timestamp": time.time()}
+        sender = self.active_connections.get(room_code, {}).get(user_id)
+        if sender:
+            sender.push(message)
+    
+    async def _expire_state_request(self, room_code: str, user_id: int):
+        await asyncio.sleep(clock.PLAYBACK_STATE_TIMEOUT)
+        if self.pending_state_requests.pop((room_code, user_id), None) is not None:
+            logger.info(f"Pas de réponse du client désigné de la salle {room_code}, réponse du serveur")
+            self._answer_from_server(room_code, user_id)
+    
+    def _release_state_requests(self, room_code: str, user_id: int):
+        """Annule les demandes d'un client qui part et répond à celles qui l'attendaient."""
+        pending = self.pending_state_requests.pop((room_code, user_id), None)
+        if pending:
+            pending[1].cancel()
+        for (room, requester), (peer_id, timeout) in list(self.pending_state_requests.items()):
+            if room == room_code and peer_id == user_id:
+                del self.pending_state_requests[(room, requester)]
+                timeout.cancel()
+                self._answer_from_server(room_code, requester)
+    
+    def has_playback_clock(self, room_code: str) -> bool:
+        """Indique si le serveur connaît la piste en cours de la salle."""
+        return self.room_states.get(room_code, {}).get("trackId") is not None
+    
+    def record_clock_sample(self, room_code: str, user_id: int, offset: float, rtt: float) -> clock.ClockEstimator:
+        """Enregistre une mesure de décalage d'horloge rapportée par un client."""
+        estimator = self.client_clocks.setdefault((room_code, user_id), clock.ClockEstimator())
+        estimator.add_sample(offset, rtt)
+        return estimator
+    
+    def compensate_position(self, room_code: str, user_id: int, message: dict, received_at: float):
+        """
+        Corrige la position d'un message de lecture du temps de transit réseau,
+        si le client indique son heure d'envoi (`sent_at`) et que son décalage d'horloge est connu.
+        """
+        estimator = self.client_clocks.get((room_code, user_id))
+        if not estimator or not estimator.ready or "sent_at" not in message or "position" not in message:
+            return
+        if not message.get("isPlaying", message.get("type") == "play"):
+            return
+        try:
+            transit = received_at - estimator.to_server_time(float(message["sent_at"]))
+            # Ignorer les valeurs aberrantes (horloge client modifiée, etc.)
+            if 0 <= transit < 5:
+                message["position"] = float(message["position"]) + transit
+        except (TypeError, ValueError):
+            pass
+    
+    async def handle_sync(self, room_code: str, user_id: int, message: dict):
+        """
+        Traite un message `sync` périodique d'un client.
+        Si le serveur connaît l'horloge de la salle, le message n'est pas rediffusé :
+        il est absorbé si le client est à l'heure, sinon seul ce client reçoit une correction.
+        """
+        if not self.has_playback_clock(room_code):
+            # Pas encore d'horloge : le client fait référence, comme avant
+            await self.broadcast(room_code, message)
+            return
+        
+        state = self.room_states[room_code]
+        expected = clock.current_position(state)
+        reported = message.get("position")
+        same_track = message.get("trackId", state.get("trackId")) == state.get("trackId")
+        same_status = message.get("isPlaying", state.get("isPlaying")) == state.get("isPlaying")
+        
+        try:
+            drift = abs(float(reported) - expected) if reported is not None else 0.0
+        except (TypeError, ValueError):
+            drift = 0.0
+        
+        if same_track and same_status and drift <= clock.SYNC_DRIFT_TOLERANCE:
+            return
+        
+        logger.debug(f"Correction de l'utilisateur {user_id} dans la salle {room_code}: écart de {drift:.2f}s")
+        await self.send_personal_message(
+            room_code, user_id,
+            self.playback_state_message(room_code, msg_type="sync", client_id="server_clock")
+        )
     
     def _update_room_state(self, room_code: str, message: dict):
         """Met à jour l'état de la salle en fonction du message."""
@@ -224,7 +710,7 @@ class ConnectionManager:
             self.room_states[room_code] = {}
         
         # Mise à jour de l'état selon le type de message
-        if msg_type in ["play", "pause", "sync", "track_change", "seek"]:
+        if msg_type in PLAYBACK_CONTROL_TYPES:
             # Enregistrer l'ID de l'utilisateur qui a effectué l'action
             source_user_id = message.get("source_user_id")
             if source_user_id:
@@ -235,21 +721,33 @@ class ConnectionManager:
             if client_id:
                 self.room_states[room_code]["last_client_id"] = client_id
             
+            state = self.room_states[room_code]
+            
             # Mettre à jour l'ID de piste si présent
+            track_changed = "trackId" in message and message["trackId"] != state.get("trackId")
             if "trackId" in message:
-                self.room_states[room_code]["trackId"] = message["trackId"]
+                state["trackId"] = message["trackId"]
             
-            # Mettre à jour la position si présente
+            # Nouvelle position d'ancrage : celle du message, sinon la position courante
             if "position" in message:
-                self.room_states[room_code]["position"] = message["position"]
+                position = message["position"]
+            elif track_changed:
+                position = 0
+            else:
+                position = clock.current_position(state)
             
             # Mettre à jour l'état de lecture si présent
             if "isPlaying" in message:
-                self.room_states[room_code]["isPlaying"] = message["isPlaying"]
+                is_playing = message["isPlaying"]
             elif msg_type == "play":
-                self.room_states[room_code]["isPlaying"] = True
+                is_playing = True
             elif msg_type == "pause":
-                self.room_states[room_code]["isPlaying"] = False
+                is_playing = False
+            else:
+                is_playing = state.get("isPlaying", False)
+            
+            # Réancrer l'horloge de la salle
+            clock.anchor(state, position, is_playing)
             
             # Mettre à jour le timestamp
             self.room_states[room_code]["timestamp"] = time.time()
@@ -266,70 +764,47 @@ class ConnectionManager:
             if client_id:
                 log_details += f", client_id={client_id}"
                 
-            logger.info(log_details)
+            logger.debug(log_details)
     
     def _update_room_queue(self, room_code: str, message: dict):
         """Met à jour la file d'attente de la salle."""
         if "queue" in message:
-            self.room_queues[room_code] = message["queue"]
+            # Remplacement complet (ancien protocole) : nouvelle version sans historique d'opérations
+            if room_code in self.room_queues:
+                self.room_queues[room_code].reset(message["queue"])
+            else:
+                self.room_queues[room_code] = RoomQueue(message["queue"], version=1)
             logger.info(f"File d'attente de la salle {room_code} mise à jour, taille: {len(message['queue'])}")
     
-    def _load_room_state(self, room_code: str, db: Session):
+    async def _load_room_state(self, room_code: str):
         """Charge l'état initial de la salle depuis la base de données."""
         try:
-            # Récupérer la salle
-            room = db.query(RoomModel).filter(RoomModel.room_code == room_code).first()
-            if not room:
-                return
-            
-            # Récupérer la file d'attente
-            queue_items = (db.query(QueueItemModel, MusicModel)
-                          .join(MusicModel, QueueItemModel.music_id == MusicModel.id)
-                          .filter(QueueItemModel.room_id == room.id)
-                          .order_by(QueueItemModel.position)
-                          .all())
-            
-            # Initialiser la file d'attente
-            self.room_queues[room_code] = []
-            
-            # Récupérer le premier élément de la file d'attente comme piste actuelle
-            current_track_id = None
-            if queue_items:
-                queue_item, music = queue_items[0]
-                current_track_id = music.id
-                
-                # Convertir les éléments de la file d'attente en format JSON
-                self.room_queues[room_code] = [
-                    {
-                        "id": qi.id,
-                        "room_id": qi.room_id,
-                        "music_id": qi.music_id,
-                        "position": qi.position,
-                        "user_id": qi.user_id,
-                        "music": {
-                            "id": m.id,
-                            "title": m.title,
-                            "artist": m.artist,
-                            "duration": m.duration,
-                            "cover_path": m.cover_path
-                        }
-                    } for qi, m in queue_items
-                ]
-            
-            # Initialiser l'état de lecture
-            self.room_states[room_code] = {
-                "trackId": current_track_id,
-                "position": 0,
-                "isPlaying": False,
-                "timestamp": time.time()
-            }
-            
-            logger.info(f"État initial de la salle {room_code} chargé, piste: {current_track_id}, file: {len(self.room_queues.get(room_code, []))}")
-            
+            # Requêtes bloquantes exécutées hors de la boucle d'événements
+            queue_items = await run_in_threadpool(_read_room_queue, room_code)
         except Exception as e:
             logger.error(f"Erreur lors du chargement de l'état de la salle {room_code}: {str(e)}")
+            return
+        if queue_items is None or room_code in self.room_states:
+            # Salle inexistante, ou déjà chargée par une autre connexion pendant la requête
+            return
+        
+        # Récupérer le premier élément de la file d'attente comme piste actuelle
+        current_track_id = queue_items[0]["music_id"] if queue_items else None
+        self.room_queues[room_code] = RoomQueue(queue_items)
+        
+        # Initialiser l'état de lecture
+        self.room_states[room_code] = {
+            "trackId": current_track_id,
+            "timestamp": time.time()
+        }
+        clock.anchor(self.room_states[room_code], 0, False)
+        
+        logger.info(f"État initial de la salle {room_code} chargé, piste: {current_track_id}, file: {len(queue_items)}")
     
     def get_users_count(self, room_code: str) -> int:
+        # Privilégier le total connu pour l'ensemble des processus
+        if room_code in self.room_user_counts:
+            return self.room_user_counts[room_code]
         if room_code in self.active_connections:
             return len(self.active_connections[room_code])
         return 0
@@ -338,46 +813,120 @@ class ConnectionManager:
         return (room_code in self.active_connections and 
                 user_id in self.active_connections[room_code])
 
-manager = ConnectionManager()
+manager = ConnectionManager(create_backplane(), create_snapshot_store())
+chat_service = ChatService(manager.broadcast, manager.backplane)
+manager.observers.append(chat_service.observe)
+
+
+async def _receive_message(websocket: WebSocket) -> dict:
+    """Reçoit un message d'un client, en JSON (frame texte) ou en MessagePack (frame binaire)."""
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", status.WS_1000_NORMAL_CLOSURE))
+    if message.get("bytes") is not None:
+        return decode_binary(message["bytes"])
+    return decode_json(message["text"])
+
+
+# Accès à la base pour les WebSockets : chaque fonction emprunte une session le temps
+# de ses requêtes et la rend aussitôt, une connexion ouverte ne garde rien du pool.
+# Elles sont bloquantes et doivent être appelées via run_in_threadpool.
+
+def _read_socket_context(room_code: str, user_id: int) -> Tuple[Optional[int], Optional[str]]:
+    """Retourne (id de la salle ou None si elle n'existe pas, nom de l'utilisateur s'il est connu)."""
+    db = SessionLocal()
+    try:
+        room = db.query(RoomModel.id).filter(RoomModel.room_code == room_code).first()
+        username = None
+        if room and user_id > 0:
+            user = db.query(UserModel.username).filter(UserModel.id == user_id).first()
+            if user:
+                username = user.username
+        return (room.id if room else None), username
+    finally:
+        db.close()
+
+
+def _read_room_queue(room_code: str) -> Optional[list]:
+    """Retourne la file d'attente d'une salle au format JSON, ou None si la salle n'existe pas."""
+    db = SessionLocal()
+    try:
+        room = db.query(RoomModel).filter(RoomModel.room_code == room_code).first()
+        if not room:
+            return None
+        
+        queue_items = (db.query(QueueItemModel, MusicModel)
+                      .join(MusicModel, QueueItemModel.music_id == MusicModel.id)
+                      .filter(QueueItemModel.room_id == room.id)
+                      .order_by(QueueItemModel.position)
+                      .all())
+        
+        # Convertir les éléments de la file d'attente en format JSON
+        return [
+            {
+                "id": qi.id,
+                "room_id": qi.room_id,
+                "music_id": qi.music_id,
+                "position": qi.position,
+                "user_id": qi.added_by,
+                "music": {
+                    "id": m.id,
+                    "title": m.title,
+                    "artist": m.artist,
+                    "duration": m.duration,
+                    "cover_path": m.cover_path
+                }
+            } for qi, m in queue_items
+        ]
+    finally:
+        db.close()
+
 
 @router.websocket("/ws/{room_code}/{user_id}")
-async def websocket_endpoint(websocket: WebSocket, room_code: str, user_id: int, db: Session = Depends(get_db)):
+async def websocket_endpoint(
+    websocket: WebSocket, room_code: str, user_id: int,
+    batch: bool = False, queue_deltas: bool = False
+):
     """
     WebSocket pour la synchronisation en temps réel des salles.
+    Avec `?batch=true`, le client reçoit les événements regroupés dans des frames
+    {"type": "batch", "messages": [...]}.
+    Avec `?queue_deltas=true`, le client reçoit les modifications de file d'attente
+    sous forme d'opérations versionnées (queue_delta) plutôt que d'instantanés.
+    Un client qui propose le sous-protocole « musictogether.msgpack.v1 » échange
+    des frames binaires MessagePack compacts (voir app.services.binary_protocol).
+    Aucune session de base de données n'est conservée pendant la durée de la connexion.
     """
     logger.info(f"Tentative de connexion WebSocket pour l'utilisateur {user_id} dans la salle {room_code}")
     
-    # Vérifier que la salle existe
-    db_room = db.query(RoomModel).filter(RoomModel.room_code == room_code).first()
-    if db_room is None:
+    # Vérifier que la salle existe et récupérer l'utilisateur s'il est connecté
+    room_id, username = await run_in_threadpool(_read_socket_context, room_code, user_id)
+    # Seul un utilisateur enregistré peut écrire dans le chat
+    can_chat = username is not None
+    username = username or "Utilisateur"
+    if room_id is None:
         logger.warning(f"Tentative de connexion WebSocket à une salle inexistante: {room_code}")
         await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
         return
     
     try:
         # Établir la connexion
-        await manager.connect(websocket, room_code, user_id, db)
-        
-        # Récupérer l'utilisateur s'il est connecté
-        username = "Utilisateur"
-        if user_id > 0:
-            user = db.query(UserModel).filter(UserModel.id == user_id).first()
-            if user:
-                username = user.username
+        await manager.connect(websocket, room_code, user_id, batch=batch, queue_deltas=queue_deltas)
         
         # Notifier les autres utilisateurs de la connexion
         await manager.broadcast(room_code, {
             "type": "user_joined",
             "user_id": user_id,
             "username": username,
-            "users_count": manager.get_users_count(room_code)
+            "users_count": await manager.count_users(room_code)
         })
         
         # Boucle principale pour recevoir les messages
         while True:
             try:
-                data = await websocket.receive_json()
-                logger.info(f"Message reçu dans la salle {room_code} de l'utilisateur {user_id}: {data}")
+                data = await _receive_message(websocket)
+                received_at = time.time()
+                logger.debug(f"Message reçu dans la salle {room_code} de l'utilisateur {user_id}: {data}")
                 
                 # Traiter les messages selon leur type
                 msg_type = data.get("type", "")
@@ -387,70 +936,154 @@ async def websocket_endpoint(websocket: WebSocket, room_code: str, user_id: int,
                 
                 if msg_type == "playback_update":
                     # Diffuser la mise à jour de lecture à tous les utilisateurs de la salle
-                    logger.info(f"Diffusion mise à jour de lecture: {data}")
+                    logger.debug(f"Diffusion mise à jour de lecture: {data}")
                     await manager.broadcast(room_code, data)
                 
-                elif msg_type in ["play", "pause", "seek", "track_change", "sync"]:
-                    # Diffuser les commandes de lecture et synchronisation
-                    logger.info(f"Diffusion commande {msg_type}: {data}")
+                elif msg_type in ["play", "pause", "seek", "track_change"]:
+                    # Diffuser les commandes de lecture
+                    logger.debug(f"Diffusion commande {msg_type}: {data}")
+                    manager.compensate_position(room_code, user_id, data, received_at)
                     # Ajouter timestamp pour calcul de latence côté client
                     data["timestamp"] = time.time()
                     await manager.broadcast(room_code, data)
                 
+                elif msg_type == "sync":
+                    # Comparer à l'horloge du serveur plutôt que rediffuser à toute la salle
+                    manager.compensate_position(room_code, user_id, data, received_at)
+                    data["timestamp"] = time.time()
+                    await manager.handle_sync(room_code, user_id, data)
+                
+                elif msg_type == "clock_sync":
+                    # Échange de type NTP : le client envoie t0 et, à partir du deuxième échange,
+                    # son estimation précédente (offset, rtt) que le serveur conserve
+                    if "offset" in data and "rtt" in data:
+                        try:
+                            manager.record_clock_sample(room_code, user_id, float(data["offset"]), float(data["rtt"]))
+                        except (TypeError, ValueError):
+                            pass
+                    estimator = manager.client_clocks.get((room_code, user_id))
+                    await manager.send_personal_message(room_code, user_id, {
+                        "type": "clock_sync_response",
+                        "t0": data.get("t0"),
+                        "t1": received_at,
+                        "t2": time.time(),
+                        # Meilleure estimation connue du serveur pour ce client
+                        "offset": estimator.offset if estimator else None,
+                        "rtt": estimator.rtt if estimator else None
+                    })
+                
                 elif msg_type == "queue_change":
                     # Diffuser les changements de file d'attente
-                    logger.info(f"Diffusion changement de file d'attente: {data}")
+                    logger.debug(f"Diffusion changement de file d'attente: {data}")
                     await manager.broadcast(room_code, data)
                     
-                    # Si une mise à jour complète de la file d'attente est fournie
-                    if "queue" in data:
-                        manager.room_queues[room_code] = data["queue"]
+                
+                elif msg_type == "queue_op":
+                    # Modification de la file d'attente par opérations versionnées
+                    ops = data.get("ops") or ([data["op"]] if isinstance(data.get("op"), dict) else [])
+                    error = None
+                    try:
+                        applied = manager.apply_queue_ops(room_code, ops)
+                    except QueueOpError as e:
+                        applied, error = e.applied, str(e)
+                    
+                    if applied:
+                        await manager.broadcast(room_code, {
+                            "type": "queue_delta",
+                            "version": applied[-1]["version"],
+                            "ops": applied,
+                            "source_user_id": user_id,
+                            "client_id": data.get("client_id")
+                        })
+                    if error:
+                        await manager.send_personal_message(room_code, user_id, {
+                            "type": "queue_error",
+                            "error": error,
+                            "version": manager.room_queues[room_code].version
+                        })
+                
+                elif msg_type == "chat_message":
+                    # Diffusion immédiate à la salle, écriture en base différée et groupée
+                    try:
+                        if not can_chat:
+                            raise ValueError("Vous devez être connecté pour envoyer des messages")
+                        await chat_service.post(room_id, room_code, user_id, username, data.get("message"))
+                    except ValueError as e:
+                        await manager.send_personal_message(room_code, user_id, {
+                            "type": "chat_error",
+                            "error": str(e),
+                            "client_id": data.get("client_id")
+                        })
                 
                 elif msg_type == "ping":
                     # Répondre au ping pour maintenir la connexion active
-                    await websocket.send_json({"type": "pong", "timestamp": time.time()})
+                    await manager.send_personal_message(room_code, user_id, {"type": "pong", "timestamp": time.time()})
                 
                 elif msg_type == "request_playback_state":
-                    # Rediffuser la demande à tous les clients (un client répondra)
-                    logger.info(f"Diffusion demande d'état de lecture pour {data.get('for_user_id')}")
-                    await manager.broadcast(room_code, data)
+                    # Horloge du serveur, ou un seul client désigné : jamais toute la salle
+                    await manager.resolve_playback_state(room_code, user_id)
+                
+                elif msg_type == "playback_state_response":
+                    # Réponse du client désigné à une demande transmise par le serveur
+                    manager.compensate_position(room_code, user_id, data, received_at)
+                    await manager.handle_playback_state_response(room_code, user_id, data)
                 
                 elif msg_type == "request_queue":
-                    # Envoyer la file d'attente actuelle
+                    # Envoyer les opérations depuis la version connue du client si possible,
+                    # sinon la file d'attente complète
                     if room_code in manager.room_queues:
-                        await websocket.send_json({
-                            "type": "queue_sync",
-                            "queue": manager.room_queues[room_code],
-                            "timestamp": time.time()
-                        })
+                        queue = manager.room_queues[room_code]
+                        ops = None
+                        if data.get("since") is not None:
+                            try:
+                                ops = queue.ops_since(int(data["since"]))
+                            except (TypeError, ValueError):
+                                ops = None
+                        if ops is not None:
+                            await manager.send_personal_message(room_code, user_id, {
+                                "type": "queue_delta",
+                                "version": queue.version,
+                                "ops": ops,
+                                "timestamp": time.time()
+                            })
+                        else:
+                            await manager.send_personal_message(
+                                room_code, user_id, manager._queue_sync_message(room_code)
+                            )
             
-            except WebSocketDisconnect:
-                manager.disconnect(room_code, user_id)
+            except WebSocketDisconnect as e:
+                # Code 1012 : fermeture par le serveur qui s'arrête ou redémarre
+                await manager.disconnect(
+                    room_code, user_id, websocket, restarting=e.code == status.WS_1012_SERVICE_RESTART
+                )
                 await manager.broadcast(room_code, {
                     "type": "user_left",
                     "user_id": user_id,
                     "username": username,
-                    "users_count": manager.get_users_count(room_code)
+                    "users_count": await manager.count_users(room_code)
                 })
                 break
             
             except Exception as e:
                 logger.error(f"Erreur WebSocket: {str(e)}")
-                # Ne pas interrompre la boucle, tenter de continuer
+                # La socket a été fermée côté serveur (client évincé) : sortir de la boucle
+                if websocket.application_state == WebSocketState.DISCONNECTED:
+                    raise WebSocketDisconnect(code=1013)
+                # Sinon, ne pas interrompre la boucle, tenter de continuer
     
     except WebSocketDisconnect:
         logger.info(f"WebSocket déconnecté pour l'utilisateur {user_id}")
-        manager.disconnect(room_code, user_id)
+        await manager.disconnect(room_code, user_id, websocket)
         
         # Notifier les autres utilisateurs de la déconnexion
         await manager.broadcast(room_code, {
             "type": "user_left",
             "user_id": user_id,
-            "username": username if 'username' in locals() else "Utilisateur",
-            "users_count": manager.get_users_count(room_code)
+            "username": username,
+            "users_count": await manager.count_users(room_code)
         })
     
     except Exception as e:
         logger.error(f"Erreur non gérée dans la connexion WebSocket: {str(e)}")
         # Tenter de déconnecter proprement en cas d'erreur
-        manager.disconnect(room_code, user_id) 
\ No newline at end of file
+        await manager.disconnect(room_code, user_id, websocket) 
\ No newline at end of file
@@ -2,7 +2,13 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from app.api.routes import router
-from app.db.database import engine, Base
+from app.api.endpoints.rooms import manager as room_manager, chat_service
+from app.api.endpoints.music import search_service, download_jobs, library_index, track_analyzer
+from app.db.database import engine, Base, SessionLocal
+from app.models import ChatMessage, Music
+from app.services.source_urls import canonical_source_key
+from sqlalchemy import inspect, text
+import asyncio
 import logging
 from pathlib import Path
 
@@ -14,6 +20,34 @@ logging.basicConfig(
 
 # Créer les tables dans la base de données
 Base.metadata.create_all(bind=engine)
+# create_all n'ajoute pas les index des tables existantes : les créer s'ils manquent
+for index in ChatMessage.__table__.indexes:
+    index.create(bind=engine, checkfirst=True)
+# Ni les colonnes : ajouter celles de music qui manquent, leurs index,
+# et calculer music.source_key pour les musiques existantes
+music_columns = {column["name"] for column in inspect(engine).get_columns("music")}
+for name, ddl in (
+    ("source_key", "VARCHAR(255)"), ("content_hash", "VARCHAR(64)"), ("updated_at", "DATETIME"),
+    ("cover_palette", "VARCHAR(100)"),
+    ("loudness_integrated", "FLOAT"), ("loudness_true_peak", "FLOAT"), ("loudness_range", "FLOAT"),
+):
+    if name not in music_columns:
+        with engine.begin() as connection:
+            connection.execute(text(f"ALTER TABLE music ADD COLUMN {name} {ddl}"))
+for index in Music.__table__.indexes:
+    index.create(bind=engine, checkfirst=True)
+
+def backfill_source_keys():
+    db = SessionLocal()
+    try:
+        musics = db.query(Music).filter(Music.source_key.is_(None), Music.source_url.isnot(None)).all()
+        for music in musics:
+            music.source_key = canonical_source_key(music.source_url)
+        db.commit()
+    finally:
+        db.close()
+
+backfill_source_keys()
 
 # Créer les dossiers de stockage s'ils n'existent pas
 storage_path = Path("/app/storage")
@@ -42,6 +76,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Gain de lecture de /api/music/{id}/stream, lisible par le lecteur
+    expose_headers=["X-Playback-Gain"],
 )
 
 # Monter le dossier de stockage pour servir les fichiers statiques
@@ -50,6 +86,22 @@ app.mount("/storage", StaticFiles(directory="/app/storage"), name="storage")
 # Inclure les routes
 app.include_router(router, prefix="/api")
 
+@app.on_event("startup")
+async def start_library_index():
+    # L'index de recherche de la bibliothèque se construit sans retarder le démarrage
+    if library_index is not None:
+        app.state.library_index_build = asyncio.create_task(library_index.build_in_background())
+
+@app.on_event("shutdown")
+async def shutdown_rooms():
+    # Écrire les derniers messages de chat, puis l'instantané des salles,
+    # et fermer le backplane (Redis, etc.) le service de recherche, les téléchargements et les analyses de pistes
+    await chat_service.close()
+    await room_manager.shutdown()
+    await search_service.close()
+    await download_jobs.close()
+    track_analyzer.close()
+
 @app.get("/")
 def read_root():
     return {"message": "Bienvenue sur l'API MusicTogether"}
\ No newline at end of file
@@ -1,7 +1,10 @@
 from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey
 from sqlalchemy.orm import relationship
 from datetime import datetime
+from typing import Dict, List, Optional
 from app.db.database import Base
+from app.services.covers import cover_thumbnails
+from app.services.loudness import playback_gain
 
 class Music(Base):
     __tablename__ = "music"
@@ -13,12 +16,38 @@ class Music(Base):
     duration = Column(Float)  # en secondes
     file_path = Column(String(500))
     cover_path = Column(String(500), nullable=True)
+    # Couleurs dominantes de la cover ("#rrggbb" séparées par des virgules, la plus présente d'abord)
+    cover_palette = Column(String(100), nullable=True)
+    # Sonie mesurée (EBU R128) : intégrée (LUFS), true peak (dBTP) et plage (LU), None si non mesurée
+    loudness_integrated = Column(Float, nullable=True)
+    loudness_true_peak = Column(Float, nullable=True)
+    loudness_range = Column(Float, nullable=True)
     source_url = Column(String(500), nullable=True)
+    # Clé canonique de la source ("youtube:<id>"), pour ne pas télécharger deux fois le même média
+    source_key = Column(String(255), nullable=True, index=True)
+    # Empreinte SHA-256 du fichier audio, pour ne pas stocker deux fois le même fichier
+    content_hash = Column(String(64), nullable=True, unique=True, index=True)
     added_at = Column(DateTime, default=datetime.utcnow)
+    # Dernière écriture, pour que l'index de recherche de chaque processus prenne en compte les autres
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     added_by = Column(Integer, ForeignKey("users.id"))
     
     # Relations
     uploader = relationship("User", back_populates="uploaded_music")
     queue_items = relationship("QueueItem", back_populates="music")
     favorites = relationship("Favorite", back_populates="music", cascade="all, delete-orphan")
-    playlist_items = relationship("PlaylistItem", back_populates="music", cascade="all, delete-orphan") 
\ No newline at end of file
+    playlist_items = relationship("PlaylistItem", back_populates="music", cascade="all, delete-orphan")
+
+    @property
+    def cover_colors(self) -> List[str]:
+        return self.cover_palette.split(",") if self.cover_palette else []
+
+    @property
+    def cover_sizes(self) -> Dict[str, str]:
+        # Miniatures WebP {côté en pixels: url}, générées à côté de cover_path
+        return cover_thumbnails(self.cover_path)
+
+    @property
+    def playback_gain(self) -> Optional[float]:
+        # Gain (en dB) à appliquer à la lecture pour atteindre la sonie visée
+        return playback_gain(self.loudness_integrated, self.loudness_true_peak)
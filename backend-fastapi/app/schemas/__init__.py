@@ -1,6 +1,6 @@
 from app.schemas.user import User, UserCreate, UserUpdate, UserLogin, TokenResponse
 from app.schemas.room import Room, RoomCreate, RoomUpdate, RoomDetail
-from app.schemas.music import Music, MusicCreate, MusicUpdate, MusicUpload
+from app.schemas.music import Music, MusicCreate, MusicUpdate, MusicUpload, UploadSessionCreate, LibraryImportCreate
 from app.schemas.queue import QueueItem, QueueItemCreate, QueueItemUpdate, QueueItemDetail
 from app.schemas.chat import ChatMessage, ChatMessageCreate, ChatMessageResponse
 from app.schemas.playlist import (
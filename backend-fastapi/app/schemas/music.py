@@ -1,6 +1,6 @@
 from pydantic import BaseModel
 from datetime import datetime
-from typing import Optional
+from typing import Dict, List, Optional
 
 class MusicBase(BaseModel):
     title: str
@@ -22,6 +22,14 @@ class Music(MusicBase):
     id: int
     file_path: str
     cover_path: Optional[str] = None
+    # Miniatures {côté en pixels: url} et couleurs dominantes de la cover
+    cover_sizes: Dict[str, str] = {}
+    cover_colors: List[str] = []
+    # Sonie mesurée et gain de lecture (en dB) à appliquer par le client, None si non mesurée
+    loudness_integrated: Optional[float] = None
+    loudness_true_peak: Optional[float] = None
+    loudness_range: Optional[float] = None
+    playback_gain: Optional[float] = None
     source_url: Optional[str] = None
     added_at: datetime
     added_by: int
@@ -30,4 +38,16 @@ class Music(MusicBase):
         orm_mode = True
 
 class MusicUpload(BaseModel):
-    source_url: str 
\ No newline at end of file
+    source_url: str
+    # Salle à informer de la progression du téléchargement
+    room_code: Optional[str] = None 
+
+class UploadSessionCreate(BaseModel):
+    filename: str
+    size: int
+
+class LibraryImportCreate(BaseModel):
+    # Dossier à importer, relatif à IMPORT_ROOT
+    path: str = ""
+    # Copier les fichiers dans le stockage audio au lieu de les lire sur place
+    copy_files: bool = False
\ No newline at end of file
@@ -0,0 +1 @@
+# Package services 
\ No newline at end of file
@@ -0,0 +1,93 @@
+import hashlib
+import logging
+from pathlib import Path
+from typing import BinaryIO, Optional, Tuple
+
+import mutagen
+
+logger = logging.getLogger(__name__)
+
+# Extensions des fichiers audio acceptés
+AUDIO_EXTENSIONS = {".mp3", ".wav", ".ogg", ".flac", ".aac", ".m4a"}
+
+# Taille des blocs lus pour calculer l'empreinte d'un fichier
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def read_audio_tags(path: Path, default_title: str) -> dict:
+    """
+    Titre, artiste, album et durée d'un fichier audio (bloquant).
+    Les valeurs manquantes ont une valeur par défaut ; un fichier illisible n'est pas une erreur.
+    """
+    title = default_title
+    artist = "Inconnu"
+    album = None
+    duration = 0.0
+    try:
+        audio = mutagen.File(path)
+        if audio:
+            duration = float(audio.info.length) if hasattr(audio.info, 'length') else 0.0
+            if audio.tags:
+                title = audio.tags.get('TIT2', title)
+                artist = audio.tags.get('TPE1', artist)
+                album = audio.tags.get('TALB', album)
+                # Certains formats utilisent d'autres clés
+                if isinstance(title, list):
+                    title = title[0]
+                if isinstance(artist, list):
+                    artist = artist[0]
+                if isinstance(album, list):
+                    album = album[0]
+    except Exception as e:
+        logger.warning(f"Erreur extraction métadonnées ({path}): {e}")
+    return {
+        "title": str(title),
+        "artist": str(artist),
+        "album": str(album) if album else None,
+        "duration": duration,
+    }
+
+
+def copy_and_hash(source: BinaryIO, destination: Path, max_size: Optional[int] = None) -> Tuple[str, int]:
+    """
+    Copie un flux dans un fichier par blocs en calculant son empreinte SHA-256 au passage (bloquant).
+    Retourne (empreinte, taille). Lève ValueError si le flux dépasse max_size octets.
+    """
+    hasher = hashlib.sha256()
+    size = 0
+    with open(destination, "wb") as output:
+        while chunk := source.read(HASH_CHUNK_SIZE):
+            size += len(chunk)
+            if max_size is not None and size > max_size:
+                raise ValueError(f"Fichier trop volumineux (maximum {max_size} octets)")
+            hasher.update(chunk)
+            output.write(chunk)
+    return hasher.hexdigest(), size
+
+
+def file_hash(path: Path) -> str:
+    """Empreinte SHA-256 d'un fichier (bloquant)."""
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def probe_audio_file(path: str) -> dict:
+    """
+    Empreinte et métadonnées d'un fichier audio à importer (bloquant).
+    Fonction de module, sans état : elle peut être exécutée dans un pool de processus.
+    """
+    file_path = Path(path)
+    try:
+        stat_result = file_path.stat()
+        return dict(
+            read_audio_tags(file_path, file_path.stem),
+            path=path,
+            size=stat_result.st_size,
+            mtime=stat_result.st_mtime,
+            content_hash=file_hash(file_path),
+        )
+    except OSError as e:
+        return {"path": path, "error": str(e)}
@@ -0,0 +1,312 @@
+import asyncio
+import logging
+import os
+import uuid
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from app.services.serialization import encode_json, decode_json
+
+logger = logging.getLogger(__name__)
+
+# Backplane à utiliser : "memory" (un seul processus) ou "redis" (plusieurs workers/nœuds)
+ROOM_BACKPLANE = os.getenv("ROOM_BACKPLANE", "memory")
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
+# Durée de vie (en secondes) de l'état d'une salle inactive dans Redis
+ROOM_STATE_TTL = int(os.getenv("ROOM_STATE_TTL", "86400"))
+
+# Callback appelé pour chaque message reçu d'un autre processus : (room_code, message)
+MessageHandler = Callable[[str, dict], Awaitable[None]]
+
+
+class Backplane:
+    """
+    Interface commune des backplanes de salles.
+    Un backplane relaie les diffusions entre processus et conserve l'état
+    de référence des salles (lecture, file d'attente, membres).
+    """
+
+    def __init__(self):
+        # Identifiant unique de ce processus, pour ignorer ses propres messages
+        self.node_id = uuid.uuid4().hex
+
+    async def start(self, on_message: MessageHandler):
+        raise NotImplementedError
+
+    async def stop(self):
+        raise NotImplementedError
+
+    async def join_room(self, room_code: str):
+        """Commence à recevoir les diffusions d'une salle."""
+        raise NotImplementedError
+
+    async def leave_room(self, room_code: str):
+        """Arrête de recevoir les diffusions d'une salle."""
+        raise NotImplementedError
+
+    async def publish(self, room_code: str, message: dict):
+        """Relaie un message aux autres processus abonnés à la salle."""
+        raise NotImplementedError
+
+    async def add_member(self, room_code: str, user_id: int) -> int:
+        """Enregistre un utilisateur dans la salle et retourne le nombre total de membres."""
+        raise NotImplementedError
+
+    async def remove_member(self, room_code: str, user_id: int) -> int:
+        """Retire un utilisateur de la salle et retourne le nombre de membres restants."""
+        raise NotImplementedError
+
+    async def count_members(self, room_code: str) -> int:
+        raise NotImplementedError
+
+    async def load_room(self, room_code: str) -> Tuple[Optional[dict], Optional[dict]]:
+        """Retourne (état de lecture, file d'attente sérialisée) de la salle, ou (None, None)."""
+        raise NotImplementedError
+
+    async def save_room_state(self, room_code: str, state: dict):
+        raise NotImplementedError
+
+    async def save_room_queue(self, room_code: str, queue: dict):
+        """Enregistre la file d'attente sérialisée (RoomQueue.to_dict())."""
+        raise NotImplementedError
+
+    async def delete_room(self, room_code: str):
+        raise NotImplementedError
+
+    async def allocate_ids(self, name: str, count: int, floor: int = 0) -> int:
+        """
+        Réserve `count` identifiants consécutifs du compteur `name`, tous supérieurs à `floor`,
+        et retourne le dernier identifiant du bloc.
+        """
+        raise NotImplementedError
+
+
+class InMemoryBackplane(Backplane):
+    """
+    Backplane en mémoire, pour un déploiement à un seul processus et pour les tests.
+    Plusieurs gestionnaires partageant la même instance se comportent comme
+    plusieurs processus reliés par Redis.
+    """
+
+    def __init__(self):
+        super().__init__()
+        # Abonnés de chaque salle {room_code: {node_id: handler}}
+        self._subscribers: Dict[str, Dict[str, MessageHandler]] = {}
+        # Membres de chaque salle {room_code: {user_id: node_id}}
+        self._members: Dict[str, Dict[int, str]] = {}
+        self._states: Dict[str, dict] = {}
+        self._queues: Dict[str, dict] = {}
+        self._counters: Dict[str, int] = {}
+        self._handlers: Dict[str, MessageHandler] = {}
+
+    def attach(self) -> "InMemoryBackplane":
+        """Crée une vue de ce backplane pour un autre « nœud » partageant les mêmes données."""
+        view = InMemoryBackplane.__new__(InMemoryBackplane)
+        view.__dict__.update(self.__dict__)
+        view.node_id = uuid.uuid4().hex
+        return view
+
+    async def start(self, on_message: MessageHandler):
+        self._handlers[self.node_id] = on_message
+
+    async def stop(self):
+        self._handlers.pop(self.node_id, None)
+        for subscribers in self._subscribers.values():
+            subscribers.pop(self.node_id, None)
+
+    async def join_room(self, room_code: str):
+        handler = self._handlers.get(self.node_id)
+        if handler:
+            self._subscribers.setdefault(room_code, {})[self.node_id] = handler
+
+    async def leave_room(self, room_code: str):
+        subscribers = self._subscribers.get(room_code, {})
+        subscribers.pop(self.node_id, None)
+        if not subscribers:
+            self._subscribers.pop(room_code, None)
+
+    async def publish(self, room_code: str, message: dict):
+        for node_id, handler in list(self._subscribers.get(room_code, {}).items()):
+            if node_id != self.node_id:
+                await handler(room_code, message)
+
+    async def add_member(self, room_code: str, user_id: int) -> int:
+        members = self._members.setdefault(room_code, {})
+        members[user_id] = self.node_id
+        return len(members)
+
+    async def remove_member(self, room_code: str, user_id: int) -> int:
+        members = self._members.get(room_code, {})
+        # Ne pas retirer un utilisateur qui s'est reconnecté sur un autre nœud
+        if members.get(user_id) == self.node_id:
+            del members[user_id]
+        if not members:
+            self._members.pop(room_code, None)
+        return len(members)
+
+    async def count_members(self, room_code: str) -> int:
+        return len(self._members.get(room_code, {}))
+
+    async def load_room(self, room_code: str) -> Tuple[Optional[dict], Optional[dict]]:
+        state = self._states.get(room_code)
+        queue = self._queues.get(room_code)
+        return (dict(state) if state is not None else None, queue)
+
+    async def save_room_state(self, room_code: str, state: dict):
+        self._states[room_code] = dict(state)
+
+    async def save_room_queue(self, room_code: str, queue: dict):
+        self._queues[room_code] = queue
+
+    async def delete_room(self, room_code: str):
+        self._states.pop(room_code, None)
+        self._queues.pop(room_code, None)
+
+    async def allocate_ids(self, name: str, count: int, floor: int = 0) -> int:
+        last = max(self._counters.get(name, 0), floor) + count
+        self._counters[name] = last
+        return last
+
+
+class RedisBackplane(Backplane):
+    """
+    Backplane Redis : les diffusions passent par un canal pub/sub par salle
+    et l'état de référence des salles est stocké dans Redis.
+    """
+
+    # Retire un membre seulement s'il appartient à ce nœud, puis compte les membres restants
+    _REMOVE_MEMBER_SCRIPT = """
+    if redis.call('HGET', KEYS[1], ARGV[1]) == ARGV[2] then
+        redis.call('HDEL', KEYS[1], ARGV[1])
+    end
+    return redis.call('HLEN', KEYS[1])
+    """
+
+    # Avance un compteur d'au moins `floor` + `count` et retourne sa nouvelle valeur
+    _ALLOCATE_IDS_SCRIPT = """
+    local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+    local floor = tonumber(ARGV[2])
+    if current < floor then
+        current = floor
+    end
+    current = current + tonumber(ARGV[1])
+    redis.call('SET', KEYS[1], current)
+    return current
+    """
+
+    def __init__(self, url: str = REDIS_URL, prefix: str = "musictogether"):
+        super().__init__()
+        import redis.asyncio as redis
+
+        self.redis = redis.from_url(url)
+        self.prefix = prefix
+        self._pubsub = None
+        self._reader_task = None
+        self._subscribed = asyncio.Event()
+        self._on_message: Optional[MessageHandler] = None
+        self._remove_member = self.redis.register_script(self._REMOVE_MEMBER_SCRIPT)
+        self._allocate_ids = self.redis.register_script(self._ALLOCATE_IDS_SCRIPT)
+
+    def _key(self, room_code: str, suffix: str) -> str:
+        return f"{self.prefix}:room:{room_code}:{suffix}"
+
+    def _channel(self, room_code: str) -> str:
+        return self._key(room_code, "events")
+
+    async def start(self, on_message: MessageHandler):
+        self._on_message = on_message
+        self._pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        self._reader_task = asyncio.create_task(self._reader())
+        logger.info(f"Backplane Redis démarré (nœud {self.node_id})")
+
+    async def stop(self):
+        if self._reader_task:
+            self._reader_task.cancel()
+            self._reader_task = None
+        if self._pubsub:
+            await self._pubsub.aclose()
+            self._pubsub = None
+        await self.redis.aclose()
+
+    async def join_room(self, room_code: str):
+        await self._pubsub.subscribe(self._channel(room_code))
+        self._subscribed.set()
+
+    async def leave_room(self, room_code: str):
+        await self._pubsub.unsubscribe(self._channel(room_code))
+
+    async def publish(self, room_code: str, message: dict):
+        envelope = {"origin": self.node_id, "room": room_code, "message": message}
+        await self.redis.publish(self._channel(room_code), encode_json(envelope))
+
+    async def _reader(self):
+        """Lit en continu les messages des salles auxquelles ce nœud est abonné."""
+        while True:
+            try:
+                if not self._pubsub.subscribed:
+                    self._subscribed.clear()
+                    await self._subscribed.wait()
+                    continue
+
+                raw = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if not raw or raw.get("type") != "message":
+                    continue
+
+                envelope = decode_json(raw["data"])
+                if envelope.get("origin") == self.node_id:
+                    continue
+                await self._on_message(envelope["room"], envelope["message"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Erreur lors de la lecture du backplane Redis: {str(e)}")
+                await asyncio.sleep(1)
+
+    async def add_member(self, room_code: str, user_id: int) -> int:
+        key = self._key(room_code, "members")
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(key, str(user_id), self.node_id)
+            pipe.hlen(key)
+            _, count = await pipe.execute()
+        return int(count)
+
+    async def remove_member(self, room_code: str, user_id: int) -> int:
+        count = await self._remove_member(
+            keys=[self._key(room_code, "members")], args=[str(user_id), self.node_id]
+        )
+        return int(count)
+
+    async def count_members(self, room_code: str) -> int:
+        return int(await self.redis.hlen(self._key(room_code, "members")))
+
+    async def load_room(self, room_code: str) -> Tuple[Optional[dict], Optional[dict]]:
+        state, queue = await self.redis.mget(self._key(room_code, "state"), self._key(room_code, "queue"))
+        return (
+            decode_json(state) if state is not None else None,
+            decode_json(queue) if queue is not None else None,
+        )
+
+    async def save_room_state(self, room_code: str, state: dict):
+        await self.redis.set(self._key(room_code, "state"), encode_json(state), ex=ROOM_STATE_TTL)
+
+    async def save_room_queue(self, room_code: str, queue: dict):
+        await self.redis.set(self._key(room_code, "queue"), encode_json(queue), ex=ROOM_STATE_TTL)
+
+    async def delete_room(self, room_code: str):
+        await self.redis.delete(
+            self._key(room_code, "state"),
+            self._key(room_code, "queue"),
+            self._key(room_code, "members"),
+        )
+
+    async def allocate_ids(self, name: str, count: int, floor: int = 0) -> int:
+        last = await self._allocate_ids(keys=[f"{self.prefix}:counter:{name}"], args=[count, floor])
+        return int(last)
+
+
+def create_backplane(kind: str = ROOM_BACKPLANE) -> Backplane:
+    """Instancie le backplane configuré par la variable d'environnement ROOM_BACKPLANE."""
+    if kind == "redis":
+        return RedisBackplane()
+    if kind != "memory":
+        logger.warning(f"Backplane inconnu '{kind}', utilisation du backplane en mémoire")
+    return InMemoryBackplane()
@@ -0,0 +1,162 @@
+"""
+Protocole binaire des salles (sous-protocole WebSocket « musictogether.msgpack.v1 »).
+
+Chaque message est une map MessagePack envoyée dans un frame binaire :
+- le type est un petit entier sous la clé "t" (voir MESSAGE_TYPE_CODES),
+  les types inconnus restent des chaînes ;
+- les clés fréquentes sont abrégées (voir KEY_CODES), les autres sont inchangées ;
+- un élément de file d'attente est un tableau
+  [id, room_id, music_id, position, user_id, title, artist, duration, cover_path].
+Les codes ne doivent jamais être réattribués : on ne fait qu'en ajouter.
+"""
+
+from typing import Iterable, List, Optional
+
+# msgpack est optionnel : sans lui, seul le protocole JSON est proposé
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - dépend de l'environnement
+    msgpack = None
+
+BINARY_SUBPROTOCOL = "musictogether.msgpack.v1"
+
+MESSAGE_TYPE_CODES = {
+    "play": 1,
+    "pause": 2,
+    "seek": 3,
+    "sync": 4,
+    "track_change": 5,
+    "playback_update": 6,
+    "playback_state_response": 7,
+    "request_playback_state": 8,
+    "queue_sync": 9,
+    "queue_change": 10,
+    "queue_delta": 11,
+    "queue_op": 12,
+    "request_queue": 13,
+    "queue_error": 14,
+    "user_joined": 15,
+    "user_left": 16,
+    "control_permission": 17,
+    "ping": 18,
+    "pong": 19,
+    "clock_sync": 20,
+    "clock_sync_response": 21,
+    "batch": 22,
+    "download_progress": 23,
+}
+MESSAGE_TYPES = {code: name for name, code in MESSAGE_TYPE_CODES.items()}
+
+KEY_CODES = {
+    "type": "t",
+    "timestamp": "ts",
+    "client_id": "c",
+    "source_user_id": "u",
+    "last_controller_id": "lc",
+    "last_client_id": "lcc",
+    "position": "p",
+    "trackId": "tr",
+    "isPlaying": "pl",
+    "users_count": "n",
+    "user_id": "uid",
+    "username": "un",
+    "queue": "q",
+    "messages": "m",
+    "version": "v",
+    "ops": "o",
+}
+KEYS = {code: key for key, code in KEY_CODES.items()}
+
+# Ordre des champs d'un élément de file d'attente compact
+_TRACK_FIELDS = ("id", "room_id", "music_id", "position", "user_id")
+_MUSIC_FIELDS = ("title", "artist", "duration", "cover_path")
+
+
+def negotiate_subprotocol(requested: Iterable[str]) -> Optional[str]:
+    """Retourne le sous-protocole à accepter parmi ceux proposés par le client, ou None (JSON)."""
+    if msgpack is not None and BINARY_SUBPROTOCOL in (requested or []):
+        return BINARY_SUBPROTOCOL
+    return None
+
+
+def encode_binary(message: dict) -> bytes:
+    """Encode un message du protocole des salles en MessagePack compact."""
+    return msgpack.packb(_compact_message(message), use_bin_type=True)
+
+
+def encode_binary_batch(parts: List[bytes]) -> bytes:
+    """
+    Construit un frame {"type": "batch", "messages": [...]} à partir de messages déjà encodés :
+    un tableau MessagePack n'est qu'un en-tête suivi de ses éléments.
+    """
+    packer = msgpack.Packer(use_bin_type=True)
+    head = packer.pack_map_header(2) + packer.pack("t") + packer.pack(MESSAGE_TYPE_CODES["batch"])
+    return head + packer.pack("m") + packer.pack_array_header(len(parts)) + b"".join(parts)
+
+
+def decode_binary(data: bytes) -> dict:
+    """Décode un message binaire d'un client vers le format JSON habituel."""
+    message = msgpack.unpackb(data, raw=False, strict_map_key=False)
+    if not isinstance(message, dict):
+        raise ValueError("Message binaire invalide : une map est attendue")
+    return _expand_message(message)
+
+
+def _compact_message(message: dict) -> dict:
+    compact = {}
+    for key, value in message.items():
+        if key == "type":
+            value = MESSAGE_TYPE_CODES.get(value, value)
+        elif key == "queue" and isinstance(value, list):
+            value = [_compact_track(item) for item in value]
+        elif key == "messages" and isinstance(value, list):
+            value = [_compact_message(item) for item in value]
+        elif key == "ops" and isinstance(value, list):
+            value = [_compact_op(op) for op in value]
+        compact[KEY_CODES.get(key, key)] = value
+    return compact
+
+
+def _expand_message(compact: dict) -> dict:
+    message = {}
+    for key, value in compact.items():
+        key = KEYS.get(key, key)
+        if key == "type":
+            value = MESSAGE_TYPES.get(value, value)
+        elif key == "queue" and isinstance(value, list):
+            value = [_expand_track(item) for item in value]
+        elif key == "messages" and isinstance(value, list):
+            value = [_expand_message(item) for item in value]
+        elif key == "ops" and isinstance(value, list):
+            value = [_expand_op(op) for op in value]
+        message[key] = value
+    return message
+
+
+def _compact_op(op):
+    if isinstance(op, dict) and isinstance(op.get("item"), dict):
+        return dict(op, item=_compact_track(op["item"]))
+    return op
+
+
+def _expand_op(op):
+    if isinstance(op, dict) and isinstance(op.get("item"), list):
+        return dict(op, item=_expand_track(op["item"]))
+    return op
+
+
+def _compact_track(item):
+    # Seuls les éléments au format habituel sont compactés, les autres passent tels quels
+    music = item.get("music") if isinstance(item, dict) else None
+    if (not isinstance(music, dict) or set(item) != {*_TRACK_FIELDS, "music"}
+            or set(music) != {*_MUSIC_FIELDS, "id"} or music["id"] != item["music_id"]):
+        return item
+    return [item[field] for field in _TRACK_FIELDS] + [music[field] for field in _MUSIC_FIELDS]
+
+
+def _expand_track(item):
+    if not isinstance(item, list) or len(item) != len(_TRACK_FIELDS) + len(_MUSIC_FIELDS):
+        return item
+    track = dict(zip(_TRACK_FIELDS, item))
+    track["music"] = dict(zip(_MUSIC_FIELDS, item[len(_TRACK_FIELDS):]), id=track["music_id"])
+    return track
@@ -0,0 +1,295 @@
+import asyncio
+import logging
+import os
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Awaitable, Callable, List, Optional
+
+from sqlalchemy import and_, func, or_
+from sqlalchemy.exc import IntegrityError
+
+from app.db.database import SessionLocal
+from app.models import ChatMessage as ChatMessageModel, User as UserModel
+from app.services.backplane import Backplane
+
+logger = logging.getLogger(__name__)
+
+# Délai maximal (en secondes) avant l'écriture en base des messages de chat en attente
+CHAT_FLUSH_INTERVAL = float(os.getenv("CHAT_FLUSH_INTERVAL", "0.25"))
+# Nombre de messages en attente déclenchant une écriture immédiate
+CHAT_BATCH_SIZE = int(os.getenv("CHAT_BATCH_SIZE", "100"))
+# Nombre maximal de messages conservés en mémoire si la base est indisponible
+CHAT_MAX_PENDING = int(os.getenv("CHAT_MAX_PENDING", "10000"))
+# Nombre d'identifiants réservés à la fois auprès du backplane
+CHAT_ID_BLOCK = 100
+# Nombre de messages récents gardés en mémoire par salle, servis sans accès à la base
+CHAT_RECENT_SIZE = int(os.getenv("CHAT_RECENT_SIZE", "100"))
+# Nombre maximal de salles dont les messages récents sont gardés en mémoire
+CHAT_RECENT_ROOMS = int(os.getenv("CHAT_RECENT_ROOMS", "1000"))
+
+# Longueur maximale d'un message (voir le CDC)
+MAX_MESSAGE_LENGTH = 200
+
+# Diffusion d'un message dans une salle : (room_code, message)
+BroadcastCallback = Callable[[str, dict], Awaitable[None]]
+
+
+class ChatService:
+    """
+    Chat des salles : diffusion immédiate aux membres de la salle et écriture
+    différée en base, par lots (un INSERT groupé toutes les CHAT_FLUSH_INTERVAL
+    secondes ou tous les CHAT_BATCH_SIZE messages, et à l'arrêt du serveur).
+    Les identifiants sont réservés par blocs auprès du backplane, ce qui permet
+    de les envoyer aux clients avant l'écriture, sans collision entre processus.
+    """
+
+    def __init__(
+        self,
+        broadcast: BroadcastCallback,
+        backplane: Backplane,
+        flush_interval: float = CHAT_FLUSH_INTERVAL,
+        batch_size: int = CHAT_BATCH_SIZE,
+    ):
+        self.broadcast = broadcast
+        self.backplane = backplane
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._pending: List[dict] = []
+        self._timer = None
+        self._flush_lock = asyncio.Lock()
+        self._id_lock = asyncio.Lock()
+        self._next_id = 0
+        self._last_id = -1
+        self._id_floor: Optional[int] = None
+        # Messages récents de chaque salle, noms d'utilisateur résolus {room_id: deque}
+        self._recent: "OrderedDict[int, deque]" = OrderedDict()
+
+    async def post(self, room_id: int, room_code: str, user_id: int, username: str, text: str) -> dict:
+        """
+        Publie un message dans une salle et retourne sa représentation
+        (id, room_id, user_id, username, message, sent_at).
+        Lève ValueError si le message est vide ou trop long.
+        """
+        text = (text or "").strip()
+        if not text:
+            raise ValueError("Le message ne peut pas être vide")
+        if len(text) > MAX_MESSAGE_LENGTH:
+            raise ValueError(f"Le message ne peut pas dépasser {MAX_MESSAGE_LENGTH} caractères")
+
+        row = {
+            "id": await self._allocate_id(),
+            "room_id": room_id,
+            "user_id": user_id,
+            "message": text,
+            "sent_at": datetime.utcnow(),
+            # Non écrit en base, utile à l'historique tant que le message est en attente
+            "username": username,
+        }
+        self._pending.append(row)
+        self._remember(row)
+        if len(self._pending) >= self.batch_size:
+            asyncio.create_task(self.flush())
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+
+        await self.broadcast(room_code, {
+            "type": "chat_message",
+            "message": {
+                "id": row["id"],
+                "room_id": room_id,
+                "user_id": user_id,
+                "username": username,
+                "message": text,
+                "sent_at": row["sent_at"].isoformat()
+            }
+        })
+        return row
+
+    def pending_for_room(self, room_id: int) -> List[dict]:
+        """Messages de la salle pas encore écrits en base, du plus ancien au plus récent."""
+        return [row for row in self._pending if row["room_id"] == room_id]
+
+    def observe(self, room_code: str, message: dict):
+        """Tient à jour les messages récents avec le chat publié par les autres processus."""
+        if message.get("type") != "chat_message" or not isinstance(message.get("message"), dict):
+            return
+        chat = message["message"]
+        if chat.get("room_id") in self._recent:
+            row = dict(chat)
+            if isinstance(row.get("sent_at"), str):
+                row["sent_at"] = datetime.fromisoformat(row["sent_at"])
+            self._remember(row)
+
+    async def recent(self, room_id: int, limit: int) -> List[dict]:
+        """
+        Derniers messages d'une salle, dans l'ordre chronologique.
+        Seul le premier appel pour une salle lit la base, les suivants sont servis depuis la mémoire.
+        """
+        if limit > CHAT_RECENT_SIZE:
+            return await self.history(room_id, limit)
+
+        ring = self._recent.get(room_id)
+        if ring is None:
+            rows = await asyncio.to_thread(_read_messages, room_id, CHAT_RECENT_SIZE)
+            written = {row["id"] for row in rows}
+            rows += [row for row in self.pending_for_room(room_id) if row["id"] not in written]
+            ring = deque(sorted(rows, key=_sort_key), maxlen=CHAT_RECENT_SIZE)
+            self._recent[room_id] = ring
+            while len(self._recent) > CHAT_RECENT_ROOMS:
+                self._recent.popitem(last=False)
+        self._recent.move_to_end(room_id)
+        return list(ring)[-limit:]
+
+    async def history(
+        self, room_id: int, limit: int, before_id: Optional[int] = None, before_ts: Optional[datetime] = None
+    ) -> List[dict]:
+        """
+        Page de l'historique plus ancienne que le curseur (before_ts, before_id),
+        dans l'ordre chronologique. Parcours de l'index (room_id, sent_at, id) : O(page).
+        """
+        return await asyncio.to_thread(_read_messages, room_id, limit, before_id, before_ts)
+
+    def _remember(self, row: dict):
+        ring = self._recent.get(row["room_id"])
+        if ring is None or any(existing["id"] == row["id"] for existing in ring):
+            return
+        if ring and _sort_key(row) < _sort_key(ring[-1]):
+            # Message arrivé en retard d'un autre processus : le remettre à sa place
+            ring.append(row)
+            ordered = sorted(ring, key=_sort_key)
+            ring.clear()
+            ring.extend(ordered)
+        else:
+            ring.append(row)
+
+    async def flush(self):
+        """Écrit en base, en un seul INSERT groupé, tous les messages en attente."""
+        if self._timer is not None and self._timer is not asyncio.current_task():
+            self._timer.cancel()
+        self._timer = None
+
+        async with self._flush_lock:
+            rows, self._pending = self._pending, []
+            if not rows:
+                return
+            try:
+                await asyncio.to_thread(_insert_messages, rows)
+                logger.debug(f"{len(rows)} message(s) de chat écrit(s) en base")
+            except IntegrityError as e:
+                # Une ligne invalide (salle ou utilisateur supprimé) ne doit pas bloquer tout le lot
+                logger.warning(f"Lot de messages de chat refusé, écriture message par message: {str(e)}")
+                await asyncio.to_thread(_insert_messages_one_by_one, rows)
+            except Exception as e:
+                logger.error(f"Erreur lors de l'écriture de {len(rows)} message(s) de chat: {str(e)}")
+                # Réessayer au prochain lot, sans laisser la mémoire grossir indéfiniment
+                self._pending = (rows + self._pending)[-CHAT_MAX_PENDING:]
+                if self._timer is None:
+                    self._timer = asyncio.create_task(self._flush_later())
+
+    async def close(self):
+        """Arrêt du serveur : écrire les derniers messages."""
+        await self.flush()
+
+    async def _flush_later(self):
+        try:
+            await asyncio.sleep(self.flush_interval)
+        except asyncio.CancelledError:
+            return
+        self._timer = None
+        await self.flush()
+
+    async def _allocate_id(self) -> int:
+        async with self._id_lock:
+            if self._next_id > self._last_id:
+                if self._id_floor is None:
+                    # Les identifiants doivent dépasser ceux déjà présents en base
+                    self._id_floor = await asyncio.to_thread(_max_message_id)
+                self._last_id = await self.backplane.allocate_ids("chat_message", CHAT_ID_BLOCK, self._id_floor)
+                self._next_id = self._last_id - CHAT_ID_BLOCK + 1
+            message_id = self._next_id
+            self._next_id += 1
+            return message_id
+
+
+# Accès à la base, bloquant : à appeler hors de la boucle d'événements
+
+def _insert_messages(rows: List[dict]):
+    db = SessionLocal()
+    try:
+        db.bulk_insert_mappings(ChatMessageModel, [
+            {key: value for key, value in row.items() if key != "username"} for row in rows
+        ])
+        db.commit()
+    finally:
+        db.close()
+
+
+def _insert_messages_one_by_one(rows: List[dict]):
+    for row in rows:
+        try:
+            _insert_messages([row])
+        except IntegrityError as e:
+            logger.error(f"Message de chat {row['id']} abandonné: {str(e)}")
+
+
+def _sort_key(row: dict):
+    return (row["sent_at"], row["id"])
+
+
+def _read_messages(
+    room_id: int, limit: int, before_id: Optional[int] = None, before_ts: Optional[datetime] = None
+) -> List[dict]:
+    """Messages d'une salle avec le nom de leur auteur, les plus récents avant le curseur."""
+    db = SessionLocal()
+    try:
+        query = db.query(
+            ChatMessageModel, UserModel.username
+        ).join(
+            UserModel, ChatMessageModel.user_id == UserModel.id
+        ).filter(
+            ChatMessageModel.room_id == room_id
+        )
+        if before_ts is not None and before_id is not None:
+            query = query.filter(or_(
+                ChatMessageModel.sent_at < before_ts,
+                and_(ChatMessageModel.sent_at == before_ts, ChatMessageModel.id < before_id)
+            ))
+        elif before_ts is not None:
+            query = query.filter(ChatMessageModel.sent_at < before_ts)
+        elif before_id is not None:
+            # Curseur sans date : celle du message de référence
+            cursor = db.query(ChatMessageModel.sent_at).filter(ChatMessageModel.id == before_id).scalar()
+            if cursor is None:
+                return []
+            query = query.filter(or_(
+                ChatMessageModel.sent_at < cursor,
+                and_(ChatMessageModel.sent_at == cursor, ChatMessageModel.id < before_id)
+            ))
+
+        messages = query.order_by(
+            ChatMessageModel.sent_at.desc(), ChatMessageModel.id.desc()
+        ).limit(limit).all()
+
+        result = [
+            {
+                "id": message.id,
+                "room_id": message.room_id,
+                "user_id": message.user_id,
+                "username": username,
+                "message": message.message,
+                "sent_at": message.sent_at
+            } for message, username in messages
+        ]
+        # Ordre chronologique
+        result.reverse()
+        return result
+    finally:
+        db.close()
+
+
+def _max_message_id() -> int:
+    db = SessionLocal()
+    try:
+        return db.query(func.max(ChatMessageModel.id)).scalar() or 0
+    finally:
+        db.close()
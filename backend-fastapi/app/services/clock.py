@@ -0,0 +1,79 @@
+import os
+import time
+from collections import deque
+from typing import Optional
+
+# Écart de position (en secondes) toléré avant de corriger un client
+SYNC_DRIFT_TOLERANCE = float(os.getenv("SYNC_DRIFT_TOLERANCE", "1.0"))
+# Nombre d'échanges d'horloge conservés par client
+CLOCK_SAMPLES = 8
+# Délai (en secondes) accordé au client désigné pour donner l'état de lecture d'une salle
+PLAYBACK_STATE_TIMEOUT = float(os.getenv("PLAYBACK_STATE_TIMEOUT", "2.0"))
+
+
+def anchor(state: dict, position: float, is_playing: bool):
+    """
+    Ancre l'horloge de lecture d'une salle : la position courante se déduit ensuite
+    de la position d'ancrage et du temps écoulé depuis l'ancrage.
+    `position` reste la position d'ancrage pour les clients existants.
+    """
+    state["position"] = float(position or 0)
+    state["isPlaying"] = bool(is_playing)
+    state["anchor_time"] = time.monotonic()
+    # Heure murale de l'ancrage, seule valeur comparable entre processus
+    state["anchor_wall_time"] = time.time()
+
+
+def current_position(state: dict, now: Optional[float] = None) -> float:
+    """Calcule la position de lecture actuelle d'une salle à partir de son ancrage."""
+    position = float(state.get("position") or 0)
+    if not state.get("isPlaying") or "anchor_time" not in state:
+        return position
+    now = time.monotonic() if now is None else now
+    return position + max(0.0, now - state["anchor_time"])
+
+
+def rebase(state: dict) -> dict:
+    """
+    Recalcule l'ancrage monotone d'un état venant d'un autre processus
+    (Redis, instantané), dont l'horloge monotone n'est pas comparable à la nôtre.
+    """
+    if "anchor_wall_time" in state:
+        elapsed = max(0.0, time.time() - state["anchor_wall_time"])
+        state["anchor_time"] = time.monotonic() - elapsed
+    return state
+
+
+class ClockEstimator:
+    """
+    Estimation du décalage d'horloge et de la latence d'un client, à la manière de NTP.
+    Le client envoie t0, le serveur répond avec t1 (réception) et t2 (envoi),
+    le client note t3 à la réception et calcule :
+        offset = ((t1 - t0) + (t2 - t3)) / 2   (heure serveur - heure client)
+        rtt    = (t3 - t0) - (t2 - t1)
+    Parmi les derniers échantillons, celui de plus faible RTT est le plus fiable.
+    """
+
+    def __init__(self, size: int = CLOCK_SAMPLES):
+        self._samples = deque(maxlen=size)
+
+    def add_sample(self, offset: float, rtt: float):
+        if rtt is None or rtt < 0:
+            return
+        self._samples.append((float(rtt), float(offset)))
+
+    @property
+    def ready(self) -> bool:
+        return bool(self._samples)
+
+    @property
+    def rtt(self) -> Optional[float]:
+        return min(self._samples)[0] if self._samples else None
+
+    @property
+    def offset(self) -> Optional[float]:
+        return min(self._samples)[1] if self._samples else None
+
+    def to_server_time(self, client_time: float) -> float:
+        """Convertit une heure du client en heure du serveur."""
+        return client_time + (self.offset or 0.0)
@@ -0,0 +1,143 @@
+"""
+Traitement des covers : miniatures de quelques tailles fixes (WebP) et une image de
+référence (JPEG), plus la palette des couleurs dominantes, calculées une seule fois
+côté serveur au lieu d'être décodées par chaque navigateur.
+
+Reprise des covers existantes, depuis backend-fastapi/ :
+
+    python -m app.services.covers
+"""
+
+import argparse
+import logging
+import os
+from io import BytesIO
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import requests
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Qualité (0-100) des miniatures WebP
+COVER_WEBP_QUALITY = int(os.getenv("COVER_WEBP_QUALITY", "80"))
+# Délai (en secondes) de téléchargement d'une miniature distante
+COVER_DOWNLOAD_TIMEOUT = float(os.getenv("COVER_DOWNLOAD_TIMEOUT", "10"))
+
+COVER_STORAGE_PATH = Path("/app/storage/covers")
+COVER_URL_PREFIX = "/storage/covers"
+# Côtés (en pixels) des miniatures carrées : file d'attente, résultats, lecteur (écrans haute densité)
+COVER_SIZES = (128, 320, 640)
+# Nombre de couleurs de la palette
+PALETTE_SIZE = 5
+# Côté de l'image réduite dont la palette est extraite
+PALETTE_SAMPLE_SIZE = 64
+# Taille maximale d'une image téléchargée
+MAX_COVER_BYTES = 10 * 1024 * 1024
+
+
+def process_cover(data: bytes, name: str) -> Dict[str, str]:
+    """
+    Génère les miniatures et la palette d'une image (bloquant) dans COVER_STORAGE_PATH/name.
+    Retourne les valeurs de music.cover_path et music.cover_palette. Lève OSError si l'image est illisible.
+    """
+    image = Image.open(BytesIO(data))
+    # Les JPEG sont décodés directement à une taille réduite (bien plus rapide sur les grandes images)
+    image.draft("RGB", (COVER_SIZES[-1], COVER_SIZES[-1]))
+    image = ImageOps.exif_transpose(image).convert("RGB")
+
+    directory = COVER_STORAGE_PATH / name
+    directory.mkdir(parents=True, exist_ok=True)
+    largest = None
+    for size in sorted(COVER_SIZES, reverse=True):
+        # Chaque taille est réduite depuis la précédente, recadrée au centre
+        largest = ImageOps.fit(largest or image, (size, size), Image.Resampling.LANCZOS)
+        largest.save(directory / f"{size}.webp", "WEBP", quality=COVER_WEBP_QUALITY, method=4)
+        if size == COVER_SIZES[-1]:
+            largest.save(directory / "cover.jpg", "JPEG", quality=85, optimize=True, progressive=True)
+
+    return {
+        "cover_path": f"{COVER_URL_PREFIX}/{name}/cover.jpg",
+        "cover_palette": ",".join(dominant_colors(image)),
+    }
+
+
+def dominant_colors(image: Image.Image, count: int = PALETTE_SIZE) -> List[str]:
+    """
+    Couleurs dominantes ("#rrggbb"), de la plus présente à la moins présente.
+    La quantification (octree) est faite par Pillow en C sur une image réduite.
+    """
+    sample = image.convert("RGB")
+    sample.thumbnail((PALETTE_SAMPLE_SIZE, PALETTE_SAMPLE_SIZE))
+    quantized = sample.quantize(colors=count, method=Image.Quantize.FASTOCTREE)
+    palette = quantized.getpalette()
+    colors = sorted(quantized.getcolors(), reverse=True)
+    return ["#{:02x}{:02x}{:02x}".format(*palette[index * 3:index * 3 + 3]) for _, index in colors]
+
+
+def cover_thumbnails(cover_path: Optional[str]) -> Dict[str, str]:
+    """URLs des miniatures {côté: url} d'une cover traitée par process_cover, {} sinon."""
+    if not cover_path or not cover_path.startswith(f"{COVER_URL_PREFIX}/"):
+        return {}
+    base = cover_path.rsplit("/", 1)[0]
+    return {str(size): f"{base}/{size}.webp" for size in COVER_SIZES}
+
+
+def fetch_cover(url: str) -> bytes:
+    """Télécharge une image distante (bloquant). Lève requests.RequestException ou ValueError."""
+    with requests.get(url, timeout=COVER_DOWNLOAD_TIMEOUT, stream=True) as response:
+        response.raise_for_status()
+        data = bytearray()
+        for chunk in response.iter_content(64 * 1024):
+            data += chunk
+            if len(data) > MAX_COVER_BYTES:
+                raise ValueError(f"Image trop volumineuse (maximum {MAX_COVER_BYTES} octets)")
+    return bytes(data)
+
+
+def update_music_cover(db, music, data: bytes) -> bool:
+    """Traite l'image et l'enregistre comme cover de la musique (bloquant). Retourne False si elle est illisible."""
+    try:
+        cover = process_cover(data, str(music.id))
+    except OSError as e:
+        logger.warning(f"Cover illisible pour la musique {music.id}: {str(e)}")
+        return False
+    music.cover_path = cover["cover_path"]
+    music.cover_palette = cover["cover_palette"]
+    db.commit()
+    return True
+
+
+def backfill_covers() -> int:
+    """Traite les covers enregistrées avant ce pipeline (fichier unique, sans palette). Bloquant."""
+    from app.db.database import SessionLocal
+    from app.models import Music as MusicModel
+
+    processed = 0
+    db = SessionLocal()
+    try:
+        musics = db.query(MusicModel).filter(MusicModel.cover_path.isnot(None), MusicModel.cover_palette.is_(None)).all()
+        for music in musics:
+            source = Path("/app") / music.cover_path.lstrip("/")
+            try:
+                data = source.read_bytes()
+            except OSError as e:
+                logger.warning(f"Cover introuvable pour la musique {music.id}: {str(e)}")
+                continue
+            if update_music_cover(db, music, data):
+                processed += 1
+    finally:
+        db.close()
+    return processed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Génère miniatures et palettes des covers existantes")
+    parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    print(f"{backfill_covers()} cover(s) traitée(s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# Nombre de téléchargements (yt-dlp + ffmpeg) exécutés en parallèle
+DOWNLOAD_WORKERS = int(os.getenv("DOWNLOAD_WORKERS", "2"))
+# Intervalle minimal (en secondes) entre deux notifications de progression d'un téléchargement
+DOWNLOAD_PROGRESS_INTERVAL = float(os.getenv("DOWNLOAD_PROGRESS_INTERVAL", "0.5"))
+# Durée (en secondes) pendant laquelle un téléchargement terminé reste consultable
+DOWNLOAD_JOB_TTL = int(os.getenv("DOWNLOAD_JOB_TTL", "3600"))
+
+# Progression reçue de yt-dlp (progress_hooks et postprocessor_hooks), appelée depuis le thread du téléchargement
+ProgressCallback = Callable[[dict], None]
+# Téléchargement bloquant : (source_url, user_id, progress) -> id de la musique créée
+Downloader = Callable[[str, int, ProgressCallback], int]
+# Diffusion d'un message dans une salle : (room_code, message)
+BroadcastCallback = Callable[[str, dict], Awaitable[None]]
+
+# États d'un téléchargement
+QUEUED = "queued"
+DOWNLOADING = "downloading"
+PROCESSING = "processing"
+DONE = "done"
+ERROR = "error"
+
+
+class DownloadJobs:
+    """
+    Téléchargements en arrière-plan : la requête HTTP reçoit tout de suite un
+    identifiant de tâche et le téléchargement s'exécute dans un pool de threads borné.
+    La progression est diffusée dans la salle à l'origine de la demande
+    (message "download_progress") et consultable via get().
+    """
+
+    def __init__(
+        self,
+        downloader: Downloader,
+        broadcast: Optional[BroadcastCallback] = None,
+        workers: int = DOWNLOAD_WORKERS,
+    ):
+        self.downloader = downloader
+        self.broadcast = broadcast
+        self.workers = workers
+        self.jobs: Dict[str, dict] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._tasks: Dict[str, asyncio.Task] = {}
+        # Dernière notification envoyée pour chaque tâche {job_id: time.monotonic()}
+        self._notified_at: Dict[str, float] = {}
+        # Tâche de chaque média {source_key: job_id}, partagée par les demandes identiques
+        self._by_key: Dict[str, str] = {}
+        # Salles à informer de la progression de chaque tâche {job_id: {room_code}}
+        self._rooms: Dict[str, Set[str]] = {}
+
+    def submit(self, source_url: str, user_id: int, room_code: Optional[str] = None,
+               source_key: Optional[str] = None) -> dict:
+        """
+        Met un téléchargement en file d'attente et retourne sa tâche.
+        Si le même média (source_key) est déjà en cours ou vient d'être téléchargé,
+        la tâche existante est retournée et la salle est ajoutée à ses destinataires.
+        """
+        self._purge()
+        existing = self.jobs.get(self._by_key.get(source_key)) if source_key else None
+        if existing is not None and existing["status"] != ERROR:
+            if room_code and room_code not in self._rooms[existing["id"]]:
+                self._rooms[existing["id"]].add(room_code)
+                asyncio.create_task(self._notify(dict(existing), {room_code}))
+            return existing
+
+        job = {
+            "id": uuid.uuid4().hex,
+            "status": QUEUED,
+            "source_url": source_url,
+            "source_key": source_key,
+            "room_code": room_code,
+            "title": None,
+            "progress": 0.0,
+            "downloaded_bytes": 0,
+            "total_bytes": None,
+            "speed": None,
+            "eta": None,
+            "music_id": None,
+            "error": None,
+            "created_at": time.time(),
+            "finished_at": None,
+        }
+        self.jobs[job["id"]] = job
+        self._rooms[job["id"]] = {room_code} if room_code else set()
+        if source_key:
+            self._by_key[source_key] = job["id"]
+        self._tasks[job["id"]] = asyncio.create_task(self._run(job, user_id))
+        return job
+
+    def get(self, job_id: str) -> Optional[dict]:
+        return self.jobs.get(job_id)
+
+    async def _run(self, job: dict, user_id: int):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="download")
+        loop = asyncio.get_running_loop()
+
+        def progress(event: dict):
+            # Appelé depuis le thread du téléchargement : l'état est mis à jour dans la boucle
+            loop.call_soon_threadsafe(self._on_progress, job, event)
+
+        await self._notify(dict(job))
+        try:
+            job["music_id"] = await loop.run_in_executor(
+                self._executor, self.downloader, job["source_url"], user_id, progress
+            )
+            job["status"] = DONE
+            job["progress"] = 100.0
+        except Exception as e:
+            logger.error(f"Échec du téléchargement {job['id']} ({job['source_url']}): {str(e)}")
+            job["status"] = ERROR
+            job["error"] = str(e)
+        finally:
+            job["finished_at"] = time.time()
+            self._tasks.pop(job["id"], None)
+        await self._notify(dict(job))
+
+    def _on_progress(self, job: dict, event: dict):
+        if job["status"] in (DONE, ERROR):
+            return
+        previous = job["status"]
+        info = event.get("info_dict") or {}
+        if info.get("title"):
+            job["title"] = info["title"]
+
+        if "postprocessor" in event:
+            # Conversion en MP3 par ffmpeg
+            job["status"] = PROCESSING
+        elif event.get("status") == "downloading":
+            job["status"] = DOWNLOADING
+            downloaded = event.get("downloaded_bytes") or 0
+            total = event.get("total_bytes") or event.get("total_bytes_estimate")
+            job["downloaded_bytes"] = downloaded
+            job["total_bytes"] = total
+            job["speed"] = event.get("speed")
+            job["eta"] = event.get("eta")
+            if total:
+                job["progress"] = round(min(downloaded / total, 1.0) * 100, 1)
+        elif event.get("status") == "finished":
+            job["status"] = PROCESSING
+            job["progress"] = 100.0
+
+        # Les changements d'état sont toujours notifiés, la progression au plus tous les intervalles
+        if (job["status"] != previous
+                or time.monotonic() - self._notified_at.get(job["id"], 0) >= DOWNLOAD_PROGRESS_INTERVAL):
+            self._notified_at[job["id"]] = time.monotonic()
+            # Copie : l'état peut encore changer avant l'envoi
+            asyncio.create_task(self._notify(dict(job)))
+
+    async def _notify(self, job: dict, rooms: Optional[Set[str]] = None):
+        if self.broadcast is None:
+            return
+        self._notified_at[job["id"]] = time.monotonic()
+        for room_code in list(rooms if rooms is not None else self._rooms.get(job["id"], ())):
+            try:
+                await self.broadcast(room_code, {"type": "download_progress", "job": job})
+            except Exception as e:
+                logger.warning(f"Impossible de notifier la progression du téléchargement {job['id']}: {str(e)}")
+
+    def _purge(self):
+        """Oublie les tâches terminées depuis plus de DOWNLOAD_JOB_TTL secondes."""
+        limit = time.time() - DOWNLOAD_JOB_TTL
+        for job_id, job in list(self.jobs.items()):
+            if job["finished_at"] is not None and job["finished_at"] < limit:
+                del self.jobs[job_id]
+                self._notified_at.pop(job_id, None)
+                self._rooms.pop(job_id, None)
+                if self._by_key.get(job["source_key"]) == job_id:
+                    del self._by_key[job["source_key"]]
+
+    async def close(self):
+        """Arrêt du serveur : les téléchargements en cours sont abandonnés."""
+        for task in list(self._tasks.values()):
+            task.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,165 @@
+import asyncio
+import logging
+import os
+from collections import deque
+from typing import Callable, Optional
+
+from fastapi import WebSocket
+
+from app.services.serialization import OutboundMessage
+
+logger = logging.getLogger(__name__)
+
+# Taille maximale de la file d'envoi de chaque connexion
+SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "64"))
+# Délai maximal (en secondes) accordé à un envoi avant d'évincer le client
+SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "5"))
+
+# Messages de lecture dont seule la dernière version a de l'intérêt :
+# une version plus récente remplace celle encore en attente d'envoi
+COALESCABLE_TYPES = {"playback_update", "sync", "seek"}
+
+
+class ConnectionSender:
+    """
+    Expéditeur dédié à une connexion WebSocket.
+    Chaque connexion possède sa propre file d'envoi bornée et sa propre tâche
+    d'envoi, de sorte qu'un client lent ne retarde jamais les autres membres de la salle.
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        room_code: str,
+        user_id: int,
+        on_evict: Optional[Callable[["ConnectionSender"], None]] = None,
+        max_pending: int = SEND_QUEUE_SIZE,
+        send_timeout: float = SEND_TIMEOUT,
+    ):
+        self.websocket = websocket
+        self.room_code = room_code
+        self.user_id = user_id
+        self.max_pending = max_pending
+        self.send_timeout = send_timeout
+        self.closed = False
+        # Le client accepte les lots de messages dans un seul frame
+        self.supports_batch = False
+        # Le client applique les opérations de file d'attente versionnées
+        self.supports_queue_deltas = False
+        # Le client a négocié le sous-protocole binaire (MessagePack)
+        self.binary = False
+        # Nombre de messages de lecture remplacés avant d'avoir été envoyés
+        self.coalesced = 0
+        self._on_evict = on_evict
+        self._pending = deque()
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def start(self):
+        """Démarre la tâche d'envoi de la connexion."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        """Arrête la tâche d'envoi et abandonne les messages en attente."""
+        self.closed = True
+        self._pending.clear()
+        if self._task is not None and self._task is not asyncio.current_task():
+            self._task.cancel()
+        self._task = None
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    def push(self, message) -> bool:
+        """
+        Ajoute un message (dict ou OutboundMessage déjà encodé) à la file d'envoi
+        sans jamais bloquer.
+        Retourne False si la connexion est fermée ou vient d'être évincée.
+        """
+        if self.closed:
+            return False
+
+        if not isinstance(message, OutboundMessage):
+            message = OutboundMessage(message)
+
+        if message.type in COALESCABLE_TYPES:
+            self._drop_pending_type(message.type)
+
+        if len(self._pending) >= self.max_pending:
+            # Libérer de la place en sacrifiant le plus ancien message de lecture
+            if not self._drop_oldest_coalescable():
+                logger.warning(
+                    f"File d'envoi saturée pour l'utilisateur {self.user_id} "
+                    f"dans la salle {self.room_code}, éviction du client"
+                )
+                self._evict()
+                return False
+
+        self._pending.append(message)
+        self._wakeup.set()
+        return True
+
+    def _drop_pending_type(self, msg_type: str):
+        """Retire de la file les messages de lecture du même type, devenus obsolètes."""
+        before = len(self._pending)
+        if before:
+            self._pending = deque(m for m in self._pending if m.type != msg_type)
+            self.coalesced += before - len(self._pending)
+
+    def _drop_oldest_coalescable(self) -> bool:
+        for index, pending in enumerate(self._pending):
+            if pending.type in COALESCABLE_TYPES:
+                del self._pending[index]
+                self.coalesced += 1
+                return True
+        return False
+
+    async def _run(self):
+        try:
+            while not self.closed:
+                if not self._pending:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+
+                message = self._pending.popleft()
+                try:
+                    await asyncio.wait_for(self._send(message), timeout=self.send_timeout)
+                except asyncio.TimeoutError:
+                    logger.warning(
+                        f"Envoi bloqué depuis plus de {self.send_timeout}s pour l'utilisateur "
+                        f"{self.user_id} dans la salle {self.room_code}, éviction du client"
+                    )
+                    self._evict()
+                except Exception as e:
+                    logger.error(
+                        f"Erreur lors de l'envoi du message à l'utilisateur {self.user_id} "
+                        f"dans la salle {self.room_code}: {str(e)}"
+                    )
+                    self._evict()
+        except asyncio.CancelledError:
+            pass
+
+    async def _send(self, message: OutboundMessage):
+        if self.binary:
+            await self.websocket.send_bytes(message.binary)
+        else:
+            await self.websocket.send_text(message.text)
+
+    def _evict(self):
+        """Ferme la connexion d'un client qui ne suit plus le rythme de la salle."""
+        if self.closed:
+            return
+        self.stop()
+        if self._on_evict:
+            self._on_evict(self)
+        asyncio.create_task(self._close_websocket())
+
+    async def _close_websocket(self):
+        try:
+            # 1013 : "Try Again Later", le client peut se reconnecter
+            await asyncio.wait_for(self.websocket.close(code=1013), timeout=self.send_timeout)
+        except Exception:
+            pass
@@ -0,0 +1,221 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Mapping, Optional, Tuple
+from urllib.parse import quote
+
+from fastapi.responses import Response
+
+from app.services.streaming import (
+    audio_file_response,
+    audio_headers,
+    audio_media_type,
+    if_range_matches,
+    is_not_modified,
+)
+
+logger = logging.getLogger(__name__)
+
+# Mémoire (en Mio) consacrée aux pistes gardées en mémoire, 0 pour désactiver
+HOT_TRACK_CACHE_MB = int(os.getenv("HOT_TRACK_CACHE_MB", "256"))
+# Taille maximale (en Mio) d'une piste gardée en mémoire, les plus grosses sont lues sur le disque
+HOT_TRACK_MAX_FILE_MB = int(os.getenv("HOT_TRACK_MAX_FILE_MB", "32"))
+# Délai (en secondes) pendant lequel les métadonnées d'un fichier sont réutilisées sans stat()
+HOT_TRACK_STAT_TTL = float(os.getenv("HOT_TRACK_STAT_TTL", "1"))
+
+# Taille des blocs envoyés au serveur ASGI depuis la mémoire
+CHUNK_SIZE = 256 * 1024
+# Nombre de fichiers au-delà duquel les métadonnées expirées sont oubliées
+STAT_CACHE_SIZE = 4096
+
+
+class MemoryAudioResponse(Response):
+    """Corps (entier ou une plage) servi depuis un tampon partagé, sans accès disque."""
+
+    def __init__(self, buffer: bytes, start: int, end: int, status_code: int, headers: Dict[str, str],
+                 media_type: str, on_body=None):
+        super().__init__(status_code=status_code, headers=headers, media_type=media_type)
+        self.buffer = buffer
+        self.start = start
+        self.end = end
+        self.on_body = on_body
+        self.headers["content-length"] = str(end - start)
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"].upper() == "HEAD" or self.start == self.end:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        view = memoryview(self.buffer)
+        position = self.start
+        while position < self.end:
+            chunk = bytes(view[position:min(position + CHUNK_SIZE, self.end)])
+            position += len(chunk)
+            await send({"type": "http.response.body", "body": chunk, "more_body": position < self.end})
+            if self.on_body is not None:
+                self.on_body(len(chunk))
+
+
+class HotTrackCache:
+    """
+    Pistes populaires servies depuis la mémoire : au changement de piste d'une salle,
+    tous les auditeurs demandent le même fichier au même instant. Le premier accès
+    lit le fichier une seule fois (les lectures simultanées du même fichier attendent
+    cette lecture), puis les requêtes suivantes, Range compris, sont servies depuis
+    le même tampon. La mémoire est bornée (HOT_TRACK_CACHE_MB), avec éviction LRU.
+    """
+
+    def __init__(self, budget_bytes: int = HOT_TRACK_CACHE_MB * 1024 * 1024,
+                 max_file_bytes: int = HOT_TRACK_MAX_FILE_MB * 1024 * 1024):
+        self.budget_bytes = budget_bytes
+        self.max_file_bytes = max_file_bytes
+        # {chemin: (etag, contenu)}, du moins au plus récemment utilisé
+        self._entries: "OrderedDict[str, Tuple[str, bytes]]" = OrderedDict()
+        self._resident_bytes = 0
+        # Lectures en cours {(chemin, etag): future}
+        self._loading: Dict[Tuple[str, str], asyncio.Future] = {}
+        # Métadonnées récentes {chemin: (stat, expiration)}
+        self._stats: Dict[str, Tuple[os.stat_result, float]] = {}
+        self._metrics = {
+            "memory_hits": 0,
+            "disk_loads": 0,
+            "coalesced_loads": 0,
+            "disk_fallbacks": 0,
+            "evictions": 0,
+            "bytes_from_memory": 0,
+            "bytes_from_disk": 0,
+        }
+
+    async def response(self, path: Path, request_headers: Mapping[str, str]) -> Response:
+        """Réponse de lecture du fichier, depuis la mémoire si possible. Lève FileNotFoundError."""
+        stat_result = await self._stat(path)
+        headers = audio_headers(stat_result)
+        if is_not_modified(request_headers, headers["ETag"], stat_result):
+            return Response(status_code=304, headers=headers)
+
+        size = stat_result.st_size
+        byte_range = (0, size)
+        # Range ignoré si If-Range désigne une autre version du fichier
+        http_range = request_headers.get("range")
+        if http_range is not None and not if_range_matches(request_headers, headers):
+            http_range = None
+        if http_range is not None:
+            byte_range = _parse_single_range(http_range, size)
+
+        if byte_range is None or self.budget_bytes <= 0 or size > min(self.max_file_bytes, self.budget_bytes):
+            # Plages multiples ou invalides, gros fichiers : FileResponse lit le disque
+            self._metrics["disk_fallbacks"] += 1
+            return audio_file_response(path, request_headers, stat_result, on_body=self._count_disk)
+
+        buffer = await self._load(str(path), headers["ETag"])
+        start, end = byte_range
+        headers["Content-Disposition"] = _inline_disposition(path.name)
+        if http_range is None:
+            status_code = 200
+        else:
+            status_code = 206
+            headers["Content-Range"] = f"bytes {start}-{end - 1}/{size}"
+        return MemoryAudioResponse(buffer, start, end, status_code, headers, audio_media_type(path), self._count_memory)
+
+    async def _stat(self, path: Path) -> os.stat_result:
+        key = str(path)
+        now = time.monotonic()
+        cached = self._stats.get(key)
+        if cached is not None and cached[1] > now:
+            return cached[0]
+        stat_result = await asyncio.to_thread(path.stat)
+        if len(self._stats) >= STAT_CACHE_SIZE:
+            self._stats = {k: v for k, v in self._stats.items() if v[1] > now}
+        self._stats[key] = (stat_result, now + HOT_TRACK_STAT_TTL)
+        return stat_result
+
+    async def _load(self, key: str, etag: str) -> bytes:
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == etag:
+            self._entries.move_to_end(key)
+            self._metrics["memory_hits"] += 1
+            return entry[1]
+
+        future = self._loading.get((key, etag))
+        if future is not None:
+            self._metrics["coalesced_loads"] += 1
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._loading[(key, etag)] = future
+        try:
+            data = await asyncio.to_thread(Path(key).read_bytes)
+            self._metrics["disk_loads"] += 1
+            self._store(key, etag, data)
+            future.set_result(data)
+            return data
+        except Exception as e:
+            future.set_exception(e)
+            # L'erreur est remontée à chaque appelant : éviter l'avertissement « never retrieved »
+            future.exception()
+            raise
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        finally:
+            del self._loading[(key, etag)]
+
+    def _store(self, key: str, etag: str, data: bytes):
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._resident_bytes -= len(previous[1])
+        self._entries[key] = (etag, data)
+        self._resident_bytes += len(data)
+        while self._resident_bytes > self.budget_bytes and len(self._entries) > 1:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self._resident_bytes -= len(evicted)
+            self._metrics["evictions"] += 1
+
+    def _count_memory(self, size: int):
+        self._metrics["bytes_from_memory"] += size
+
+    def _count_disk(self, size: int):
+        self._metrics["bytes_from_disk"] += size
+
+    def metrics(self) -> dict:
+        """Statistiques : octets servis depuis la mémoire et depuis le disque, occupation du cache."""
+        served = self._metrics["bytes_from_memory"] + self._metrics["bytes_from_disk"]
+        return dict(
+            self._metrics,
+            memory_ratio=round(self._metrics["bytes_from_memory"] / served, 4) if served else 0.0,
+            entries=len(self._entries),
+            resident_bytes=self._resident_bytes,
+            budget_bytes=self.budget_bytes,
+        )
+
+
+def _parse_single_range(http_range: str, size: int) -> Optional[Tuple[int, int]]:
+    """Plage [début, fin) d'un en-tête "bytes=a-b", "bytes=a-" ou "bytes=-n", None sinon."""
+    units, _, spec = http_range.partition("=")
+    if units.strip().lower() != "bytes" or "," in spec or "-" not in spec:
+        return None
+    start_text, _, end_text = spec.strip().partition("-")
+    try:
+        if not start_text:
+            length = int(end_text)
+            if length <= 0:
+                return None
+            return (max(size - length, 0), size)
+        start = int(start_text)
+        end = min(int(end_text) + 1, size) if end_text else size
+    except ValueError:
+        return None
+    if not 0 <= start < end:
+        return None
+    return (start, end)
+
+
+def _inline_disposition(filename: str) -> str:
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"inline; filename*=utf-8''{quoted}"
+    return f'inline; filename="{filename}"'
@@ -0,0 +1,273 @@
+"""
+Import en masse d'une collection audio existante.
+
+Parcourt une arborescence, extrait empreintes, tags et durées dans un pool de
+processus et écrit les musiques en base par lots. Les fichiers déjà connus
+(même empreinte) sont ignorés, et chaque import tient un point de reprise :
+relancé après une interruption, il ne relit que les fichiers pas encore traités.
+
+Depuis backend-fastapi/ :
+
+    python -m app.services.library_import /chemin/vers/la/collection
+    python -m app.services.library_import /chemin/vers/la/collection --copy --workers 8
+"""
+
+import argparse
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+import os
+import shutil
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from sqlalchemy.exc import IntegrityError
+
+from app.db.database import SessionLocal
+from app.models import Music as MusicModel
+from app.services.audio_metadata import AUDIO_EXTENSIONS, probe_audio_file
+
+logger = logging.getLogger(__name__)
+
+# Dossier sous lequel l'API accepte d'importer (l'outil en ligne de commande accepte tout chemin)
+IMPORT_ROOT = Path(os.getenv("IMPORT_ROOT", "/app/storage/import"))
+# Nombre de processus d'analyse des fichiers
+IMPORT_WORKERS = int(os.getenv("IMPORT_WORKERS", str(os.cpu_count() or 2)))
+# Nombre de musiques écrites en base par INSERT groupé
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "500"))
+# Points de reprise des imports
+IMPORT_STATE_DIR = Path("/app/storage/imports")
+APP_ROOT = Path("/app")
+AUDIO_STORAGE_PATH = APP_ROOT / "storage" / "audio"
+
+
+def scan_audio_files(root: Path) -> Iterator[Tuple[str, int, float]]:
+    """Fichiers audio de l'arborescence : (chemin, taille, date de modification), dans un ordre stable."""
+    directories = [root]
+    while directories:
+        directory = directories.pop()
+        try:
+            entries = sorted(os.scandir(directory), key=lambda entry: entry.name)
+        except OSError as e:
+            logger.warning(f"Dossier illisible ignoré ({directory}): {str(e)}")
+            continue
+        subdirectories = []
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                subdirectories.append(entry.path)
+            elif entry.is_file() and os.path.splitext(entry.name)[1].lower() in AUDIO_EXTENSIONS:
+                stat_result = entry.stat()
+                yield entry.path, stat_result.st_size, stat_result.st_mtime
+        directories.extend(reversed(subdirectories))
+
+
+class ImportCheckpoint:
+    """Fichiers déjà traités par un import (chemin, taille, date), ajoutés après chaque lot écrit en base."""
+
+    def __init__(self, root: Path, directory: Path = IMPORT_STATE_DIR):
+        self.path = directory / f"{hashlib.sha1(str(root).encode('utf-8')).hexdigest()}.tsv"
+
+    def load(self) -> Dict[str, Tuple[int, float]]:
+        done = {}
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    parts = line.rstrip("\n").rsplit("\t", 2)
+                    if len(parts) == 3:
+                        done[parts[0]] = (int(parts[1]), float(parts[2]))
+        except FileNotFoundError:
+            pass
+        return done
+
+    def append(self, entries: List[Tuple[str, int, float]]):
+        if not entries:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.writelines(f"{path}\t{size}\t{mtime!r}\n" for path, size, mtime in entries)
+
+
+def import_library(
+    root: Path,
+    copy: bool = False,
+    workers: int = IMPORT_WORKERS,
+    batch_size: int = IMPORT_BATCH_SIZE,
+    user_id: int = 1,
+    progress: Optional[dict] = None,
+) -> dict:
+    """
+    Importe les fichiers audio de root (bloquant) et retourne les statistiques de l'import.
+    Avec copy, les fichiers sont copiés dans le stockage audio, sinon ils sont lus sur place.
+    progress, s'il est fourni, est tenu à jour pendant l'import.
+    """
+    root = Path(root).resolve()
+    stats = progress if progress is not None else {}
+    stats.update(scanned=0, imported=0, skipped_known=0, skipped_unchanged=0, errors=0)
+    started = time.perf_counter()
+
+    checkpoint = ImportCheckpoint(root)
+    done = checkpoint.load()
+    known_hashes = _known_hashes()
+
+    pending = []
+    for path, size, mtime in scan_audio_files(root):
+        stats["scanned"] += 1
+        if done.get(path) == (size, mtime):
+            stats["skipped_unchanged"] += 1
+        else:
+            pending.append(path)
+
+    rows: List[dict] = []
+    handled: List[Tuple[str, int, float]] = []
+    # "spawn" : l'API a des threads, un fork pourrait copier un verrou tenu
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=max(workers, 1), mp_context=context) as pool:
+        for probe in pool.map(probe_audio_file, pending, chunksize=16):
+            if "error" in probe:
+                # Pas de point de reprise : le fichier sera réessayé au prochain import
+                stats["errors"] += 1
+                logger.warning(f"Fichier ignoré ({probe['path']}): {probe['error']}")
+                continue
+            handled.append((probe["path"], probe["size"], probe["mtime"]))
+            if probe["content_hash"] in known_hashes:
+                stats["skipped_known"] += 1
+                continue
+            known_hashes.add(probe["content_hash"])
+            rows.append(probe)
+            if len(rows) >= batch_size:
+                stats["imported"] += _write_batch(rows, copy, user_id)
+                checkpoint.append(handled)
+                rows, handled = [], []
+        stats["imported"] += _write_batch(rows, copy, user_id)
+        checkpoint.append(handled)
+
+    stats["duration"] = round(time.perf_counter() - started, 2)
+    logger.info(f"Import de {root} terminé: {stats}")
+    return stats
+
+
+def _known_hashes() -> Set[str]:
+    db = SessionLocal()
+    try:
+        return {row[0] for row in db.query(MusicModel.content_hash).filter(MusicModel.content_hash.isnot(None))}
+    finally:
+        db.close()
+
+
+def _write_batch(probes: List[dict], copy: bool, user_id: int) -> int:
+    """Écrit un lot de musiques en un INSERT groupé et retourne le nombre de musiques ajoutées."""
+    if not probes:
+        return 0
+    rows = [
+        {
+            "title": probe["title"],
+            "artist": probe["artist"],
+            "album": probe["album"],
+            "duration": probe["duration"],
+            "file_path": _stored_path(probe["path"], copy),
+            "cover_path": None,
+            "source_url": None,
+            "content_hash": probe["content_hash"],
+            "added_by": user_id,
+        } for probe in probes
+    ]
+    try:
+        _insert_music(rows)
+        return len(rows)
+    except IntegrityError as e:
+        # Une musique du lot a été ajoutée entre-temps (upload, autre import) : écrire une par une
+        logger.warning(f"Lot d'import refusé, écriture musique par musique: {str(e)}")
+        imported = 0
+        for row in rows:
+            try:
+                _insert_music([row])
+                imported += 1
+            except IntegrityError:
+                if copy:
+                    (APP_ROOT / row["file_path"]).unlink(missing_ok=True)
+        return imported
+
+
+def _insert_music(rows: List[dict]):
+    db = SessionLocal()
+    try:
+        db.bulk_insert_mappings(MusicModel, rows)
+        db.commit()
+    finally:
+        db.close()
+
+
+def _stored_path(path: str, copy: bool) -> str:
+    """Chemin enregistré dans music.file_path : relatif à /app si possible, absolu sinon."""
+    source = Path(path)
+    if copy:
+        destination = AUDIO_STORAGE_PATH / f"{uuid.uuid4()}{source.suffix.lower()}"
+        shutil.copy2(source, destination)
+        source = destination
+    try:
+        return str(source.relative_to(APP_ROOT))
+    except ValueError:
+        return str(source)
+
+
+class LibraryImports:
+    """Imports lancés depuis l'API, exécutés en arrière-plan (un seul à la fois par dossier)."""
+
+    def __init__(self):
+        self.jobs: Dict[str, dict] = {}
+
+    def submit(self, root: Path, copy: bool = False) -> dict:
+        """Lance l'import de root. Lève ValueError si un import de ce dossier est déjà en cours."""
+        root = Path(root).resolve()
+        if any(job["root"] == str(root) and job["status"] == "running" for job in self.jobs.values()):
+            raise ValueError("Un import de ce dossier est déjà en cours")
+        job = {"id": uuid.uuid4().hex, "root": str(root), "copy": copy, "status": "running", "error": None}
+        self.jobs[job["id"]] = job
+        asyncio.create_task(self._run(job, root, copy))
+        return job
+
+    def get(self, job_id: str) -> Optional[dict]:
+        return self.jobs.get(job_id)
+
+    async def _run(self, job: dict, root: Path, copy: bool):
+        try:
+            await asyncio.to_thread(import_library, root, copy, progress=job)
+            job["status"] = "done"
+        except Exception as e:
+            logger.error(f"Échec de l'import de {root}: {str(e)}")
+            job["status"] = "error"
+            job["error"] = str(e)
+
+
+def resolve_import_path(path: str) -> Optional[Path]:
+    """Dossier à importer, relatif à IMPORT_ROOT ; None s'il en sort ou n'existe pas."""
+    root = IMPORT_ROOT.resolve()
+    target = (root / path.lstrip("/")).resolve()
+    if target != root and root not in target.parents:
+        return None
+    return target if target.is_dir() else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import en masse d'une collection audio")
+    parser.add_argument("root", help="Dossier à importer")
+    parser.add_argument("--copy", action="store_true", help="Copier les fichiers dans le stockage audio")
+    parser.add_argument("--workers", type=int, default=IMPORT_WORKERS, help="Processus d'analyse")
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE, help="Musiques par INSERT")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    stats = import_library(Path(args.root), args.copy, args.workers, args.batch_size)
+    print(
+        f"{stats['imported']} musique(s) importée(s), {stats['skipped_known']} déjà connue(s), "
+        f"{stats['skipped_unchanged']} déjà traitée(s), {stats['errors']} erreur(s) "
+        f"sur {stats['scanned']} fichier(s) en {stats['duration']} s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+import asyncio
+import bisect
+import gc
+import heapq
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import object_session
+
+from app.db.database import SessionLocal
+from app.models import Music as MusicModel
+
+logger = logging.getLogger(__name__)
+
+# "memory" : index de recherche de la bibliothèque en mémoire, "none" : recherche SQL (ILIKE)
+LIBRARY_SEARCH_INDEX = os.getenv("LIBRARY_SEARCH_INDEX", "memory")
+# Intervalle (en secondes) de prise en compte des musiques ajoutées ou modifiées par d'autres processus
+LIBRARY_SEARCH_SYNC_INTERVAL = float(os.getenv("LIBRARY_SEARCH_SYNC_INTERVAL", "2"))
+
+# Poids des champs dans le classement des résultats
+FIELD_WEIGHTS = (3.0, 2.0, 1.0)  # titre, artiste, album
+# Requêtes peu sélectives (une lettre, mots très courants) : nombre maximal de musiques
+# classées, et de musiques examinées pour les trouver
+MAX_CANDIDATES = 1000
+MAX_SCANNED = 20000
+# Les deux mots les plus sélectifs sont croisés par intersection d'ensembles (en C) tant que
+# leurs musiques ne dépassent pas ce nombre, sinon en parcourant les musiques du premier
+MAX_INTERSECTED = 100000
+# Nombre maximal de mots pris en compte dans une requête
+MAX_QUERY_TERMS = 8
+# Lignes relues à chaque synchronisation : une écriture validée en retard reste prise en compte
+SYNC_OVERLAP = timedelta(seconds=10)
+# Lignes lues par requête lors de la construction de l'index
+BUILD_BATCH_SIZE = 10000
+# Sépare les champs dans le texte indexé d'une musique (c'est un blanc pour str.split)
+FIELD_SEPARATOR = "\x1f"
+
+_WORD = re.compile(r"\w+")
+
+
+def tokenize(text: Optional[str]) -> Tuple[str, ...]:
+    """Mots d'un texte, en minuscules et sans accents ("Beyoncé" → "beyonce")."""
+    if not text:
+        return ()
+    decomposed = unicodedata.normalize("NFKD", text)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+    return tuple(_WORD.findall(stripped))
+
+
+def _document(title: Optional[str], artist: Optional[str], album: Optional[str]) -> str:
+    """
+    Texte indexé d'une musique : chaque mot est précédé d'une espace, si bien que
+    " " + préfixe in texte teste en un seul appel si un mot commence par le préfixe.
+    """
+    return FIELD_SEPARATOR.join("".join(" " + word for word in tokenize(field)) for field in (title, artist, album))
+
+
+class LibraryIndex:
+    """
+    Index inversé des titres, artistes et albums de la bibliothèque, en mémoire.
+
+    Chaque mot est associé aux musiques qui le contiennent ; le vocabulaire trié
+    permet de retrouver par dichotomie tous les mots commençant par un préfixe,
+    si bien que la recherche fonctionne dès les premières lettres saisies.
+    Les musiques écrites par ce processus sont indexées à la validation de la
+    transaction ; celles des autres processus (autres workers, import en ligne de
+    commande) sont relues via music.updated_at toutes les LIBRARY_SEARCH_SYNC_INTERVAL secondes.
+    """
+
+    def __init__(self, session_factory=SessionLocal):
+        self.session_factory = session_factory
+        self.ready = False
+        # {music_id: texte indexé (voir _document)}
+        self._documents: Dict[int, str] = {}
+        self._postings: Dict[str, Set[int]] = {}
+        self._vocabulary: List[str] = []
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._watermark: Optional[datetime] = None
+        self._synced_at = 0.0
+
+    def build(self):
+        """Construit l'index à partir de la base (bloquant)."""
+        started = time.perf_counter()
+        documents = {}
+        watermark = None
+        db = self.session_factory()
+        try:
+            last_id = 0
+            while True:
+                rows = (
+                    db.query(MusicModel.id, MusicModel.title, MusicModel.artist, MusicModel.album, MusicModel.updated_at)
+                    .filter(MusicModel.id > last_id)
+                    .order_by(MusicModel.id)
+                    .limit(BUILD_BATCH_SIZE)
+                    .all()
+                )
+                if not rows:
+                    break
+                for music_id, title, artist, album, updated_at in rows:
+                    documents[music_id] = _document(title, artist, album)
+                    if updated_at is not None and (watermark is None or updated_at > watermark):
+                        watermark = updated_at
+                last_id = rows[-1][0]
+        finally:
+            db.close()
+
+        postings: Dict[str, Set[int]] = {}
+        for music_id, text in documents.items():
+            for word in set(text.split()):
+                postings.setdefault(word, set()).add(music_id)
+        with self._lock:
+            self._documents = documents
+            self._postings = postings
+            self._vocabulary = sorted(postings)
+            self._watermark = watermark
+            self._synced_at = time.monotonic()
+            self.ready = True
+        # L'index compte des millions d'objets sans cycles : les sortir du ramasse-miettes,
+        # dont les collections complètes bloqueraient sinon les recherches
+        gc.freeze()
+        logger.info(
+            f"Index de la bibliothèque construit: {len(documents)} musiques, "
+            f"{len(self._vocabulary)} mots en {time.perf_counter() - started:.2f} s"
+        )
+
+    async def build_in_background(self):
+        """Construit l'index hors de la boucle d'événements ; la recherche SQL sert en attendant."""
+        try:
+            await asyncio.to_thread(self.build)
+        except Exception as e:
+            logger.error(f"Construction de l'index de la bibliothèque impossible: {str(e)}")
+
+    def attach(self, session_factory=SessionLocal):
+        """Indexe les musiques ajoutées ou modifiées par ce processus dès la validation de la transaction."""
+
+        @event.listens_for(MusicModel, "after_insert")
+        @event.listens_for(MusicModel, "after_update")
+        def _track_music(mapper, connection, target):
+            session = object_session(target)
+            if session is not None:
+                session.info.setdefault("indexed_music", {})[target.id] = (target.title, target.artist, target.album)
+
+        @event.listens_for(session_factory, "after_commit")
+        def _index_committed(session):
+            changed = session.info.pop("indexed_music", None)
+            if changed and self.ready:
+                for music_id, (title, artist, album) in changed.items():
+                    self.add(music_id, title, artist, album)
+
+        @event.listens_for(session_factory, "after_rollback")
+        def _forget_rolled_back(session):
+            session.info.pop("indexed_music", None)
+
+    def add(self, music_id: int, title: Optional[str], artist: Optional[str], album: Optional[str]):
+        """Ajoute une musique à l'index, ou remplace ses mots si elle y est déjà."""
+        text = _document(title, artist, album)
+        with self._lock:
+            previous = self._documents.get(music_id)
+            if previous == text:
+                return
+            old_words = set(previous.split()) if previous else set()
+            new_words = set(text.split())
+            for word in old_words - new_words:
+                ids = self._postings[word]
+                ids.discard(music_id)
+                if not ids:
+                    del self._postings[word]
+                    del self._vocabulary[bisect.bisect_left(self._vocabulary, word)]
+            for word in new_words - old_words:
+                ids = self._postings.get(word)
+                if ids is None:
+                    ids = self._postings[word] = set()
+                    bisect.insort(self._vocabulary, word)
+                ids.add(music_id)
+            self._documents[music_id] = text
+
+    def search(self, query: str, limit: int = 100) -> List[int]:
+        """
+        Identifiants des musiques dont chaque mot de la requête commence un mot du titre,
+        de l'artiste ou de l'album, des plus pertinentes aux moins pertinentes.
+        """
+        self._sync_if_stale()
+        terms = list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TERMS]
+        if not terms or limit <= 0:
+            return []
+
+        with self._lock:
+            ranges = {term: self._prefix_range(term) for term in terms}
+            sizes = {term: sum(len(self._postings[word]) for word in self._vocabulary[lo:hi])
+                     for term, (lo, hi) in ranges.items()}
+            terms.sort(key=sizes.get)
+
+            # Les candidats viennent des mots les plus sélectifs, les autres mots sont vérifiés au passage
+            if len(terms) > 1 and sizes[terms[0]] + sizes[terms[1]] <= MAX_INTERSECTED:
+                ids = self._union(ranges[terms[0]]) & self._union(ranges[terms[1]])
+                markers = [" " + term for term in terms[2:]]
+            else:
+                ids = self._iter_ids(terms[0], ranges[terms[0]])
+                markers = [" " + term for term in terms[1:]]
+            candidates = []
+            for scanned, music_id in enumerate(ids):
+                if scanned >= MAX_SCANNED or len(candidates) >= MAX_CANDIDATES:
+                    break
+                text = self._documents[music_id]
+                if all(marker in text for marker in markers):
+                    candidates.append(music_id)
+
+            scored = ((self._score(self._documents[music_id], terms), music_id) for music_id in candidates)
+            best = heapq.nlargest(limit, scored, key=lambda item: (item[0], -item[1]))
+        return [music_id for _, music_id in best]
+
+    def _prefix_range(self, prefix: str) -> Tuple[int, int]:
+        lo = bisect.bisect_left(self._vocabulary, prefix)
+        hi = bisect.bisect_left(self._vocabulary, prefix[:-1] + chr(ord(prefix[-1]) + 1), lo)
+        return lo, hi
+
+    def _union(self, word_range: Tuple[int, int]) -> Set[int]:
+        lo, hi = word_range
+        return set().union(*(self._postings[word] for word in self._vocabulary[lo:hi]))
+
+    def _iter_ids(self, term: str, word_range: Tuple[int, int]) -> Iterator[int]:
+        """Musiques contenant un mot commençant par term, celles contenant le mot exact d'abord."""
+        lo, hi = word_range
+        exact = self._postings.get(term, ())
+        yield from exact
+        seen = set()
+        for word in self._vocabulary[lo:hi]:
+            if word != term:
+                for music_id in self._postings[word]:
+                    if music_id not in exact and music_id not in seen:
+                        seen.add(music_id)
+                        yield music_id
+
+    @staticmethod
+    def _score(text: str, terms: Iterable[str]) -> float:
+        fields = text.split(FIELD_SEPARATOR)
+        score = 0.0
+        for term in terms:
+            marker = " " + term
+            best = 0.0
+            for weight, field in zip(FIELD_WEIGHTS, fields):
+                position = field.find(marker)
+                if position < 0:
+                    continue
+                # Mot complet plutôt que préfixe, début du champ plutôt que milieu
+                exact = (field + " ").find(marker + " ") >= 0
+                best = max(best, weight * (2.0 if exact else 1.0) * (1.2 if position == 0 else 1.0))
+            score += best
+        # À pertinence égale, préférer les titres courts
+        return score - 0.01 * fields[0].count(" ")
+
+    def _sync_if_stale(self):
+        if not self.ready or time.monotonic() - self._synced_at < LIBRARY_SEARCH_SYNC_INTERVAL:
+            return
+        # Une seule synchronisation à la fois, hors du chemin de la recherche
+        if not self._sync_lock.acquire(blocking=False):
+            return
+        self._synced_at = time.monotonic()
+        threading.Thread(target=self._sync_in_background, daemon=True).start()
+
+    def _sync_in_background(self):
+        try:
+            self.sync()
+        except Exception as e:
+            logger.warning(f"Synchronisation de l'index de la bibliothèque impossible: {str(e)}")
+        finally:
+            self._sync_lock.release()
+
+    def sync(self):
+        """Indexe les musiques ajoutées ou modifiées depuis la dernière synchronisation (bloquant)."""
+        db = self.session_factory()
+        try:
+            query = db.query(MusicModel.id, MusicModel.title, MusicModel.artist, MusicModel.album, MusicModel.updated_at)
+            if self._watermark is not None:
+                query = query.filter(MusicModel.updated_at >= self._watermark - SYNC_OVERLAP)
+            else:
+                query = query.filter(MusicModel.updated_at.isnot(None))
+            rows = query.all()
+        finally:
+            db.close()
+        for music_id, title, artist, album, updated_at in rows:
+            self.add(music_id, title, artist, album)
+            if self._watermark is None or updated_at > self._watermark:
+                self._watermark = updated_at
+
+    def metrics(self) -> dict:
+        return {"ready": self.ready, "documents": len(self._documents), "words": len(self._vocabulary)}
+
+
+def create_library_index() -> Optional[LibraryIndex]:
+    """Index de la bibliothèque selon LIBRARY_SEARCH_INDEX, None pour la recherche SQL."""
+    if LIBRARY_SEARCH_INDEX != "memory":
+        return None
+    index = LibraryIndex()
+    index.attach()
+    return index
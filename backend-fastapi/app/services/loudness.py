@@ -0,0 +1,128 @@
+"""
+Mesure de la sonie des pistes (EBU R128) : sonie intégrée, true peak et plage de sonie
+(LRA) sont mesurées une seule fois par ffmpeg et enregistrées sur la musique. Le fichier
+n'est pas réencodé : les clients appliquent le gain de lecture qui en découle.
+
+Mesure des musiques existantes, depuis backend-fastapi/ :
+
+    python -m app.services.loudness --workers 4
+"""
+
+import argparse
+import json
+import logging
+import math
+import os
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional
+
+from app.services.track_analysis import TRACK_ANALYSIS_WORKERS
+
+logger = logging.getLogger(__name__)
+
+# Sonie visée à la lecture (en LUFS)
+LOUDNESS_TARGET = float(os.getenv("LOUDNESS_TARGET", "-14"))
+# True peak maximal après application du gain (en dBTP) : le gain positif est limité pour ne pas saturer
+LOUDNESS_MAX_TRUE_PEAK = float(os.getenv("LOUDNESS_MAX_TRUE_PEAK", "-1"))
+
+# Durée maximale d'une mesure (en secondes)
+ANALYSIS_TIMEOUT = 600
+
+
+def measure_loudness(path: Path) -> Dict[str, Optional[float]]:
+    """
+    Mesure la sonie d'un fichier audio (bloquant) : décodage seul, sans écriture de fichier.
+    Retourne loudness_integrated (LUFS), loudness_true_peak (dBTP) et loudness_range (LU) ;
+    None pour une piste silencieuse. Lève RuntimeError si ffmpeg échoue.
+    """
+    # Le filtre loudnorm en mode analyse affiche ses mesures en JSON à la fin de stderr
+    cmd = [
+        "ffmpeg", "-hide_banner", "-nostats", "-nostdin", "-i", str(path), "-vn",
+        "-af", f"loudnorm=I={LOUDNESS_TARGET}:TP={LOUDNESS_MAX_TRUE_PEAK}:print_format=json",
+        "-f", "null", "-",
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True, timeout=ANALYSIS_TIMEOUT)
+    start = result.stderr.rfind("{")
+    if result.returncode != 0 or start < 0:
+        raise RuntimeError(f"Mesure de la sonie impossible: {result.stderr.strip()[-500:]}")
+    stats = json.loads(result.stderr[start:result.stderr.rindex("}") + 1])
+    return {
+        "loudness_integrated": _finite(stats.get("input_i")),
+        "loudness_true_peak": _finite(stats.get("input_tp")),
+        "loudness_range": _finite(stats.get("input_lra")),
+    }
+
+
+def _finite(value) -> Optional[float]:
+    # ffmpeg donne "-inf" pour le silence
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if math.isfinite(value) else None
+
+
+def playback_gain(integrated: Optional[float], true_peak: Optional[float]) -> Optional[float]:
+    """Gain (en dB) amenant la piste à LOUDNESS_TARGET sans dépasser LOUDNESS_MAX_TRUE_PEAK, None si non mesurée."""
+    if integrated is None:
+        return None
+    gain = LOUDNESS_TARGET - integrated
+    if true_peak is not None:
+        gain = min(gain, LOUDNESS_MAX_TRUE_PEAK - true_peak)
+    return round(gain, 2)
+
+
+def update_music_loudness(db, music) -> bool:
+    """Mesure la sonie du fichier de la musique et l'enregistre (bloquant). Retourne False si la mesure échoue."""
+    try:
+        loudness = measure_loudness(Path("/app") / music.file_path)
+    except (OSError, RuntimeError, ValueError, subprocess.TimeoutExpired) as e:
+        logger.warning(f"Sonie de la musique {music.id} non mesurée: {str(e)}")
+        return False
+    music.loudness_integrated = loudness["loudness_integrated"]
+    music.loudness_true_peak = loudness["loudness_true_peak"]
+    music.loudness_range = loudness["loudness_range"]
+    db.commit()
+    return True
+
+
+def measure_music_loudness(music_id: int) -> bool:
+    """Mesure la sonie d'une musique, avec sa propre session (bloquant)."""
+    from app.db.database import SessionLocal
+    from app.models import Music as MusicModel
+
+    db = SessionLocal()
+    try:
+        music = db.query(MusicModel).filter(MusicModel.id == music_id).first()
+        return music is not None and update_music_loudness(db, music)
+    finally:
+        db.close()
+
+
+def backfill_loudness(workers: int = TRACK_ANALYSIS_WORKERS) -> int:
+    """Mesure la sonie des musiques qui n'ont pas encore été mesurées. Bloquant."""
+    from app.db.database import SessionLocal
+    from app.models import Music as MusicModel
+
+    db = SessionLocal()
+    try:
+        music_ids = [row.id for row in db.query(MusicModel.id).filter(MusicModel.loudness_integrated.is_(None))]
+    finally:
+        db.close()
+    # Chaque mesure est un processus ffmpeg : les threads ne font qu'attendre
+    with ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix="loudness") as pool:
+        return sum(pool.map(measure_music_loudness, music_ids))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mesure la sonie des musiques existantes")
+    parser.add_argument("--workers", type=int, default=TRACK_ANALYSIS_WORKERS, help="Mesures en parallèle")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    print(f"{backfill_loudness(args.workers)} musique(s) mesurée(s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import os
+from collections import deque
+from typing import List, Optional
+
+# Nombre d'opérations conservées par salle pour rattraper un client en retard
+QUEUE_LOG_SIZE = int(os.getenv("QUEUE_LOG_SIZE", "256"))
+
+
+class QueueOpError(ValueError):
+    """Opération de file d'attente invalide (type inconnu, élément introuvable...)."""
+
+
+class RoomQueue:
+    """
+    File d'attente versionnée d'une salle.
+    Chaque modification est une petite opération (insert, move, remove, replace_current)
+    qui incrémente la version ; un client peut ainsi demander les opérations
+    depuis la version N au lieu de recevoir toute la file.
+    L'ordre de la liste fait foi, le champ `position` des éléments n'est pas renuméroté.
+    """
+
+    def __init__(self, items: Optional[list] = None, version: int = 0, log_size: int = QUEUE_LOG_SIZE):
+        self.items: List[dict] = list(items or [])
+        self.version = version
+        self._log = deque(maxlen=log_size)
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def reset(self, items: list):
+        """Remplace toute la file (ancien protocole) ; les clients devront repartir d'un instantané."""
+        self.items = list(items)
+        self.version += 1
+        self._log.clear()
+
+    def apply(self, op: dict, current_music_id: Optional[int] = None) -> dict:
+        """
+        Applique une opération et retourne sa version enregistrée (avec `version`).
+        Opérations reconnues :
+            {"op": "insert", "item": {...}, "index": i}   (index optionnel : en fin de file)
+            {"op": "remove", "id": queue_item_id}
+            {"op": "move", "id": queue_item_id, "to": i}
+            {"op": "replace_current", "item": {...}}
+        """
+        kind = op.get("op")
+
+        if kind == "insert":
+            if not isinstance(op.get("item"), dict):
+                raise QueueOpError("Élément manquant pour l'insertion")
+            index = self._clamp(op.get("index", len(self.items)), len(self.items))
+            self.items.insert(index, op["item"])
+            op = dict(op, index=index)
+
+        elif kind == "remove":
+            del self.items[self._index_of(op.get("id"))]
+
+        elif kind == "move":
+            item = self.items.pop(self._index_of(op.get("id")))
+            index = self._clamp(op.get("to", len(self.items)), len(self.items))
+            self.items.insert(index, item)
+            op = dict(op, to=index)
+
+        elif kind == "replace_current":
+            if not isinstance(op.get("item"), dict):
+                raise QueueOpError("Élément manquant pour le remplacement")
+            index = self._current_index(current_music_id)
+            if index is None:
+                self.items.insert(0, op["item"])
+                index = 0
+            else:
+                self.items[index] = op["item"]
+            op = dict(op, index=index)
+
+        else:
+            raise QueueOpError(f"Opération de file d'attente inconnue: {kind}")
+
+        self.version += 1
+        applied = dict(op, version=self.version)
+        self._log.append(applied)
+        return applied
+
+    def ops_since(self, version: int) -> Optional[list]:
+        """
+        Retourne les opérations postérieures à `version`,
+        ou None si elles ne sont plus disponibles (un instantané complet est alors nécessaire).
+        """
+        if version == self.version:
+            return []
+        if version > self.version or not self._log or self._log[0]["version"] > version + 1:
+            return None
+        return [op for op in self._log if op["version"] > version]
+
+    def to_dict(self) -> dict:
+        return {"version": self.version, "items": self.items}
+
+    @classmethod
+    def from_dict(cls, data) -> "RoomQueue":
+        # Compatibilité avec les files enregistrées sous forme de simple liste
+        if isinstance(data, list):
+            return cls(data)
+        return cls(data.get("items"), data.get("version", 0))
+
+    def _index_of(self, item_id) -> int:
+        for index, item in enumerate(self.items):
+            if item.get("id") == item_id:
+                return index
+        raise QueueOpError(f"Élément de file d'attente introuvable: {item_id}")
+
+    def _current_index(self, current_music_id: Optional[int]) -> Optional[int]:
+        if not self.items:
+            return None
+        if current_music_id is not None:
+            for index, item in enumerate(self.items):
+                if item.get("music_id") == current_music_id:
+                    return index
+        return 0
+
+    @staticmethod
+    def _clamp(index, size: int) -> int:
+        try:
+            index = int(index)
+        except (TypeError, ValueError):
+            raise QueueOpError(f"Index invalide: {index}")
+        return max(0, min(index, size))
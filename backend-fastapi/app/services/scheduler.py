@@ -0,0 +1,92 @@
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable, List
+
+from app.services.fanout import COALESCABLE_TYPES
+
+logger = logging.getLogger(__name__)
+
+# Fenêtre (en secondes) pendant laquelle les messages d'une salle sont regroupés ; 0 pour désactiver
+ROOM_TICK_INTERVAL = float(os.getenv("ROOM_TICK_INTERVAL", "0.05"))
+
+# Commandes discrètes envoyées sans attendre la fin de la fenêtre
+IMMEDIATE_TYPES = {"play", "pause", "track_change"}
+
+# Callback de livraison : (room_code, messages dans l'ordre d'arrivée)
+DeliverCallback = Callable[[str, List[dict]], Awaitable[None]]
+
+
+class RoomScheduler:
+    """
+    Ordonnanceur des diffusions d'une salle.
+    Pendant une courte fenêtre, les messages de lecture à haute fréquence
+    (playback_update, sync, seek) ne gardent que leur dernière version et les
+    autres événements sont regroupés pour être livrés ensemble en fin de fenêtre.
+    Les commandes discrètes (play, pause, track_change) sont livrées immédiatement,
+    après les messages en attente pour conserver l'ordre.
+    """
+
+    def __init__(self, room_code: str, deliver: DeliverCallback, interval: float = ROOM_TICK_INTERVAL):
+        self.room_code = room_code
+        self.interval = interval
+        # Nombre de messages remplacés par une version plus récente avant livraison
+        self.coalesced = 0
+        self._deliver = deliver
+        self._pending: List[dict] = []
+        self._timer = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def idle(self) -> bool:
+        return not self._pending and self._timer is None
+
+    async def submit(self, message: dict):
+        msg_type = message.get("type")
+
+        if self.interval <= 0 or msg_type in IMMEDIATE_TYPES:
+            await self.flush(message)
+            return
+
+        if msg_type in COALESCABLE_TYPES:
+            # Une version plus récente remplace la précédente, en fin de file
+            before = len(self._pending)
+            self._pending = [m for m in self._pending if m.get("type") != msg_type]
+            self.coalesced += before - len(self._pending)
+
+        self._pending.append(message)
+        if self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def flush(self, extra: dict = None):
+        """Livre immédiatement les messages en attente (et `extra` à leur suite)."""
+        if self._timer is not None and self._timer is not asyncio.current_task():
+            self._timer.cancel()
+        self._timer = None
+
+        messages = self._pending
+        self._pending = []
+        if extra is not None:
+            messages.append(extra)
+        if not messages:
+            return
+
+        async with self._lock:
+            try:
+                await self._deliver(self.room_code, messages)
+            except Exception as e:
+                logger.error(f"Erreur lors de la livraison des messages de la salle {self.room_code}: {str(e)}")
+
+    async def _flush_later(self):
+        try:
+            await asyncio.sleep(self.interval)
+        except asyncio.CancelledError:
+            return
+        await self.flush()
+
+    def cancel(self):
+        """Abandonne les messages en attente (salle fermée)."""
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = None
+        self._pending = []
@@ -0,0 +1,63 @@
+import json
+from typing import Optional
+
+from app.services.binary_protocol import encode_binary
+
+# orjson est nettement plus rapide que json, mais reste optionnel
+try:
+    import orjson
+except ImportError:  # pragma: no cover - dépend de l'environnement
+    orjson = None
+
+
+def encode_json(data) -> str:
+    """Encode une valeur en texte JSON compact, avec orjson si disponible."""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+def decode_json(data):
+    """Décode un texte ou des octets JSON."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def encode_json_with_raw(data: dict, key: str, raw: str) -> str:
+    """
+    Encode un dictionnaire en y insérant sous `key` un fragment JSON déjà encodé.
+    Permet de réutiliser l'encodage d'une grosse valeur (ex. une file d'attente)
+    sans la ré-encoder à chaque message.
+    """
+    head = encode_json(data)
+    separator = "," if len(head) > 2 else ""
+    return f'{head[:-1]}{separator}{encode_json(key)}:{raw}}}'
+
+
+class OutboundMessage:
+    """
+    Message sortant partagé par toutes les connexions d'une salle.
+    Chaque encodage (JSON, MessagePack) est calculé au plus une fois, à la demande,
+    puis réutilisé pour chaque destinataire.
+    """
+
+    __slots__ = ("payload", "type", "_text", "_binary")
+
+    def __init__(self, payload: dict, text: Optional[str] = None, binary: Optional[bytes] = None):
+        self.payload = payload
+        self.type = payload.get("type")
+        self._text = text
+        self._binary = binary
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = encode_json(self.payload)
+        return self._text
+
+    @property
+    def binary(self) -> bytes:
+        if self._binary is None:
+            self._binary = encode_binary(self.payload)
+        return self._binary
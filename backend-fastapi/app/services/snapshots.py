@@ -0,0 +1,116 @@
+import asyncio
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Optional
+
+from app.services.serialization import encode_json, decode_json
+
+logger = logging.getLogger(__name__)
+
+# Stockage des instantanés de salles : "file" (défaut), "redis" ou "none" pour désactiver
+ROOM_SNAPSHOT_STORE = os.getenv("ROOM_SNAPSHOT_STORE", "file")
+ROOM_SNAPSHOT_DIR = os.getenv("ROOM_SNAPSHOT_DIR", "/app/storage/snapshots")
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
+# Délai maximal (en secondes) entre une modification d'une salle et l'écriture de son instantané
+ROOM_SNAPSHOT_INTERVAL = float(os.getenv("ROOM_SNAPSHOT_INTERVAL", "2"))
+# Durée (en secondes) au-delà de laquelle un instantané n'est plus utilisé
+ROOM_SNAPSHOT_TTL = int(os.getenv("ROOM_SNAPSHOT_TTL", "604800"))
+
+
+class SnapshotStore:
+    """
+    Stockage durable de l'état des salles (lecture et file d'attente).
+    Un instantané est un dictionnaire {"state": ..., "queue": ..., "saved_at": ...}
+    relu à la première connexion après un redémarrage, avant de recourir à la base.
+    """
+
+    async def load(self, room_code: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    async def save(self, room_code: str, snapshot: dict):
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+    @staticmethod
+    def _is_fresh(snapshot: Optional[dict]) -> bool:
+        return bool(snapshot) and time.time() - snapshot.get("saved_at", 0) <= ROOM_SNAPSHOT_TTL
+
+
+class FileSnapshotStore(SnapshotStore):
+    """Un fichier JSON par salle, écrit de façon atomique."""
+
+    def __init__(self, directory: str = ROOM_SNAPSHOT_DIR):
+        self.directory = Path(directory)
+
+    def _path(self, room_code: str) -> Optional[Path]:
+        # Le code de salle sert de nom de fichier : n'accepter que des caractères sûrs
+        if not room_code or not room_code.isalnum():
+            return None
+        return self.directory / f"{room_code}.json"
+
+    async def load(self, room_code: str) -> Optional[dict]:
+        path = self._path(room_code)
+        if path is None:
+            return None
+        snapshot = await asyncio.to_thread(self._read, path)
+        return snapshot if self._is_fresh(snapshot) else None
+
+    async def save(self, room_code: str, snapshot: dict):
+        path = self._path(room_code)
+        if path is not None:
+            await asyncio.to_thread(self._write, path, encode_json(snapshot))
+
+    @staticmethod
+    def _read(path: Path) -> Optional[dict]:
+        try:
+            return decode_json(path.read_bytes())
+        except FileNotFoundError:
+            return None
+        except ValueError as e:
+            logger.warning(f"Instantané illisible ignoré ({path}): {str(e)}")
+            return None
+
+    def _write(self, path: Path, data: str):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_text(data, encoding="utf-8")
+        os.replace(tmp_path, path)
+
+
+class RedisSnapshotStore(SnapshotStore):
+    """Instantanés stockés dans Redis, avec expiration automatique."""
+
+    def __init__(self, url: str = REDIS_URL, prefix: str = "musictogether"):
+        import redis.asyncio as redis
+
+        self.redis = redis.from_url(url)
+        self.prefix = prefix
+
+    def _key(self, room_code: str) -> str:
+        return f"{self.prefix}:snapshot:{room_code}"
+
+    async def load(self, room_code: str) -> Optional[dict]:
+        data = await self.redis.get(self._key(room_code))
+        snapshot = decode_json(data) if data is not None else None
+        return snapshot if self._is_fresh(snapshot) else None
+
+    async def save(self, room_code: str, snapshot: dict):
+        await self.redis.set(self._key(room_code), encode_json(snapshot), ex=ROOM_SNAPSHOT_TTL)
+
+    async def close(self):
+        await self.redis.aclose()
+
+
+def create_snapshot_store(kind: str = ROOM_SNAPSHOT_STORE) -> Optional[SnapshotStore]:
+    """Instancie le stockage configuré par ROOM_SNAPSHOT_STORE (None si désactivé)."""
+    if kind == "none":
+        return None
+    if kind == "redis":
+        return RedisSnapshotStore()
+    if kind != "file":
+        logger.warning(f"Stockage d'instantanés inconnu '{kind}', utilisation des fichiers")
+    return FileSnapshotStore()
@@ -0,0 +1,98 @@
+import hashlib
+import logging
+import re
+from functools import lru_cache
+from typing import Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+logger = logging.getLogger(__name__)
+
+# Longueur maximale d'une clé (colonne music.source_key)
+SOURCE_KEY_LENGTH = 255
+
+# Paramètres d'URL sans effet sur le média (partage, suivi, position de départ)
+_IGNORED_PARAMS = {"t", "start", "si", "feature", "pp", "ab_channel", "fbclid", "gclid", "ref", "ref_src"}
+
+# Cas le plus fréquent traité sans parcourir les extracteurs de yt-dlp
+_YOUTUBE_HOSTS = {"youtube.com", "www.youtube.com", "m.youtube.com", "music.youtube.com", "youtu.be"}
+_YOUTUBE_ID = re.compile(r"^[A-Za-z0-9_-]{11}$")
+
+
+def canonical_source_key(source_url: str) -> Optional[str]:
+    """
+    Clé stable "extracteur:identifiant" d'une URL de média : youtu.be/X,
+    youtube.com/watch?v=X&t=30 et music.youtube.com/watch?v=X donnent tous "youtube:X".
+    Retourne None si l'URL n'est pas une URL http(s).
+    """
+    if not source_url:
+        return None
+    return _canonical_source_key(source_url.strip())
+
+
+@lru_cache(maxsize=1024)
+def _canonical_source_key(source_url: str) -> Optional[str]:
+    parts = urlsplit(source_url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        return None
+
+    video_id = _youtube_id(parts)
+    if video_id is not None:
+        return f"youtube:{video_id}"
+
+    extractor, media_id = _match_extractor(source_url)
+    if not media_id:
+        # Pas d'identifiant connu : l'URL normalisée tient lieu d'identifiant
+        media_id = _normalize_url(parts)
+    key = f"{extractor}:{media_id}"
+    if len(key) > SOURCE_KEY_LENGTH:
+        key = f"{extractor}:sha1:{hashlib.sha1(media_id.encode('utf-8')).hexdigest()}"
+    return key
+
+
+def _youtube_id(parts) -> Optional[str]:
+    host = parts.hostname.lower()
+    if host not in _YOUTUBE_HOSTS:
+        return None
+    query = dict(parse_qsl(parts.query))
+    if host == "youtu.be":
+        candidate = parts.path.strip("/").split("/")[0]
+    elif parts.path == "/watch":
+        # Une URL de playlist est laissée à yt-dlp (extracteur YoutubeTab)
+        if "list" in query:
+            return None
+        candidate = query.get("v", "")
+    else:
+        segments = parts.path.strip("/").split("/")
+        if len(segments) < 2 or segments[0] not in ("shorts", "embed", "live", "v"):
+            return None
+        candidate = segments[1]
+    return candidate if _YOUTUBE_ID.match(candidate) else None
+
+
+def _match_extractor(source_url: str) -> Tuple[str, Optional[str]]:
+    """Premier extracteur yt-dlp capable de traiter l'URL et identifiant du média s'il est dans l'URL."""
+    try:
+        from yt_dlp.extractor import gen_extractor_classes
+    except ImportError:  # pragma: no cover - dépend de l'environnement
+        return "generic", None
+    for extractor in gen_extractor_classes():
+        if extractor.ie_key() != "Generic" and extractor.suitable(source_url):
+            try:
+                return extractor.ie_key().lower(), extractor.get_temp_id(source_url)
+            except Exception as e:
+                logger.debug(f"Identifiant introuvable pour {source_url}: {str(e)}")
+                return extractor.ie_key().lower(), None
+    return "generic", None
+
+
+def _normalize_url(parts) -> str:
+    host = parts.hostname.lower()
+    for prefix in ("www.", "m."):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+    query = sorted(
+        (name, value) for name, value in parse_qsl(parts.query)
+        if name not in _IGNORED_PARAMS and not name.startswith("utm_")
+    )
+    path = parts.path.rstrip("/")
+    return f"{host}{path}" + (f"?{urlencode(query)}" if query else "")
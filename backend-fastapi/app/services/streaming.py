@@ -0,0 +1,116 @@
+import mimetypes
+import os
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import Callable, Dict, Mapping, Optional
+
+from fastapi.responses import FileResponse, Response
+
+# Durée (en secondes) pendant laquelle un navigateur réutilise un fichier audio sans revalidation
+STREAM_CACHE_MAX_AGE = int(os.getenv("STREAM_CACHE_MAX_AGE", "31536000"))
+
+# Types des formats audio acceptés à l'upload, absents de certaines tables mimetypes
+AUDIO_MEDIA_TYPES = {
+    ".mp3": "audio/mpeg",
+    ".wav": "audio/wav",
+    ".ogg": "audio/ogg",
+    ".opus": "audio/ogg",
+    ".flac": "audio/flac",
+    ".aac": "audio/aac",
+    ".m4a": "audio/mp4",
+    ".webm": "audio/webm",
+}
+
+
+def audio_media_type(path: Path) -> str:
+    """Type MIME réel d'un fichier audio, d'après son extension."""
+    suffix = path.suffix.lower()
+    return AUDIO_MEDIA_TYPES.get(suffix) or mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+
+
+def file_etag(stat_result: os.stat_result) -> str:
+    """Validateur fort : change dès que le contenu du fichier est remplacé."""
+    return f'"{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"'
+
+
+def is_not_modified(request_headers: Mapping[str, str], etag: str, stat_result: os.stat_result) -> bool:
+    """Requête conditionnelle (If-None-Match, à défaut If-Modified-Since) satisfaite par la version en cache."""
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is not None:
+        candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in candidates or etag in candidates
+
+    if_modified_since = request_headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(stat_result.st_mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def audio_headers(stat_result: os.stat_result) -> Dict[str, str]:
+    """Validateurs et en-têtes de cache d'un fichier audio."""
+    return {
+        "ETag": file_etag(stat_result),
+        "Last-Modified": formatdate(stat_result.st_mtime, usegmt=True),
+        "Cache-Control": f"public, max-age={STREAM_CACHE_MAX_AGE}",
+        "Accept-Ranges": "bytes",
+    }
+
+
+def if_range_matches(request_headers: Mapping[str, str], headers: Mapping[str, str]) -> bool:
+    """Vrai si la plage demandée peut être servie (pas d'If-Range, ou If-Range sur la version actuelle)."""
+    if_range = request_headers.get("if-range")
+    return if_range is None or if_range in (headers["ETag"], headers["Last-Modified"])
+
+
+class AudioFileResponse(FileResponse):
+    """FileResponse qui signale la taille de chaque bloc envoyé (statistiques)."""
+
+    def __init__(self, *args, on_body: Optional[Callable[[int], None]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.on_body = on_body
+
+    async def __call__(self, scope, receive, send):
+        if self.on_body is None:
+            return await super().__call__(scope, receive, send)
+
+        async def counting_send(message):
+            if message["type"] == "http.response.body":
+                self.on_body(len(message.get("body", b"")))
+            elif message["type"] == "http.response.pathsend":
+                self.on_body(self.stat_result.st_size)
+            await send(message)
+
+        await super().__call__(scope, receive, counting_send)
+
+
+def audio_file_response(
+    path: Path,
+    request_headers: Mapping[str, str],
+    stat_result: Optional[os.stat_result] = None,
+    filename: Optional[str] = None,
+    on_body: Optional[Callable[[int], None]] = None,
+) -> Response:
+    """
+    Réponse de lecture d'un fichier audio : requêtes Range (206, plages multiples),
+    validateurs ETag/Last-Modified, 304 pour les requêtes conditionnelles et cache long.
+    Le corps est envoyé par FileResponse : http.response.pathsend (sans copie) si le
+    serveur le propose, sinon par blocs de 64 Kio lus hors de la boucle d'événements.
+    """
+    if stat_result is None:
+        stat_result = path.stat()
+    headers = audio_headers(stat_result)
+    if is_not_modified(request_headers, headers["ETag"], stat_result):
+        return Response(status_code=304, headers=headers)
+
+    return AudioFileResponse(
+        path,
+        headers=headers,
+        media_type=audio_media_type(path),
+        filename=filename or path.name,
+        stat_result=stat_result,
+        content_disposition_type="inline",
+        on_body=on_body,
+    )
@@ -0,0 +1,42 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# Nombre d'analyses de pistes (processus ffmpeg) exécutées en parallèle
+TRACK_ANALYSIS_WORKERS = int(os.getenv("TRACK_ANALYSIS_WORKERS", "1"))
+
+# Analyse bloquante d'une musique : music_id -> True si elle a abouti
+Analysis = Callable[[int], bool]
+
+
+class TrackAnalyzer:
+    """
+    Analyses en arrière-plan des musiques ajoutées (envoi, téléchargement) : sonie,
+    forme d'onde... Elles s'exécutent l'une après l'autre pour chaque musique, dans un
+    pool de threads borné : la requête n'attend pas le décodage de la piste.
+    """
+
+    def __init__(self, analyses: Sequence[Analysis], workers: int = TRACK_ANALYSIS_WORKERS):
+        self.analyses = tuple(analyses)
+        self.workers = workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def schedule(self, music_id: int):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=max(self.workers, 1), thread_name_prefix="track-analysis")
+        self._executor.submit(self._analyze, music_id)
+
+    def _analyze(self, music_id: int):
+        for analysis in self.analyses:
+            try:
+                analysis(music_id)
+            except Exception as e:
+                logger.error(f"Erreur lors de l'analyse {analysis.__name__} de la musique {music_id}: {str(e)}")
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,182 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+import uuid
+from pathlib import Path
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+from app.services.audio_metadata import file_hash
+from app.services.serialization import encode_json, decode_json
+
+logger = logging.getLogger(__name__)
+
+# Taille maximale (en Mio) d'un fichier audio envoyé
+UPLOAD_MAX_MB = int(os.getenv("UPLOAD_MAX_MB", "200"))
+# Durée (en secondes) après laquelle un envoi en plusieurs parties inachevé est supprimé
+UPLOAD_SESSION_TTL = int(os.getenv("UPLOAD_SESSION_TTL", "86400"))
+UPLOAD_DIR = Path("/app/storage/temp/uploads")
+
+# Les blocs reçus sont regroupés avant d'être écrits sur le disque
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+
+class UploadError(ValueError):
+    """Envoi refusé : status_code est le code HTTP à retourner, offset la position actuelle de l'envoi."""
+
+    def __init__(self, message: str, status_code: int = 400, offset: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.offset = offset
+
+
+class ResumableUploads:
+    """
+    Envois de fichiers en plusieurs parties, reprenables après une coupure :
+    le client crée l'envoi (nom et taille du fichier), puis envoie les octets
+    par blocs à partir de la position indiquée par le serveur. Les parties
+    reçues sont sur le disque (fichier .part et sa description .json), ce qui
+    permet la reprise après un redémarrage ou via un autre worker.
+    """
+
+    def __init__(self, directory: Path = UPLOAD_DIR, max_size: int = UPLOAD_MAX_MB * 1024 * 1024):
+        self.directory = Path(directory)
+        self.max_size = max_size
+        # Empreinte calculée au fil de l'envoi {upload_id: (sha256, octets déjà pris en compte)}
+        self._hashers: Dict[str, Tuple["hashlib._Hash", int]] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    def part_path(self, upload_id: str) -> Path:
+        return self.directory / f"{upload_id}.part"
+
+    def _info_path(self, upload_id: str) -> Path:
+        return self.directory / f"{upload_id}.json"
+
+    @staticmethod
+    def _valid_id(upload_id: str) -> bool:
+        # L'identifiant sert de nom de fichier : n'accepter que ceux créés par create()
+        return len(upload_id) == 32 and all(c in "0123456789abcdef" for c in upload_id)
+
+    async def create(self, filename: str, size: int) -> dict:
+        if size <= 0:
+            raise UploadError("La taille du fichier doit être positive")
+        if size > self.max_size:
+            raise UploadError(f"Fichier trop volumineux (maximum {self.max_size} octets)", status_code=413)
+        await asyncio.to_thread(self._purge)
+
+        info = {"upload_id": uuid.uuid4().hex, "filename": filename, "size": size, "created_at": time.time()}
+        await asyncio.to_thread(self._write_info, info)
+        self._hashers[info["upload_id"]] = (hashlib.sha256(), 0)
+        return dict(info, offset=0)
+
+    def _write_info(self, info: dict):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.part_path(info["upload_id"]).touch()
+        self._info_path(info["upload_id"]).write_text(encode_json(info), encoding="utf-8")
+
+    async def get(self, upload_id: str) -> Optional[dict]:
+        """Description de l'envoi avec le nombre d'octets déjà reçus (offset), None s'il n'existe pas."""
+        if not self._valid_id(upload_id):
+            return None
+        return await asyncio.to_thread(self._read_info, upload_id)
+
+    def _read_info(self, upload_id: str) -> Optional[dict]:
+        try:
+            info = decode_json(self._info_path(upload_id).read_bytes())
+            info["offset"] = self.part_path(upload_id).stat().st_size
+            return info
+        except (FileNotFoundError, ValueError):
+            return None
+
+    async def append(self, upload_id: str, offset: int, chunks: AsyncIterator[bytes]) -> dict:
+        """
+        Ajoute les octets reçus à partir de offset, qui doit être la position actuelle de l'envoi.
+        Les octets reçus avant une coupure de la connexion restent acquis.
+        """
+        info = await self.get(upload_id)
+        if info is None:
+            raise UploadError("Envoi non trouvé", status_code=404)
+        lock = self._locks.setdefault(upload_id, asyncio.Lock())
+        if lock.locked():
+            raise UploadError("Un envoi est déjà en cours pour ce fichier", status_code=409, offset=info["offset"])
+
+        async with lock:
+            if offset != info["offset"]:
+                raise UploadError("Position d'envoi incorrecte", status_code=409, offset=info["offset"])
+
+            hasher, hashed = self._hashers.get(upload_id, (None, -1))
+            if hashed != offset:
+                # Empreinte perdue (redémarrage, autre worker) : elle sera recalculée à la fin
+                hasher = None
+            output = await asyncio.to_thread(open, self.part_path(upload_id), "ab")
+            buffer = bytearray()
+            received = offset
+            try:
+                async for chunk in chunks:
+                    received += len(chunk)
+                    if received > info["size"]:
+                        raise UploadError("Les données dépassent la taille annoncée", status_code=413)
+                    buffer += chunk
+                    if len(buffer) >= WRITE_BUFFER_SIZE:
+                        await self._write(output, buffer, hasher)
+                        buffer = bytearray()
+            finally:
+                # Conserver ce qui a été reçu, même si la connexion a été coupée
+                if buffer:
+                    await self._write(output, buffer, hasher)
+                await asyncio.to_thread(output.close)
+                info["offset"] = (await asyncio.to_thread(self.part_path(upload_id).stat)).st_size
+                if hasher is not None:
+                    self._hashers[upload_id] = (hasher, info["offset"])
+                else:
+                    self._hashers.pop(upload_id, None)
+                self._locks.pop(upload_id, None)
+        return info
+
+    @staticmethod
+    async def _write(output, buffer: bytearray, hasher):
+        data = bytes(buffer)
+        await asyncio.to_thread(output.write, data)
+        if hasher is not None:
+            hasher.update(data)
+
+    async def content_hash(self, upload_id: str) -> str:
+        """Empreinte SHA-256 du fichier reçu, calculée au fil de l'envoi ou relue sur le disque."""
+        info = await self.get(upload_id)
+        hasher, hashed = self._hashers.get(upload_id, (None, -1))
+        if hasher is not None and info is not None and hashed == info["offset"]:
+            return hasher.hexdigest()
+        return await asyncio.to_thread(file_hash, self.part_path(upload_id))
+
+    async def discard(self, upload_id: str, keep_part: bool = False):
+        """Supprime l'envoi (keep_part : le fichier reçu a été déplacé ailleurs)."""
+        if not self._valid_id(upload_id):
+            return
+        self._hashers.pop(upload_id, None)
+        await asyncio.to_thread(self._remove, upload_id, keep_part)
+
+    def _remove(self, upload_id: str, keep_part: bool = False):
+        paths = [self._info_path(upload_id)] + ([] if keep_part else [self.part_path(upload_id)])
+        for path in paths:
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def _purge(self):
+        """Supprime les envois abandonnés depuis plus de UPLOAD_SESSION_TTL secondes."""
+        if not self.directory.exists():
+            return
+        limit = time.time() - UPLOAD_SESSION_TTL
+        for info_path in self.directory.glob("*.json"):
+            upload_id = info_path.stem
+            part_path = self.part_path(upload_id)
+            try:
+                last_write = max(info_path.stat().st_mtime, part_path.stat().st_mtime if part_path.exists() else 0)
+            except FileNotFoundError:
+                continue
+            if last_write < limit and upload_id not in self._locks:
+                logger.info(f"Envoi abandonné supprimé: {upload_id}")
+                self._hashers.pop(upload_id, None)
+                self._remove(upload_id)
@@ -0,0 +1,125 @@
+"""
+Forme d'onde des pistes : la piste est décodée une seule fois par ffmpeg (PCM mono) et
+réduite en pics min/max à quelques niveaux de détail, enregistrés en binaire compact
+(int16 entrelacés : min, max, min, max...) dans WAVEFORM_STORAGE_PATH/<music_id>/<pics>.peaks.
+Le lecteur affiche ainsi la forme d'onde sans télécharger ni décoder la piste.
+
+Génération pour les musiques existantes, depuis backend-fastapi/ :
+
+    python -m app.services.waveform --workers 4
+"""
+
+import argparse
+import logging
+import os
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from app.services.track_analysis import TRACK_ANALYSIS_WORKERS
+
+logger = logging.getLogger(__name__)
+
+WAVEFORM_STORAGE_PATH = Path("/app/storage/peaks")
+# Nombre de paires min/max de chaque niveau de détail, quelle que soit la durée de la piste
+# (de l'aperçu de la barre de progression au zoom) : au plus 16 Kio par niveau en int16
+WAVEFORM_LEVELS = (256, 1024, 4096)
+# Fréquence d'échantillonnage du décodage : largement suffisante pour des pics affichés
+WAVEFORM_SAMPLE_RATE = 8000
+# Durée maximale d'un décodage (en secondes)
+DECODE_TIMEOUT = 600
+
+
+def decode_pcm(path: Path) -> np.ndarray:
+    """Décode un fichier audio en échantillons int16 mono (bloquant). Lève RuntimeError si ffmpeg échoue."""
+    cmd = [
+        "ffmpeg", "-hide_banner", "-nostats", "-nostdin", "-i", str(path), "-vn",
+        "-ac", "1", "-ar", str(WAVEFORM_SAMPLE_RATE), "-f", "s16le", "-",
+    ]
+    result = subprocess.run(cmd, capture_output=True, timeout=DECODE_TIMEOUT)
+    if result.returncode != 0:
+        raise RuntimeError(f"Décodage impossible: {result.stderr.decode(errors='replace').strip()[-500:]}")
+    return np.frombuffer(result.stdout, dtype="<i2")
+
+
+def compute_peaks(samples: np.ndarray, count: int) -> np.ndarray:
+    """Pics [[min, max], ...] (int16) de count tranches égales des échantillons."""
+    if samples.size == 0:
+        return np.zeros((count, 2), dtype="<i2")
+    # Début de chaque tranche ; une piste plus courte que count échantillons répète des échantillons
+    starts = np.linspace(0, samples.size, count, endpoint=False).astype(np.intp)
+    peaks = np.empty((count, 2), dtype="<i2")
+    peaks[:, 0] = np.minimum.reduceat(samples, starts)
+    peaks[:, 1] = np.maximum.reduceat(samples, starts)
+    return peaks
+
+
+def peaks_path(music_id: int, count: int) -> Path:
+    return WAVEFORM_STORAGE_PATH / str(music_id) / f"{count}.peaks"
+
+
+def generate_peaks(music_id: int, audio_path: Path):
+    """Décode la piste et écrit les pics de chaque niveau de WAVEFORM_LEVELS (bloquant)."""
+    samples = decode_pcm(audio_path)
+    directory = WAVEFORM_STORAGE_PATH / str(music_id)
+    directory.mkdir(parents=True, exist_ok=True)
+    for count in WAVEFORM_LEVELS:
+        # Écriture atomique : le fichier servi est toujours complet
+        temp_path = directory / f"{count}.peaks.tmp"
+        temp_path.write_bytes(compute_peaks(samples, count).tobytes())
+        os.replace(temp_path, peaks_path(music_id, count))
+
+
+def to_int8(data: bytes) -> bytes:
+    """Pics int16 ramenés en int8 (deux fois plus compacts, pour les aperçus)."""
+    return (np.frombuffer(data, dtype="<i2") >> 8).astype(np.int8).tobytes()
+
+
+def generate_music_peaks(music_id: int) -> bool:
+    """Génère la forme d'onde d'une musique (bloquant). Retourne False si la piste n'a pu être décodée."""
+    from app.db.database import SessionLocal
+    from app.models import Music as MusicModel
+
+    db = SessionLocal()
+    try:
+        file_path = db.query(MusicModel.file_path).filter(MusicModel.id == music_id).scalar()
+    finally:
+        db.close()
+    if file_path is None:
+        return False
+    try:
+        generate_peaks(music_id, Path("/app") / file_path)
+    except (OSError, RuntimeError, subprocess.TimeoutExpired) as e:
+        logger.warning(f"Forme d'onde de la musique {music_id} non générée: {str(e)}")
+        return False
+    return True
+
+
+def backfill_peaks(workers: int = TRACK_ANALYSIS_WORKERS) -> int:
+    """Génère la forme d'onde des musiques qui n'en ont pas encore. Bloquant."""
+    from app.db.database import SessionLocal
+    from app.models import Music as MusicModel
+
+    db = SessionLocal()
+    try:
+        music_ids = [row.id for row in db.query(MusicModel.id)]
+    finally:
+        db.close()
+    missing = [music_id for music_id in music_ids if not peaks_path(music_id, WAVEFORM_LEVELS[-1]).exists()]
+    # Le décodage est un processus ffmpeg et les réductions NumPy libèrent le GIL
+    with ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix="waveform") as pool:
+        return sum(pool.map(generate_music_peaks, missing))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Génère la forme d'onde des musiques existantes")
+    parser.add_argument("--workers", type=int, default=TRACK_ANALYSIS_WORKERS, help="Décodages en parallèle")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    print(f"{backfill_peaks(args.workers)} forme(s) d'onde générée(s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.services.serialization import encode_json, decode_json
+
+logger = logging.getLogger(__name__)
+
+# Nombre de recherches yt-dlp exécutées en parallèle (hors de la boucle d'événements)
+YOUTUBE_SEARCH_WORKERS = int(os.getenv("YOUTUBE_SEARCH_WORKERS", "4"))
+# Nombre de recherches gardées en cache dans chaque processus
+YOUTUBE_SEARCH_CACHE_SIZE = int(os.getenv("YOUTUBE_SEARCH_CACHE_SIZE", "512"))
+# Durée (en secondes) pendant laquelle un résultat de recherche est réutilisé
+YOUTUBE_SEARCH_TTL = int(os.getenv("YOUTUBE_SEARCH_TTL", "3600"))
+# Cache partagé entre processus : "memory" (défaut, propre au processus) ou "redis"
+YOUTUBE_SEARCH_CACHE = os.getenv("YOUTUBE_SEARCH_CACHE", "memory")
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
+
+# Nombre de durées d'extraction conservées pour les statistiques
+LATENCY_SAMPLES = 256
+
+# Extraction bloquante : (requête, nombre de résultats) -> résultats formatés
+Extractor = Callable[[str, int], List[dict]]
+
+
+def normalize_query(query: str) -> str:
+    """Forme canonique d'une requête : minuscules, espaces superflus retirés."""
+    return " ".join((query or "").lower().split())
+
+
+class YtDlpExtractor:
+    """
+    Recherche YouTube via yt-dlp. Chaque thread de l'exécuteur garde son instance
+    de YoutubeDL, réutilisée d'une recherche à l'autre au lieu d'être recréée.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def _ydl(self, max_results: int):
+        ydl = getattr(self._local, "ydl", None)
+        if ydl is None:
+            import yt_dlp
+
+            ydl = yt_dlp.YoutubeDL({
+                'quiet': True,
+                'extract_flat': True,
+                'force_generic_extractor': False,
+                'max_downloads': max_results
+            })
+            self._local.ydl = ydl
+        return ydl
+
+    def __call__(self, query: str, max_results: int) -> List[dict]:
+        search_results = self._ydl(max_results).extract_info(f"ytsearch{max_results}:{query}", download=False)
+        if not search_results or 'entries' not in search_results:
+            return []
+
+        formatted_results = []
+        for entry in search_results['entries']:
+            if entry:
+                formatted_results.append({
+                    'id': entry.get('id', ''),
+                    'title': entry.get('title', 'Unknown Title'),
+                    'url': f"https://www.youtube.com/watch?v={entry.get('id', '')}",
+                    'duration': entry.get('duration', 0),
+                    'thumbnail': entry.get('thumbnail', ''),
+                    'channel': entry.get('channel', 'Unknown Channel'),
+                    'view_count': entry.get('view_count', 0)
+                })
+        return formatted_results
+
+
+class SearchCache:
+    """
+    Cache LRU des résultats de recherche, avec expiration (TTL).
+    Avec un client Redis, les résultats sont aussi partagés entre processus.
+    """
+
+    def __init__(self, size: int = YOUTUBE_SEARCH_CACHE_SIZE, ttl: float = YOUTUBE_SEARCH_TTL, redis=None,
+                 prefix: str = "musictogether"):
+        self.size = size
+        self.ttl = ttl
+        self.redis = redis
+        self.prefix = prefix
+        # {clé: (expiration, résultats)}, du moins au plus récemment utilisé
+        self._entries: "OrderedDict[str, Tuple[float, List[dict]]]" = OrderedDict()
+
+    def _redis_key(self, key: str) -> str:
+        return f"{self.prefix}:search:{hashlib.sha1(key.encode('utf-8')).hexdigest()}"
+
+    async def get(self, key: str) -> Optional[List[dict]]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                return entry[1]
+            del self._entries[key]
+
+        if self.redis is not None:
+            try:
+                data = await self.redis.get(self._redis_key(key))
+            except Exception as e:
+                logger.warning(f"Cache de recherche Redis indisponible: {str(e)}")
+                return None
+            if data is not None:
+                results = decode_json(data)
+                self._store(key, results)
+                return results
+        return None
+
+    async def set(self, key: str, results: List[dict]):
+        self._store(key, results)
+        if self.redis is not None:
+            try:
+                await self.redis.set(self._redis_key(key), encode_json(results), ex=int(self.ttl))
+            except Exception as e:
+                logger.warning(f"Cache de recherche Redis indisponible: {str(e)}")
+
+    def _store(self, key: str, results: List[dict]):
+        self._entries[key] = (time.monotonic() + self.ttl, results)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def close(self):
+        if self.redis is not None:
+            await self.redis.aclose()
+
+
+class YoutubeSearchService:
+    """
+    Recherches YouTube sans bloquer la boucle d'événements : l'extraction s'exécute
+    dans un pool de threads borné, les résultats sont mis en cache par requête
+    normalisée et les recherches identiques simultanées ne font qu'une extraction.
+    """
+
+    def __init__(self, extractor: Optional[Extractor] = None, cache: Optional[SearchCache] = None,
+                 workers: int = YOUTUBE_SEARCH_WORKERS):
+        self.extractor = extractor or YtDlpExtractor()
+        self.cache = cache if cache is not None else SearchCache()
+        self.workers = workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # Extractions en cours {clé: future}, partagées par les requêtes identiques
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._stats = {"hits": 0, "misses": 0, "coalesced": 0, "errors": 0}
+        self._latencies: deque = deque(maxlen=LATENCY_SAMPLES)
+
+    def set_extractor(self, extractor: Extractor):
+        """Remplace l'extracteur (par exemple par un bouchon local pour les tests) et vide le cache."""
+        self.extractor = extractor
+        self.cache.clear()
+
+    async def search(self, query: str, max_results: int = 5) -> List[dict]:
+        """Résultats de la recherche, depuis le cache ou par une nouvelle extraction."""
+        key = f"{max_results}:{normalize_query(query)}"
+
+        future = self._inflight.get(key)
+        if future is not None:
+            self._stats["coalesced"] += 1
+            return await asyncio.shield(future)
+
+        # Enregistrée avant toute attente, pour que les requêtes identiques s'y joignent
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            results = await self.cache.get(key)
+            if results is not None:
+                self._stats["hits"] += 1
+            else:
+                self._stats["misses"] += 1
+                results = await self._extract(normalize_query(query), max_results)
+                await self.cache.set(key, results)
+            future.set_result(results)
+            return results
+        except Exception as e:
+            self._stats["errors"] += 1
+            future.set_exception(e)
+            # L'erreur est remontée à chaque appelant : éviter l'avertissement « never retrieved »
+            future.exception()
+            raise
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        finally:
+            del self._inflight[key]
+
+    async def _extract(self, query: str, max_results: int) -> List[dict]:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="youtube-search")
+        started = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self._executor, self.extractor, query, max_results
+            )
+        finally:
+            self._latencies.append(time.perf_counter() - started)
+
+    def metrics(self) -> dict:
+        """Statistiques du cache : taux de succès et durée des extractions (en millisecondes)."""
+        lookups = self._stats["hits"] + self._stats["misses"] + self._stats["coalesced"]
+        latencies = sorted(self._latencies)
+        return dict(
+            self._stats,
+            hit_rate=round((self._stats["hits"] + self._stats["coalesced"]) / lookups, 4) if lookups else 0.0,
+            inflight=len(self._inflight),
+            cached=len(self.cache),
+            extraction_ms={
+                "count": len(latencies),
+                "avg": round(sum(latencies) / len(latencies) * 1000, 1) if latencies else 0.0,
+                "p50": _percentile(latencies, 0.5),
+                "p95": _percentile(latencies, 0.95),
+            },
+        )
+
+    async def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        await self.cache.close()
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    """Percentile (en millisecondes) de durées triées en secondes."""
+    if not values:
+        return 0.0
+    return round(values[min(len(values) - 1, int(len(values) * fraction))] * 1000, 1)
+
+
+def create_search_service(kind: str = YOUTUBE_SEARCH_CACHE) -> YoutubeSearchService:
+    """Instancie le service de recherche avec le cache configuré par YOUTUBE_SEARCH_CACHE."""
+    redis_client = None
+    if kind == "redis":
+        import redis.asyncio as redis
+
+        redis_client = redis.from_url(REDIS_URL)
+    elif kind != "memory":
+        logger.warning(f"Cache de recherche inconnu '{kind}', utilisation du cache en mémoire")
+    return YoutubeSearchService(cache=SearchCache(redis=redis_client))
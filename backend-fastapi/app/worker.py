@@ -15,6 +15,9 @@ celery_app = Celery(
 celery_app.conf.task_routes = {
     "app.worker.download_music": "music-queue",
     "app.worker.process_audio": "audio-queue",
+    "app.worker.process_covers": "audio-queue",
+    "app.worker.analyze_loudness": "audio-queue",
+    "app.worker.generate_waveforms": "audio-queue",
 }
 
 # Chemins de stockage
@@ -80,37 +83,35 @@ def download_music(self, source_url, user_id):
 @celery_app.task(bind=True, name="app.worker.process_audio")
 def process_audio(self, file_path, options=None):
     """
-    Traite un fichier audio (conversion, normalisation, etc.).
+    Traite un fichier audio (mesure de la sonie, conversion).
+    La normalisation ne réencode pas le fichier : la sonie est seulement mesurée,
+    le gain de lecture en découle (voir app.services.loudness).
     """
+    from app.services.loudness import measure_loudness, playback_gain
+
     logging.info(f"Traitement du fichier audio {file_path}")
     
     if not options:
         options = {}
     
     try:
-        # Exemple de traitement avec ffmpeg
-        output_file = file_path.replace(".mp3", "_processed.mp3")
-        
-        # Construire la commande ffmpeg en fonction des options
-        cmd = ['ffmpeg', '-i', file_path]
+        result = {
+            "status": "success",
+            "input_file": file_path,
+        }
         
-        # Ajouter des options de traitement
         if options.get('normalize', False):
-            cmd.extend(['-filter:a', 'loudnorm'])
+            loudness = measure_loudness(Path(file_path))
+            result.update(loudness, playback_gain=playback_gain(loudness["loudness_integrated"], loudness["loudness_true_peak"]))
         
+        # Seule une conversion de débit produit un nouveau fichier
         if options.get('bitrate'):
-            cmd.extend(['-b:a', options['bitrate']])
-        
-        cmd.append(output_file)
+            output_file = file_path.replace(".mp3", "_processed.mp3")
+            cmd = ['ffmpeg', '-i', file_path, '-b:a', options['bitrate'], output_file]
+            subprocess.run(cmd, check=True, capture_output=True)
+            result["output_file"] = output_file
         
-        # Exécuter la commande
-        subprocess.run(cmd, check=True, capture_output=True)
-        
-        return {
-            "status": "success",
-            "input_file": file_path,
-            "output_file": output_file
-        }
+        return result
     
     except Exception as e:
         logging.error(f"Erreur lors du traitement audio: {str(e)}")
@@ -118,4 +119,47 @@ def process_audio(self, file_path, options=None):
             "status": "error",
             "error": str(e),
             "file_path": file_path
-        } 
\ No newline at end of file
+        }
+
+@celery_app.task(bind=True, name="app.worker.analyze_loudness")
+def analyze_loudness(self, music_id=None):
+    """
+    Mesure la sonie d'une musique, ou de toutes celles qui n'ont pas encore été mesurées.
+    """
+    from app.services.loudness import measure_music_loudness, backfill_loudness
+
+    try:
+        if music_id is not None:
+            return {"status": "success", "measured": int(measure_music_loudness(music_id))}
+        return {"status": "success", "measured": backfill_loudness()}
+    except Exception as e:
+        logging.error(f"Erreur lors de la mesure de la sonie: {str(e)}")
+        return {"status": "error", "error": str(e)}
+
+@celery_app.task(bind=True, name="app.worker.process_covers")
+def process_covers(self):
+    """
+    Génère les miniatures et la palette des covers enregistrées avant le pipeline de covers.
+    """
+    from app.services.covers import backfill_covers
+
+    try:
+        return {"status": "success", "processed": backfill_covers()}
+    except Exception as e:
+        logging.error(f"Erreur lors du traitement des covers: {str(e)}")
+        return {"status": "error", "error": str(e)}
+
+@celery_app.task(bind=True, name="app.worker.generate_waveforms")
+def generate_waveforms(self, music_id=None):
+    """
+    Génère la forme d'onde (pics min/max) d'une musique, ou de toutes celles qui n'en ont pas encore.
+    """
+    from app.services.waveform import backfill_peaks, generate_music_peaks
+
+    try:
+        if music_id is not None:
+            return {"status": "success", "generated": int(generate_music_peaks(music_id))}
+        return {"status": "success", "generated": backfill_peaks()}
+    except Exception as e:
+        logging.error(f"Erreur lors de la génération des formes d'onde: {str(e)}")
+        return {"status": "error", "error": str(e)}
@@ -0,0 +1 @@
+# Bancs d'essai 
\ No newline at end of file
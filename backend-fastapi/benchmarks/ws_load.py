@@ -0,0 +1,456 @@
+"""
+Banc d'essai de charge des WebSockets de salles.
+
+Lance l'API dans ce processus (uvicorn dans un thread, base SQLite temporaire,
+backplane en mémoire, sans instantanés), ouvre N salles × M clients simulés
+dans des processus séparés, rejoue un mélange de trafic réaliste puis affiche :
+débit, latences de diffusion (p50/p90/p99/max), mémoire par connexion
+et temps CPU du serveur par message.
+
+Aucun service externe n'est nécessaire. Depuis backend-fastapi/ :
+
+    python -m benchmarks.ws_load --rooms 10 --clients 50 --duration 20
+    python -m benchmarks.ws_load --scenario scrub --binary --batch --max-p99-ms 50
+
+Scénarios :
+    mix      mélange de tous les trafics ci-dessous (défaut)
+    join     arrivées et départs en rafale (reconnexions)
+    control  play / pause / track_change
+    scrub    seek et playback_update à haute fréquence
+    chat     messages de chat (API REST puis diffusion WebSocket)
+    queue    opérations sur la file d'attente (queue_op)
+
+Le code de sortie vaut 1 si un seuil (--max-p99-ms, --max-cpu-us) est dépassé,
+ce qui permet de s'en servir comme garde-fou contre les régressions.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+# Poids des types de trafic pour chaque scénario
+SCENARIOS = {
+    "mix": {"playback_update": 40, "seek": 15, "control": 10, "queue": 10, "chat": 5, "join": 5},
+    "join": {"join": 1},
+    "control": {"control": 1},
+    "scrub": {"seek": 1, "playback_update": 2},
+    "chat": {"chat": 1},
+    "queue": {"queue": 1},
+}
+
+
+def _raise_fd_limit():
+    # Chaque connexion consomme un descripteur de fichier de chaque côté
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def _rss_bytes() -> int:
+    """Mémoire résidente de ce processus."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _percentile(values, q: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+# --------------------------------------------------------------------------
+# Serveur (processus principal)
+# --------------------------------------------------------------------------
+
+def _prepare_environment(args):
+    """Configure l'application avant son import : base temporaire, aucun service externe."""
+    if not args.database_url:
+        args.database_url = f"sqlite:///{tempfile.mkdtemp(prefix='ws_load_')}/bench.db"
+    os.environ["DATABASE_URL"] = args.database_url
+    os.environ.setdefault("ROOM_BACKPLANE", "memory")
+    os.environ.setdefault("ROOM_SNAPSHOT_STORE", "none")
+
+
+def _build_app():
+    """Application minimale : les routes de l'API, sans le stockage ni les fichiers statiques de app.main."""
+    from fastapi import FastAPI
+    from app.api.routes import router
+    from app.db.database import Base, engine
+
+    Base.metadata.create_all(bind=engine)
+    app = FastAPI()
+    app.include_router(router, prefix="/api")
+    return app
+
+
+def _seed(rooms: int, clients: int):
+    """Crée les salles et les utilisateurs ; retourne [(room_id, room_code, [user_ids])]."""
+    from app.db.database import SessionLocal
+    from app.models import Room as RoomModel, User as UserModel
+
+    suffix = int(time.time())
+    db = SessionLocal()
+    try:
+        seeded = []
+        for r in range(rooms):
+            users = [
+                UserModel(username=f"bench{suffix}_{r}_{c}", email=f"bench{suffix}_{r}_{c}@bench.local", password="x")
+                for c in range(clients)
+            ]
+            db.add_all(users)
+            room = RoomModel(room_code=f"B{suffix % 100000:05d}{r:04d}", name=f"Bench {r}")
+            db.add(room)
+            db.flush()
+            seeded.append((room.id, room.room_code, [user.id for user in users]))
+        db.commit()
+        return seeded
+    finally:
+        db.close()
+
+
+def _start_server(app, args):
+    import uvicorn
+
+    config = uvicorn.Config(app, host="127.0.0.1", port=args.port, log_level="error", ws=args.ws, lifespan="off")
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError("Le serveur uvicorn n'a pas démarré")
+        time.sleep(0.05)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    return server, thread, port
+
+
+# --------------------------------------------------------------------------
+# Clients simulés (processus séparés)
+# --------------------------------------------------------------------------
+
+class _Client:
+    def __init__(self, worker, room, user_id):
+        self.worker = worker
+        self.room = room
+        self.user_id = user_id
+        self.ws = None
+        self.reader = None
+
+    async def connect(self):
+        import websockets
+
+        options = {"ping_interval": None, "max_size": None}
+        if self.worker.binary:
+            from app.services.binary_protocol import BINARY_SUBPROTOCOL
+            options["subprotocols"] = [BINARY_SUBPROTOCOL]
+        query = f"?queue_deltas=true&batch={'true' if self.worker.batch else 'false'}"
+        started = time.perf_counter()
+        self.ws = await websockets.connect(f"{self.worker.base_ws}/api/rooms/ws/{self.room[1]}/{self.user_id}{query}", **options)
+        # Jusqu'au premier message : poignée de main et état initial de la salle
+        self.worker.on_frame(await self.ws.recv())
+        self.worker.connect_times.append(time.perf_counter() - started)
+        self.reader = asyncio.create_task(self._read())
+
+    async def _read(self):
+        try:
+            async for frame in self.ws:
+                self.worker.on_frame(frame)
+        except Exception:
+            pass
+
+    async def send(self, message: dict):
+        if self.worker.binary:
+            from app.services.binary_protocol import encode_binary
+            await self.ws.send(encode_binary(message))
+        else:
+            await self.ws.send(json.dumps(message))
+
+    async def close(self):
+        if self.reader:
+            self.reader.cancel()
+        if self.ws:
+            await self.ws.close()
+
+
+class _Worker:
+    def __init__(self, args, port, rooms):
+        self.args = args
+        self.binary = args.binary
+        self.batch = args.batch
+        self.base_ws = f"ws://127.0.0.1:{port}"
+        self.base_http = f"http://127.0.0.1:{port}"
+        self.rooms = rooms
+        self.weights = SCENARIOS[args.scenario]
+        self.sent = {}
+        self.sent_count = {}
+        self.latencies = {}
+        self.connect_times = []
+        self.frames = 0
+        self.bytes = 0
+        self.messages = 0
+        self.errors = 0
+        self._ids = itertools.count()
+
+    def on_frame(self, frame):
+        now = time.perf_counter()
+        self.frames += 1
+        self.bytes += len(frame)
+        if isinstance(frame, bytes):
+            from app.services.binary_protocol import decode_binary
+            message = decode_binary(frame)
+        else:
+            message = json.loads(frame)
+        items = message["messages"] if message.get("type") == "batch" else [message]
+        for item in items:
+            self.messages += 1
+            bench_id = item.get("bench_id") or item.get("client_id")
+            if item.get("type") == "chat_message":
+                bench_id = str(item.get("message", {}).get("message", ""))
+            entry = self.sent.get(bench_id)
+            if entry:
+                self.latencies.setdefault(entry[0], []).append(now - entry[1])
+
+    def _stamp(self, kind: str) -> str:
+        bench_id = f"b{os.getpid()}_{next(self._ids)}"
+        self.sent[bench_id] = (kind, time.perf_counter())
+        self.sent_count[kind] = self.sent_count.get(kind, 0) + 1
+        return bench_id
+
+    async def _emit(self, room, clients, kind: str):
+        client = random.choice(clients)
+        if kind == "join":
+            # Départ puis retour immédiat d'un auditeur
+            await client.close()
+            index = clients.index(client)
+            clients[index] = _Client(self, room, client.user_id)
+            self.sent_count["join"] = self.sent_count.get("join", 0) + 1
+            await clients[index].connect()
+            return
+        if kind == "chat":
+            bench_id = self._stamp("chat")
+            body = json.dumps({"room_id": room[0], "user_id": client.user_id, "message": bench_id}).encode()
+            request = urllib.request.Request(
+                f"{self.base_http}/api/chat/", data=body, headers={"Content-Type": "application/json"}
+            )
+            await asyncio.to_thread(urllib.request.urlopen, request)
+            return
+
+        bench_id = self._stamp(kind)
+        position = random.uniform(0, 200)
+        if kind == "control":
+            message = {"type": random.choice(["play", "pause", "track_change"]), "position": position, "trackId": 1}
+        elif kind == "queue":
+            message = {"type": "queue_op", "client_id": bench_id, "op": {
+                "op": "insert", "item": {"id": bench_id, "music_id": random.randint(1, 1000)}
+            }}
+        else:
+            message = {"type": kind, "position": position, "isPlaying": True, "trackId": 1}
+        message["bench_id"] = bench_id
+        await client.send(message)
+
+    async def _drive(self, room, clients, deadline):
+        kinds = list(self.weights)
+        weights = [self.weights[k] for k in kinds]
+        interval = 1.0 / self.args.rate
+        next_at = time.perf_counter()
+        while time.perf_counter() < deadline:
+            try:
+                await self._emit(room, clients, random.choices(kinds, weights)[0])
+            except Exception:
+                self.errors += 1
+            next_at += interval
+            await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+
+    async def run(self, connected, go, results):
+        all_clients = []
+        # Arrivée de tous les auditeurs en même temps
+        for room in self.rooms:
+            clients = [_Client(self, room, user_id) for user_id in room[2]]
+            all_clients.append((room, clients))
+        outcomes = await asyncio.gather(
+            *(client.connect() for _, clients in all_clients for client in clients), return_exceptions=True
+        )
+        self.errors += sum(1 for outcome in outcomes if isinstance(outcome, Exception))
+        connected.set()
+        await asyncio.to_thread(go.wait)
+
+        deadline = time.perf_counter() + self.args.duration
+        await asyncio.gather(*(self._drive(room, clients, deadline) for room, clients in all_clients))
+        # Laisser arriver les derniers messages
+        await asyncio.sleep(self.args.drain)
+        await asyncio.gather(*(client.close() for _, clients in all_clients for client in clients),
+                             return_exceptions=True)
+        results.put({
+            "connect_times": self.connect_times,
+            "latencies": self.latencies,
+            "sent": self.sent_count,
+            "frames": self.frames,
+            "bytes": self.bytes,
+            "messages": self.messages,
+            "errors": self.errors,
+        })
+
+
+def _client_worker(args, port, rooms, connected, go, results):
+    _raise_fd_limit()
+    asyncio.run(_Worker(args, port, rooms).run(connected, go, results))
+
+
+# --------------------------------------------------------------------------
+# Rapport
+# --------------------------------------------------------------------------
+
+def _report(args, reports, connections, rss_per_connection, cpu_seconds):
+    sent = {}
+    latencies = {}
+    for report in reports:
+        for kind, count in report["sent"].items():
+            sent[kind] = sent.get(kind, 0) + count
+        for kind, values in report["latencies"].items():
+            latencies.setdefault(kind, []).extend(values)
+    connect_times = [t for report in reports for t in report["connect_times"]]
+    all_latencies = [v for values in latencies.values() for v in values]
+    total_sent = sum(sent.values())
+    delivered = sum(report["messages"] for report in reports)
+    frames = sum(report["frames"] for report in reports)
+
+    summary = {
+        "scenario": args.scenario,
+        "rooms": args.rooms,
+        "clients_per_room": args.clients,
+        "connections": connections,
+        "binary": args.binary,
+        "batch": args.batch,
+        "duration_s": args.duration,
+        "sent": sent,
+        "sent_per_s": total_sent / args.duration,
+        "delivered_per_s": delivered / args.duration,
+        "frames_per_s": frames / args.duration,
+        "bytes_per_frame": sum(r["bytes"] for r in reports) / frames if frames else 0,
+        "errors": sum(report["errors"] for report in reports),
+        "connect_ms": {
+            "p50": _percentile(connect_times, 0.5) * 1000,
+            "p99": _percentile(connect_times, 0.99) * 1000,
+        },
+        "latency_ms": {
+            kind: {
+                "count": len(values),
+                "p50": _percentile(values, 0.5) * 1000,
+                "p90": _percentile(values, 0.9) * 1000,
+                "p99": _percentile(values, 0.99) * 1000,
+                "max": max(values) * 1000,
+            }
+            for kind, values in sorted(latencies.items())
+        },
+        "latency_p99_ms": _percentile(all_latencies, 0.99) * 1000,
+        "latency_mean_ms": statistics.fmean(all_latencies) * 1000 if all_latencies else float("nan"),
+        "memory_per_connection_kb": rss_per_connection / 1024,
+        "server_cpu_s": cpu_seconds,
+        "cpu_us_per_message": cpu_seconds / total_sent * 1e6 if total_sent else float("nan"),
+        "cpu_us_per_delivery": cpu_seconds / delivered * 1e6 if delivered else float("nan"),
+    }
+
+    print(f"\nScénario {args.scenario} : {args.rooms} salles × {args.clients} clients "
+          f"({connections} connexions, {'msgpack' if args.binary else 'json'}{', lots' if args.batch else ''})")
+    print(f"  Connexion           p50 {summary['connect_ms']['p50']:.1f} ms   p99 {summary['connect_ms']['p99']:.1f} ms")
+    print(f"  Envoyés             {total_sent} ({summary['sent_per_s']:.0f}/s)  {sent}")
+    print(f"  Livrés              {delivered} messages ({summary['delivered_per_s']:.0f}/s) "
+          f"en {frames} frames de {summary['bytes_per_frame']:.0f} octets en moyenne")
+    print(f"  Latence de diffusion (ms)")
+    for kind, stats in summary["latency_ms"].items():
+        print(f"    {kind:<16} n={stats['count']:<7} p50 {stats['p50']:7.2f}  p90 {stats['p90']:7.2f}  "
+              f"p99 {stats['p99']:7.2f}  max {stats['max']:7.2f}")
+    print(f"  Mémoire serveur     {summary['memory_per_connection_kb']:.1f} Kio par connexion")
+    print(f"  CPU serveur         {cpu_seconds:.2f} s, {summary['cpu_us_per_message']:.0f} µs par message envoyé, "
+          f"{summary['cpu_us_per_delivery']:.1f} µs par message livré")
+    if summary["errors"]:
+        print(f"  Erreurs             {summary['errors']}")
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Banc d'essai de charge des WebSockets de salles")
+    parser.add_argument("--rooms", type=int, default=10, help="nombre de salles")
+    parser.add_argument("--clients", type=int, default=20, help="clients par salle")
+    parser.add_argument("--duration", type=float, default=10, help="durée du trafic en secondes")
+    parser.add_argument("--rate", type=float, default=20, help="messages par seconde et par salle")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="mix")
+    parser.add_argument("--binary", action="store_true", help="sous-protocole MessagePack")
+    parser.add_argument("--batch", action="store_true", help="clients acceptant les lots (?batch=true)")
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1), help="processus clients")
+    parser.add_argument("--drain", type=float, default=1.0, help="attente des derniers messages en secondes")
+    parser.add_argument("--port", type=int, default=0, help="port du serveur (0 : port libre)")
+    parser.add_argument("--ws", default="auto", help="implémentation WebSocket d'uvicorn")
+    parser.add_argument("--database-url", default=None, help="base de données (défaut : SQLite temporaire)")
+    parser.add_argument("--json", dest="json_output", default=None, help="écrire le rapport JSON dans ce fichier")
+    parser.add_argument("--max-p99-ms", type=float, default=None, help="seuil de latence p99 (échec au-delà)")
+    parser.add_argument("--max-cpu-us", type=float, default=None, help="seuil de CPU par message envoyé")
+    args = parser.parse_args(argv)
+
+    _raise_fd_limit()
+    _prepare_environment(args)
+    import logging
+    logging.disable(logging.WARNING)
+
+    app = _build_app()
+    rooms = _seed(args.rooms, args.clients)
+    server, thread, port = _start_server(app, args)
+
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    go = context.Event()
+    workers = []
+    shares = [rooms[i::args.workers] for i in range(args.workers)]
+    rss_before = _rss_bytes()
+    for share in filter(None, shares):
+        connected = context.Event()
+        process = context.Process(target=_client_worker, args=(args, port, share, connected, go, results))
+        process.start()
+        workers.append((process, connected))
+    for _, connected in workers:
+        connected.wait()
+    time.sleep(0.5)
+    connections = args.rooms * args.clients
+    rss_per_connection = max(0, _rss_bytes() - rss_before) / max(1, connections)
+
+    cpu_before = time.process_time()
+    go.set()
+    reports = [results.get() for _ in workers]
+    cpu_seconds = time.process_time() - cpu_before
+    for process, _ in workers:
+        process.join()
+
+    server.should_exit = True
+    thread.join(timeout=5)
+
+    summary = _report(args, reports, connections, rss_per_connection, cpu_seconds)
+    if args.json_output:
+        with open(args.json_output, "w") as f:
+            json.dump(summary, f, indent=2)
+
+    failed = False
+    if args.max_p99_ms is not None and not summary["latency_p99_ms"] <= args.max_p99_ms:
+        print(f"ÉCHEC : latence p99 {summary['latency_p99_ms']:.2f} ms > {args.max_p99_ms} ms")
+        failed = True
+    if args.max_cpu_us is not None and not summary["cpu_us_per_message"] <= args.max_cpu_us:
+        print(f"ÉCHEC : {summary['cpu_us_per_message']:.0f} µs de CPU par message > {args.max_cpu_us} µs")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,6 +3,17 @@ import axios, { AxiosError } from 'axios';
 
 const API_URL = import.meta.env.VITE_API_URL || 'http://localhost:8000';
 
+// URL de la cover d'une musique, dans la miniature la plus proche de `size` pixels
+// si elle a été générée par le serveur (dossier /storage/covers/), sinon l'image d'origine
+export function coverUrl(coverPath: string | null | undefined, size?: number): string | null {
+  if (!coverPath) return null;
+  if (size && coverPath.startsWith('/storage/covers/')) {
+    const thumbnail = [128, 320, 640].find((side) => side >= size) ?? 640;
+    return `${API_URL}${coverPath.replace(/cover\.jpg$/, `${thumbnail}.webp`)}`;
+  }
+  return `${API_URL}${coverPath}`;
+}
+
 export const useMusicStore = defineStore('music', {
   state: () => ({
     currentTrack: null as any,
@@ -49,12 +60,43 @@ export const useMusicStore = defineStore('music', {
       }
     },
     
+    // Rechercher à la fois dans la bibliothèque et sur YouTube : onResults est appelé
+    // pour chaque bloc de résultats reçu ("local" tout de suite, "youtube" ensuite)
+    async searchAll(query: string, onResults: (source: string, results: any[]) => void) {
+      const response = await fetch(`${API_URL}/api/music/search/all?query=${encodeURIComponent(query)}`);
+      if (!response.ok || !response.body) {
+        throw new Error(`Erreur lors de la recherche: ${response.status}`);
+      }
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        // Une ligne JSON par bloc de résultats
+        let newline;
+        while ((newline = buffer.indexOf('\n')) >= 0) {
+          const line = buffer.slice(0, newline).trim();
+          buffer = buffer.slice(newline + 1);
+          if (line) {
+            const chunk = JSON.parse(line);
+            onResults(chunk.source, chunk.results);
+          }
+        }
+      }
+    },
+    
     // Télécharger une musique depuis une URL
-    async uploadMusic(data: { source_url: string }) {
+    async uploadMusic(data: { source_url: string, room_code?: string }) {
       try {
         console.log('Téléchargement de musique depuis URL:', data.source_url);
         const response = await axios.post(`${API_URL}/api/music/upload`, data);
         console.log('Réponse du téléchargement:', response.data);
+        // Le téléchargement se poursuit en arrière-plan : attendre la fin de la tâche
+        if (response.data.job_id) {
+          return await this.waitForDownload(response.data.job_id);
+        }
         return response.data;
       } catch (error) {
         console.error('Erreur détaillée lors du téléchargement de la musique:', error);
@@ -62,6 +104,21 @@ export const useMusicStore = defineStore('music', {
       }
     },
     
+    // Attendre la fin d'un téléchargement en arrière-plan
+    async waitForDownload(jobId: string) {
+      while (true) {
+        const response = await axios.get(`${API_URL}/api/music/jobs/${jobId}`);
+        const job = response.data;
+        if (job.status === 'done') {
+          return { message: 'Téléchargement réussi', music_id: job.music_id };
+        }
+        if (job.status === 'error') {
+          throw new Error(job.error || 'Erreur lors du téléchargement');
+        }
+        await new Promise(resolve => setTimeout(resolve, 1000));
+      }
+    },
+    
     // Télécharger une musique depuis un fichier local
     async uploadMusicFile(file: File) {
       try {
@@ -93,6 +150,19 @@ export const useMusicStore = defineStore('music', {
       }
     },
     
+    // Forme d'onde d'une musique : `count` paires min/max (int8), null si elle n'est pas encore générée
+    async getPeaks(musicId: number, count = 1024) {
+      try {
+        const response = await axios.get(`${API_URL}/api/music/${musicId}/peaks`, {
+          params: { count, bits: 8 },
+          responseType: 'arraybuffer'
+        });
+        return new Int8Array(response.data);
+      } catch (error) {
+        return null;
+      }
+    },
+    
     // Mettre à jour la piste actuelle
     setCurrentTrack(track: any) {
       console.log('Mise à jour de la piste actuelle:', track);